@@ -7,81 +7,1405 @@
 
 #else
 
-static unsigned char g_tls[0x100];
+#include <stdarg.h>
+#include <stdint.h>
+#include <string.h>
+#include <time.h>
+
+typedef uint8_t  u8;
+typedef uint16_t u16;
+typedef uint32_t u32;
+typedef uint64_t u64;
+typedef int32_t  s32;
+typedef int64_t  s64;
+
+typedef u32 Handle;
+typedef u32 Result;
+
+/* Every thread has its own message buffer, as on the Switch */
+static _Thread_local unsigned char g_tls[0x100];
+
+static void *armGetTls(void) {
+    return g_tls;
+}
+
+/* Ticks are nanoseconds of the monotonic clock on the host */
+static u64 armGetSystemTick(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+
+    return (u64) ts.tv_sec * 1000000000 + (u64) ts.tv_nsec;
+}
+
+static u64 armGetSystemTickFreq(void) {
+    return 1000000000;
+}
+
+static u64 svcGetSystemTick(void) {
+    return armGetSystemTick();
+}
+
+static Handle g_next_handle = 0x1000;
+static int g_wait_cancelled = 0;
+
+/*
+ * A simulated kernel installed with hostSetKernel, e.g. nx.sim.Kernel.
+ * The svcs below forward to its methods when it's set, otherwise
+ * requests are echoed back without a server to measure the client alone.
+ */
+static PyObject *g_kernel = NULL;
+
+/* Returned when the simulated kernel raises */
+#define NX_HOST_KERNEL_ERROR 0x4201
+
+/* Calls a method on the kernel, which returns either rc or (rc, *outs) */
+static Result nx_host_vcall(u64 *outs, int num_outs, const char *method, const char *format, va_list va) {
+    PyGILState_STATE gil = PyGILState_Ensure();
+
+    PyObject *kernel = g_kernel;
+    Result rc = NX_HOST_KERNEL_ERROR;
+
+    if (kernel == NULL)
+        goto done;
+
+    Py_INCREF(kernel);
+
+    PyObject *args = Py_VaBuildValue(format, va);
+
+    PyObject *ret = NULL;
+
+    if (args != NULL) {
+        PyObject *func = PyObject_GetAttrString(kernel, method);
+
+        if (func != NULL) {
+            ret = PyObject_CallObject(func, args);
+            Py_DECREF(func);
+        }
+
+        Py_DECREF(args);
+    }
+
+    if (ret != NULL) {
+        if (PyTuple_Check(ret)) {
+            if (PyTuple_GET_SIZE(ret) != num_outs + 1) {
+                PyErr_Format(PyExc_ValueError, "%s returned %zd values, expected %d",
+                    method, PyTuple_GET_SIZE(ret), num_outs + 1);
+            } else {
+                rc = (Result) PyLong_AsUnsignedLongMask(PyTuple_GET_ITEM(ret, 0));
+
+                for (int i = 0; i < num_outs; i++)
+                    outs[i] = PyLong_AsUnsignedLongLongMask(PyTuple_GET_ITEM(ret, i + 1));
+            }
+        } else {
+            rc = (Result) PyLong_AsUnsignedLongMask(ret);
+        }
+
+        Py_DECREF(ret);
+    }
+
+    if (PyErr_Occurred()) {
+        PyErr_WriteUnraisable(kernel);
+        rc = NX_HOST_KERNEL_ERROR;
+    }
+
+    Py_DECREF(kernel);
+
+done:
+    PyGILState_Release(gil);
+    return rc;
+}
+
+#define NX_HOST_MAX_OUTS 4
+
+static Result nx_host_call(u32 *outs, int num_outs, const char *method, const char *format, ...) {
+    u64 wide[NX_HOST_MAX_OUTS];
+
+    /* Outs the kernel doesn't return keep their values */
+    for (int i = 0; i < num_outs; i++)
+        wide[i] = outs[i];
+
+    va_list va;
+    va_start(va, format);
+    Result rc = nx_host_vcall(wide, num_outs, method, format, va);
+    va_end(va);
+
+    for (int i = 0; i < num_outs; i++)
+        outs[i] = (u32) wide[i];
+
+    return rc;
+}
+
+/* For outs that are addresses */
+static Result nx_host_call64(u64 *outs, int num_outs, const char *method, const char *format, ...) {
+    va_list va;
+    va_start(va, format);
+    Result rc = nx_host_vcall(outs, num_outs, method, format, va);
+    va_end(va);
+
+    return rc;
+}
+
+typedef struct {
+    void *ptr;
+    size_t size;
+} NxHostMemory;
+
+/* For "O&", so the view is only created once the GIL is held */
+static PyObject *nx_host_memory_view(void *arg) {
+    NxHostMemory *mem = arg;
+
+    return PyMemoryView_FromMemory(mem->ptr, (Py_ssize_t) mem->size, PyBUF_WRITE);
+}
+
+typedef struct {
+    const Handle *handles;
+    s32 count;
+} NxHostHandles;
+
+static PyObject *nx_host_handle_list(void *arg) {
+    NxHostHandles *h = arg;
+
+    PyObject *list = PyList_New(h->count);
+    if (list == NULL)
+        return NULL;
+
+    for (s32 i = 0; i < h->count; i++) {
+        PyObject *item = PyLong_FromUnsignedLong(h->handles[i]);
+        if (item == NULL) {
+            Py_DECREF(list);
+            return NULL;
+        }
+
+        PyList_SET_ITEM(list, i, item);
+    }
+
+    return list;
+}
+
+/*
+ * Echo the request's data words back as the response,
+ * dropping any handles and descriptors
+ */
+static void nx_host_echo(u8 *msg, size_t size) {
+    u32 hdr0, hdr1;
+    memcpy(&hdr0, msg, sizeof(hdr0));
+    memcpy(&hdr1, msg + 4, sizeof(hdr1));
+
+    size_t num_data_words = hdr1 & 0x3ff;
+    size_t offset = 8;
+
+    if (hdr1 >> 31) {
+        u32 sp_hdr;
+        memcpy(&sp_hdr, msg + offset, sizeof(sp_hdr));
+        offset += 4;
+
+        if (sp_hdr & 1)
+            offset += 8;
+
+        offset += 4 * (((sp_hdr >> 1) & 0xf) + ((sp_hdr >> 5) & 0xf));
+    }
+
+    offset += 8 * ((hdr0 >> 16) & 0xf);
+    offset += 12 * (((hdr0 >> 20) & 0xf) + ((hdr0 >> 24) & 0xf) + ((hdr0 >> 28) & 0xf));
+
+    size_t data = (offset + 15) & ~15;
+    size_t end = offset + 4 * num_data_words;
+
+    if (end > size || data > end)
+        return;
+
+    memmove(msg + 16, msg + data, end - data);
+
+    hdr0 = 0;
+    hdr1 = num_data_words;
+    memcpy(msg, &hdr0, sizeof(hdr0));
+    memcpy(msg + 4, &hdr1, sizeof(hdr1));
+
+    for (size_t i = 16; i + 4 <= 16 + (end - data); i++) {
+        if (memcmp(msg + i, "SFCI", 4) == 0)
+            memcpy(msg + i, "SFCO", 4);
+    }
+}
+
+static Result svcSendSyncRequest(Handle session) {
+    if (g_kernel != NULL) {
+        NxHostMemory msg = {g_tls, sizeof(g_tls)};
+
+        return nx_host_call(NULL, 0, "send_sync_request", "(IO&)", session, nx_host_memory_view, &msg);
+    }
+
+    nx_host_echo(g_tls, sizeof(g_tls));
+
+    return 0;
+}
+
+static Result svcConnectToNamedPort(Handle *handle, const char *name) {
+    if (g_kernel != NULL)
+        return nx_host_call(handle, 1, "connect_to_named_port", "(s)", name);
+
+    *handle = 1;
+    return 0;
+}
+
+static void svcSleepThread(s64 nano) {
+    if (nano <= 0)
+        return;
+
+    struct timespec ts = {
+        .tv_sec = nano / 1000000000,
+        .tv_nsec = nano % 1000000000,
+    };
+
+    nanosleep(&ts, NULL);
+}
+
+static Result svcSendAsyncRequestWithUserBuffer(Handle *handle, void *usrBuffer, u64 size, Handle session) {
+    if (g_kernel != NULL) {
+        NxHostMemory msg = {usrBuffer, size};
+
+        return nx_host_call(handle, 1, "send_async_request_with_user_buffer", "(IO&)",
+                    session, nx_host_memory_view, &msg);
+    }
+
+    /* The reply is written immediately, so the event is always signaled */
+    nx_host_echo(usrBuffer, size);
+    *handle = g_next_handle++;
+
+    return 0;
+}
+
+static Result svcWaitSynchronization(s32 *index, const Handle *handles, s32 handleCount, u64 timeout) {
+    if (g_kernel != NULL) {
+        NxHostHandles list = {handles, handleCount};
+
+        return nx_host_call((u32 *) index, 1, "wait_synchronization", "(O&L)",
+                    nx_host_handle_list, &list, (long long) timeout);
+    }
+
+    if (g_wait_cancelled) {
+        g_wait_cancelled = 0;
+        return 0xec01;
+    }
+
+    if (handleCount == 0)
+        return 0xea01;
+
+    *index = 0;
+    return 0;
+}
+
+static Result svcCancelSynchronization(Handle thread) {
+    if (g_kernel != NULL)
+        return nx_host_call(NULL, 0, "cancel_synchronization", "(I)", thread);
+
+    g_wait_cancelled = 1;
+
+    return 0;
+}
+
+static Result svcSetThreadCoreMask(Handle handle, s32 core_id, u32 affinity_mask) {
+    if (g_kernel != NULL)
+        return nx_host_call(NULL, 0, "set_thread_core_mask", "(IiI)", handle, core_id, affinity_mask);
+
+    return 0;
+}
+
+static Result svcCloseHandle(Handle handle) {
+    if (g_kernel != NULL)
+        return nx_host_call(NULL, 0, "close_handle", "(I)", handle);
+
+    return 0;
+}
+
+static Result svcReplyAndReceive(s32 *index, const Handle *handles, s32 handleCount, Handle replyTarget, u64 timeout) {
+    if (g_kernel != NULL) {
+        NxHostHandles list = {handles, handleCount};
+        NxHostMemory msg = {g_tls, sizeof(g_tls)};
+
+        return nx_host_call((u32 *) index, 1, "reply_and_receive", "(O&ILO&)",
+                    nx_host_handle_list, &list, replyTarget, (long long) timeout,
+                    nx_host_memory_view, &msg);
+    }
+
+    return 0xea01;
+}
+
+static Result svcAcceptSession(Handle *session_handle, Handle port_handle) {
+    if (g_kernel != NULL)
+        return nx_host_call(session_handle, 1, "accept_session", "(I)", port_handle);
+
+    return 0xe401;
+}
+
+static Result svcCreateSession(Handle *server_handle, Handle *client_handle, u32 unk0, u64 unk1) {
+    if (g_kernel != NULL) {
+        u32 handles[2] = {0};
+        Result rc = nx_host_call(handles, 2, "create_session", "()");
+
+        *server_handle = handles[0];
+        *client_handle = handles[1];
+
+        return rc;
+    }
+
+    *server_handle = g_next_handle++;
+    *client_handle = g_next_handle++;
+
+    return 0;
+}
+
+static Result svcCreateEvent(Handle *server_handle, Handle *client_handle) {
+    if (g_kernel != NULL) {
+        u32 handles[2] = {0};
+        Result rc = nx_host_call(handles, 2, "create_event", "()");
+
+        *server_handle = handles[0];
+        *client_handle = handles[1];
+
+        return rc;
+    }
+
+    *server_handle = g_next_handle++;
+    *client_handle = g_next_handle++;
+
+    return 0;
+}
+
+static Result svcSignalEvent(Handle handle) {
+    if (g_kernel != NULL)
+        return nx_host_call(NULL, 0, "signal_event", "(I)", handle);
+
+    return 0;
+}
+
+static Result svcClearEvent(Handle handle) {
+    if (g_kernel != NULL)
+        return nx_host_call(NULL, 0, "clear_event", "(I)", handle);
+
+    return 0;
+}
+
+static Result svcResetSignal(Handle handle) {
+    if (g_kernel != NULL)
+        return nx_host_call(NULL, 0, "reset_signal", "(I)", handle);
+
+    return 0;
+}
+
+/* Laid out like libnx's, only the fields used below matter */
+typedef struct {
+    Handle handle;
+    size_t size;
+    u32 perm;
+    void *map_addr;
+} SharedMemory;
+
+typedef struct {
+    Handle handle;
+    size_t size;
+    u32 perm;
+    void *src_addr;
+    void *map_addr;
+} TransferMemory;
+
+static Result svcCreateTransferMemory(Handle *out, void *addr, size_t size, u32 perm) {
+    if (g_kernel != NULL)
+        return nx_host_call(out, 1, "create_transfer_memory", "(KKI)",
+                    (unsigned long long) (uintptr_t) addr, (unsigned long long) size, perm);
+
+    *out = g_next_handle++;
+
+    return 0;
+}
+
+static Result svcCreateSharedMemory(Handle *out, size_t size, u32 local_perm, u32 other_perm) {
+    if (g_kernel != NULL)
+        return nx_host_call(out, 1, "create_shared_memory", "(KII)",
+                    (unsigned long long) size, local_perm, other_perm);
+
+    *out = g_next_handle++;
+
+    return 0;
+}
+
+/* The simulated kernel maps memory by returning an address in this process */
+static Result nx_host_map(const char *method, Handle handle, size_t size, u32 perm, void **map_addr) {
+    if (g_kernel == NULL)
+        return 0xe401;
+
+    u64 addr = 0;
+    Result rc = nx_host_call64(&addr, 1, method, "(IKI)", handle, (unsigned long long) size, perm);
+
+    if (rc == 0)
+        *map_addr = (void *) (uintptr_t) addr;
+
+    return rc;
+}
+
+static Result nx_host_unmap(const char *method, Handle handle, void **map_addr, size_t size) {
+    if (g_kernel == NULL)
+        return 0xe401;
+
+    Result rc = nx_host_call(NULL, 0, method, "(IKK)", handle,
+                    (unsigned long long) (uintptr_t) *map_addr, (unsigned long long) size);
+
+    if (rc == 0)
+        *map_addr = NULL;
+
+    return rc;
+}
+
+static Result shmemMap(SharedMemory *s) {
+    return nx_host_map("map_shared_memory", s->handle, s->size, s->perm, &s->map_addr);
+}
+
+static Result shmemUnmap(SharedMemory *s) {
+    return nx_host_unmap("unmap_shared_memory", s->handle, &s->map_addr, s->size);
+}
+
+static Result tmemMap(TransferMemory *t) {
+    return nx_host_map("map_transfer_memory", t->handle, t->size, t->perm, &t->map_addr);
+}
+
+static Result tmemUnmap(TransferMemory *t) {
+    return nx_host_unmap("unmap_transfer_memory", t->handle, &t->map_addr, t->size);
+}
+
+static Handle threadGetCurHandle(void) {
+    if (g_kernel != NULL)
+        return nx_host_call(NULL, 0, "get_current_thread_handle", "()");
+
+    return 0xffff8000;
+}
 
 #endif
 
+#define NX_IPC_BUFFER_SIZE 0x100
+
+/* Buffer attributes, matching nx.sf.BufferAttr */
+#define NX_BUFFER_IN                      (1 << 0)
+#define NX_BUFFER_OUT                     (1 << 1)
+#define NX_BUFFER_HIPC_MAP_ALIAS          (1 << 2)
+#define NX_BUFFER_HIPC_POINTER            (1 << 3)
+#define NX_BUFFER_FIXED_SIZE              (1 << 4)
+#define NX_BUFFER_HIPC_AUTO_SELECT        (1 << 5)
+#define NX_BUFFER_MAP_ALLOWS_NON_SECURE   (1 << 6)
+#define NX_BUFFER_MAP_ALLOWS_NON_DEVICE   (1 << 7)
+
+#define NX_CMIF_COMMAND_REQUEST              4
+#define NX_CMIF_COMMAND_REQUEST_WITH_CONTEXT 6
+
+#define NX_CMIF_DOMAIN_SEND_MESSAGE 1
+
+#define NX_CMIF_IN_MAGIC  0x49434653 /* SFCI */
+#define NX_CMIF_OUT_MAGIC 0x4f434653 /* SFCO */
+
+#define NX_HIPC_AUTO_RECV_STATIC 0xff
+
+typedef struct {
+    u64 address;
+    u64 size;
+    u32 attr;
+} NxBuffer;
+
+typedef struct {
+    u32 object_id;
+    u32 request_id;
+    u32 context;
+    u32 data_size;
+    u32 server_pointer_size;
+    u32 num_in_auto_buffers;
+    u32 num_out_auto_buffers;
+    u32 num_in_buffers;
+    u32 num_out_buffers;
+    u32 num_inout_buffers;
+    u32 num_in_pointers;
+    u32 num_out_pointers;
+    u32 num_out_fixed_pointers;
+    u32 num_objects;
+    u32 num_handles;
+    u32 send_pid;
+} NxCmifFormat;
+
+typedef struct {
+    u8 *base;
+    u32 *copy_handles;
+    u32 *send_statics;
+    u32 *send_buffers;
+    u32 *recv_buffers;
+    u32 *exch_buffers;
+    u32 *recv_list;
+    u16 *out_pointer_sizes;
+    u32 *objects;
+    u8 *data;
+    u32 server_pointer_size;
+    u32 cur_in_ptr_id;
+} NxCmifRequest;
+
+static inline void nx_write_u32(void *dst, u32 value) {
+    memcpy(dst, &value, sizeof(value));
+}
+
+static inline u32 nx_read_u32(const void *src) {
+    u32 value;
+    memcpy(&value, src, sizeof(value));
+
+    return value;
+}
+
+static void nx_cmif_process_format(NxCmifFormat *fmt, u32 attr) {
+    int is_in = (attr & NX_BUFFER_IN) != 0;
+    int is_out = (attr & NX_BUFFER_OUT) != 0;
+
+    if (attr & NX_BUFFER_HIPC_AUTO_SELECT) {
+        if (is_in)
+            fmt->num_in_auto_buffers++;
+        if (is_out)
+            fmt->num_out_auto_buffers++;
+    } else if (attr & NX_BUFFER_HIPC_POINTER) {
+        if (is_in)
+            fmt->num_in_pointers++;
+        if (is_out) {
+            if (attr & NX_BUFFER_FIXED_SIZE)
+                fmt->num_out_fixed_pointers++;
+            else
+                fmt->num_out_pointers++;
+        }
+    } else if (attr & NX_BUFFER_HIPC_MAP_ALIAS) {
+        if (is_in && is_out)
+            fmt->num_inout_buffers++;
+        else if (is_in)
+            fmt->num_in_buffers++;
+        else if (is_out)
+            fmt->num_out_buffers++;
+    }
+}
+
+static int nx_cmif_make_request(NxCmifRequest *req, u8 *base, const NxCmifFormat *fmt) {
+    u32 actual_size = 16;
+    if (fmt->object_id != 0)
+        actual_size += 16 + fmt->num_objects * sizeof(u32);
+
+    actual_size += 16 + fmt->data_size;
+    actual_size = (actual_size + 1) & ~1;
+
+    u32 out_pointer_size_table_offset = actual_size;
+    u32 out_pointer_size_table_size = fmt->num_out_auto_buffers + fmt->num_out_pointers;
+
+    actual_size += sizeof(u16) * out_pointer_size_table_size;
+
+    u32 num_data_words = (actual_size + 3) / 4;
+
+    u32 num_send_statics = fmt->num_in_auto_buffers + fmt->num_in_pointers;
+    u32 num_send_buffers = fmt->num_in_auto_buffers + fmt->num_in_buffers;
+    u32 num_recv_buffers = fmt->num_out_auto_buffers + fmt->num_out_buffers;
+    u32 num_exch_buffers = fmt->num_inout_buffers;
+    u32 num_recv_statics = out_pointer_size_table_size + fmt->num_out_fixed_pointers;
+    u32 num_copy_handles = fmt->num_handles;
+
+    if (num_send_statics > 0xf || num_send_buffers > 0xf || num_recv_buffers > 0xf ||
+        num_exch_buffers > 0xf || num_copy_handles > 0xf || num_recv_statics > 0xd)
+    {
+        PyErr_SetString(PyExc_ValueError, "Too many buffers or handles for one request");
+        return -1;
+    }
+
+    int has_special_header = fmt->send_pid || num_copy_handles > 0;
+
+    u32 recv_static_mode = 0;
+    if (num_recv_statics > 0) {
+        recv_static_mode = 2;
+        if (num_recv_statics != NX_HIPC_AUTO_RECV_STATIC)
+            recv_static_mode += num_recv_statics;
+    }
+
+    u32 size = 8;
+    if (has_special_header) {
+        size += 4;
+        if (fmt->send_pid)
+            size += 8;
+    }
+
+    u32 copy_handles = size;
+    size += 4 * num_copy_handles;
+
+    u32 send_statics = size;
+    size += 8 * num_send_statics;
+
+    u32 send_buffers = size;
+    size += 12 * num_send_buffers;
+
+    u32 recv_buffers = size;
+    size += 12 * num_recv_buffers;
+
+    u32 exch_buffers = size;
+    size += 12 * num_exch_buffers;
+
+    u32 data_words = size;
+    size += 4 * num_data_words;
+
+    u32 recv_list = size;
+    size += 8 * num_recv_statics;
+
+    if (size > NX_IPC_BUFFER_SIZE) {
+        PyErr_SetString(PyExc_ValueError, "Request does not fit in the IPC buffer");
+        return -1;
+    }
+
+    u32 type = fmt->context ? NX_CMIF_COMMAND_REQUEST_WITH_CONTEXT : NX_CMIF_COMMAND_REQUEST;
+
+    nx_write_u32(base, type
+        | (num_send_statics << 16)
+        | (num_send_buffers << 20)
+        | (num_recv_buffers << 24)
+        | (num_exch_buffers << 28));
+
+    nx_write_u32(base + 4, num_data_words
+        | (recv_static_mode << 10)
+        | ((u32) has_special_header << 31));
+
+    if (has_special_header) {
+        nx_write_u32(base + 8, (fmt->send_pid ? 1 : 0) | (num_copy_handles << 1));
+
+        if (fmt->send_pid)
+            memset(base + 12, 0, 8);
+    }
+
+    req->base = base;
+    req->copy_handles = (u32 *) (base + copy_handles);
+    req->send_statics = (u32 *) (base + send_statics);
+    req->send_buffers = (u32 *) (base + send_buffers);
+    req->recv_buffers = (u32 *) (base + recv_buffers);
+    req->exch_buffers = (u32 *) (base + exch_buffers);
+    req->recv_list = (u32 *) (base + recv_list);
+
+    u8 *data = base + ((data_words + 15) & ~15);
+
+    /* Zero the padding before the payload and the payload itself */
+    memset(base + data_words, 0, 4 * num_data_words);
+
+    if (fmt->object_id != 0) {
+        u32 payload_size = 16 + fmt->data_size;
+
+        data[0] = NX_CMIF_DOMAIN_SEND_MESSAGE;
+        data[1] = (u8) fmt->num_objects;
+        data[2] = payload_size & 0xff;
+        data[3] = (payload_size >> 8) & 0xff;
+        nx_write_u32(data + 4, fmt->object_id);
+        nx_write_u32(data + 8, 0);
+        nx_write_u32(data + 12, fmt->context);
+
+        data += 16;
+        req->objects = (u32 *) (data + payload_size);
+    } else {
+        req->objects = NULL;
+    }
+
+    nx_write_u32(data, NX_CMIF_IN_MAGIC);
+    nx_write_u32(data + 4, fmt->context ? 1 : 0);
+    nx_write_u32(data + 8, fmt->request_id);
+    nx_write_u32(data + 12, fmt->object_id ? 0 : fmt->context);
+
+    req->data = data + 16;
+    req->out_pointer_sizes = (u16 *) (base + data_words + out_pointer_size_table_offset);
+    req->server_pointer_size = fmt->server_pointer_size;
+    req->cur_in_ptr_id = 0;
+
+    return 0;
+}
+
+static void nx_cmif_add_static(NxCmifRequest *req, u64 address, u64 size) {
+    nx_write_u32(req->send_statics, (req->cur_in_ptr_id & 0x3f)
+        | (((address >> 36) & 0x3f) << 6)
+        | (((address >> 32) & 0xf) << 12)
+        | ((u32) (size & 0xffff) << 16));
+    nx_write_u32(req->send_statics + 1, (u32) address);
+
+    req->send_statics += 2;
+    req->cur_in_ptr_id++;
+    req->server_pointer_size -= (u32) size;
+}
+
+static u32 *nx_cmif_add_buffer(u32 *dst, u64 address, u64 size, u32 mode) {
+    nx_write_u32(dst, (u32) size);
+    nx_write_u32(dst + 1, (u32) address);
+    nx_write_u32(dst + 2, (mode & 0x3)
+        | (((address >> 36) & 0x3fffff) << 2)
+        | (((size >> 32) & 0xf) << 24)
+        | (((address >> 32) & 0xf) << 28));
+
+    return dst + 3;
+}
+
+static void nx_cmif_add_out_fixed_pointer(NxCmifRequest *req, u64 address, u64 size) {
+    nx_write_u32(req->recv_list, (u32) address);
+    nx_write_u32(req->recv_list + 1, ((address >> 32) & 0xffff) | ((u32) (size & 0xffff) << 16));
+
+    req->recv_list += 2;
+    req->server_pointer_size -= (u32) size;
+}
+
+static void nx_cmif_add_out_pointer(NxCmifRequest *req, u64 address, u64 size) {
+    nx_cmif_add_out_fixed_pointer(req, address, size);
+
+    u16 size16 = (u16) size;
+    memcpy(req->out_pointer_sizes, &size16, sizeof(size16));
+    req->out_pointer_sizes++;
+}
+
+static void nx_cmif_process_buffer(NxCmifRequest *req, const NxBuffer *buf) {
+    u32 attr = buf->attr;
+    int is_in = (attr & NX_BUFFER_IN) != 0;
+    int is_out = (attr & NX_BUFFER_OUT) != 0;
+
+    if (attr & NX_BUFFER_HIPC_AUTO_SELECT) {
+        int use_pointer = req->server_pointer_size > 0 && buf->size <= req->server_pointer_size;
+
+        if (is_in) {
+            if (use_pointer) {
+                nx_cmif_add_static(req, buf->address, buf->size);
+                req->send_buffers = nx_cmif_add_buffer(req->send_buffers, 0, 0, 0);
+            } else {
+                nx_cmif_add_static(req, 0, 0);
+                req->send_buffers = nx_cmif_add_buffer(req->send_buffers, buf->address, buf->size, 0);
+            }
+        }
+
+        if (is_out) {
+            use_pointer = req->server_pointer_size > 0 && buf->size <= req->server_pointer_size;
+
+            if (use_pointer) {
+                nx_cmif_add_out_pointer(req, buf->address, buf->size);
+                req->recv_buffers = nx_cmif_add_buffer(req->recv_buffers, 0, 0, 0);
+            } else {
+                nx_cmif_add_out_pointer(req, 0, 0);
+                req->recv_buffers = nx_cmif_add_buffer(req->recv_buffers, buf->address, buf->size, 0);
+            }
+        }
+    } else if (attr & NX_BUFFER_HIPC_POINTER) {
+        if (is_in)
+            nx_cmif_add_static(req, buf->address, buf->size);
+
+        if (is_out) {
+            if (attr & NX_BUFFER_FIXED_SIZE)
+                nx_cmif_add_out_fixed_pointer(req, buf->address, buf->size);
+            else
+                nx_cmif_add_out_pointer(req, buf->address, buf->size);
+        }
+    } else if (attr & NX_BUFFER_HIPC_MAP_ALIAS) {
+        u32 mode = 0;
+        if (attr & NX_BUFFER_MAP_ALLOWS_NON_SECURE)
+            mode = 1;
+        if (attr & NX_BUFFER_MAP_ALLOWS_NON_DEVICE)
+            mode = 3;
+
+        if (is_in && is_out)
+            req->exch_buffers = nx_cmif_add_buffer(req->exch_buffers, buf->address, buf->size, mode);
+        else if (is_in)
+            req->send_buffers = nx_cmif_add_buffer(req->send_buffers, buf->address, buf->size, mode);
+        else if (is_out)
+            req->recv_buffers = nx_cmif_add_buffer(req->recv_buffers, buf->address, buf->size, mode);
+    }
+}
+
+static int nx_parse_u32_sequence(PyObject *seq, u32 *out, Py_ssize_t max, Py_ssize_t *count, const char *what) {
+    PyObject *fast = PySequence_Fast(seq, what);
+    if (fast == NULL)
+        return -1;
+
+    Py_ssize_t len = PySequence_Fast_GET_SIZE(fast);
+    if (len > max) {
+        Py_DECREF(fast);
+        PyErr_Format(PyExc_ValueError, "Too many %s", what);
+        return -1;
+    }
+
+    for (Py_ssize_t i = 0; i < len; i++) {
+        out[i] = (u32) PyLong_AsUnsignedLongMask(PySequence_Fast_GET_ITEM(fast, i));
+        if (PyErr_Occurred()) {
+            Py_DECREF(fast);
+            return -1;
+        }
+    }
+
+    *count = len;
+
+    Py_DECREF(fast);
+    return 0;
+}
+
+static int nx_parse_buffers(PyObject *seq, NxBuffer *out, Py_ssize_t max, Py_ssize_t *count) {
+    PyObject *fast = PySequence_Fast(seq, "buffers");
+    if (fast == NULL)
+        return -1;
+
+    Py_ssize_t len = PySequence_Fast_GET_SIZE(fast);
+    if (len > max) {
+        Py_DECREF(fast);
+        PyErr_SetString(PyExc_ValueError, "Too many buffers");
+        return -1;
+    }
+
+    for (Py_ssize_t i = 0; i < len; i++) {
+        unsigned long long address, size;
+        unsigned int attr;
+
+        if (!PyArg_ParseTuple(PySequence_Fast_GET_ITEM(fast, i), "KKI", &address, &size, &attr)) {
+            Py_DECREF(fast);
+            return -1;
+        }
+
+        out[i].address = address;
+        out[i].size = size;
+        out[i].attr = attr;
+    }
+
+    *count = len;
+
+    Py_DECREF(fast);
+    return 0;
+}
+
 static PyObject *nx_armGetTls(PyObject *self, PyObject *args) {
-    #ifdef __SWITCH__
-    
     return PyLong_FromUnsignedLongLong((unsigned long long) armGetTls());
+}
 
-    #else
+static PyObject *nx_armGetSystemTick(PyObject *self, PyObject *args) {
+    return PyLong_FromUnsignedLongLong(armGetSystemTick());
+}
 
-    return PyLong_FromUnsignedLongLong((unsigned long long) g_tls);
+static PyObject *nx_armGetSystemTickFreq(PyObject *self, PyObject *args) {
+    return PyLong_FromUnsignedLongLong(armGetSystemTickFreq());
+}
 
-    #endif
+static PyObject *nx_svcGetSystemTick(PyObject *self, PyObject *args) {
+    return PyLong_FromUnsignedLongLong(svcGetSystemTick());
 }
 
 static PyObject *nx_svcSendSyncRequest(PyObject *self, PyObject *args) {
-    #ifdef __SWITCH__
-
     Handle tmp_h;
 
     if (!PyArg_ParseTuple(args, "I", &tmp_h))
         return NULL;
 
-    Result rc = svcSendSyncRequest(tmp_h);
+    Result rc;
 
-    return PyLong_FromUnsignedLong(rc);
+    Py_BEGIN_ALLOW_THREADS
+    rc = svcSendSyncRequest(tmp_h);
+    Py_END_ALLOW_THREADS
 
-    #else
-
-    return PyLong_FromUnsignedLong(0);
-
-    #endif
+    return PyLong_FromUnsignedLong(rc);
 }
 
 static PyObject *nx_svcConnectToNamedPort(PyObject *self, PyObject *args) {
-    #ifdef __SWITCH__
-
     const char *name;
 
     if (!PyArg_ParseTuple(args, "s", &name))
         return NULL;
 
-    Handle tmp_h;
+    Handle tmp_h = 0;
     Result rc = svcConnectToNamedPort(&tmp_h, name);
 
     return Py_BuildValue("II", rc, tmp_h);
-
-    #else
-
-    return Py_BuildValue("II", 0, 1);
-
-    #endif
 }
 
 static PyObject *nx_svcSleepThread(PyObject *self, PyObject *args) {
-    #ifdef __SWITCH__
-
     s64 nano;
 
     if (!PyArg_ParseTuple(args, "L", &nano))
         return NULL;
 
+    Py_BEGIN_ALLOW_THREADS
     svcSleepThread(nano);
+    Py_END_ALLOW_THREADS
 
-    #endif
+    Py_RETURN_NONE;
+}
+
+static PyObject *nx_svcSendAsyncRequestWithUserBuffer(PyObject *self, PyObject *args) {
+    unsigned long long addr, size;
+    Handle session;
+
+    if (!PyArg_ParseTuple(args, "KKI", &addr, &size, &session))
+        return NULL;
+
+    Handle event = 0;
+    Result rc = svcSendAsyncRequestWithUserBuffer(&event, (void *) (uintptr_t) addr, size, session);
+
+    return Py_BuildValue("II", rc, event);
+}
+
+static PyObject *nx_svcWaitSynchronization(PyObject *self, PyObject *args) {
+    PyObject *handles_seq;
+    long long timeout;
+
+    if (!PyArg_ParseTuple(args, "OL", &handles_seq, &timeout))
+        return NULL;
+
+    Handle handles[0x40];
+    Py_ssize_t num_handles = 0;
+
+    if (nx_parse_u32_sequence(handles_seq, handles, 0x40, &num_handles, "handles") < 0)
+        return NULL;
+
+    s32 index = -1;
+    Result rc;
+
+    Py_BEGIN_ALLOW_THREADS
+    rc = svcWaitSynchronization(&index, handles, (s32) num_handles, (u64) timeout);
+    Py_END_ALLOW_THREADS
+
+    return Py_BuildValue("Ii", rc, index);
+}
+
+static PyObject *nx_svcReplyAndReceive(PyObject *self, PyObject *args) {
+    PyObject *handles_seq;
+    Handle reply_target;
+    long long timeout;
+
+    if (!PyArg_ParseTuple(args, "OIL", &handles_seq, &reply_target, &timeout))
+        return NULL;
+
+    Handle handles[0x40];
+    Py_ssize_t num_handles = 0;
+
+    if (nx_parse_u32_sequence(handles_seq, handles, 0x40, &num_handles, "handles") < 0)
+        return NULL;
+
+    s32 index = -1;
+    Result rc;
+
+    Py_BEGIN_ALLOW_THREADS
+    rc = svcReplyAndReceive(&index, handles, (s32) num_handles, reply_target, (u64) timeout);
+    Py_END_ALLOW_THREADS
+
+    return Py_BuildValue("Ii", rc, index);
+}
+
+static PyObject *nx_svcAcceptSession(PyObject *self, PyObject *args) {
+    Handle port;
+
+    if (!PyArg_ParseTuple(args, "I", &port))
+        return NULL;
+
+    Handle session = 0;
+    Result rc = svcAcceptSession(&session, port);
+
+    return Py_BuildValue("II", rc, session);
+}
+
+static PyObject *nx_svcCreateSession(PyObject *self, PyObject *args) {
+    Handle server = 0, client = 0;
+    Result rc = svcCreateSession(&server, &client, 0, 0);
+
+    return Py_BuildValue("III", rc, server, client);
+}
+
+static PyObject *nx_svcCancelSynchronization(PyObject *self, PyObject *args) {
+    Handle thread;
+
+    if (!PyArg_ParseTuple(args, "I", &thread))
+        return NULL;
+
+    return PyLong_FromUnsignedLong(svcCancelSynchronization(thread));
+}
+
+static PyObject *nx_svcCreateEvent(PyObject *self, PyObject *args) {
+    Handle server = 0, client = 0;
+    Result rc = svcCreateEvent(&server, &client);
+
+    return Py_BuildValue("III", rc, server, client);
+}
+
+static PyObject *nx_svcSignalEvent(PyObject *self, PyObject *args) {
+    Handle handle;
+
+    if (!PyArg_ParseTuple(args, "I", &handle))
+        return NULL;
+
+    return PyLong_FromUnsignedLong(svcSignalEvent(handle));
+}
+
+static PyObject *nx_svcClearEvent(PyObject *self, PyObject *args) {
+    Handle handle;
+
+    if (!PyArg_ParseTuple(args, "I", &handle))
+        return NULL;
+
+    return PyLong_FromUnsignedLong(svcClearEvent(handle));
+}
+
+static PyObject *nx_svcResetSignal(PyObject *self, PyObject *args) {
+    Handle handle;
+
+    if (!PyArg_ParseTuple(args, "I", &handle))
+        return NULL;
+
+    return PyLong_FromUnsignedLong(svcResetSignal(handle));
+}
+
+static PyObject *nx_svcCreateTransferMemory(PyObject *self, PyObject *args) {
+    unsigned long long addr, size;
+    u32 perm;
+
+    if (!PyArg_ParseTuple(args, "KKI", &addr, &size, &perm))
+        return NULL;
+
+    Handle handle = 0;
+    Result rc = svcCreateTransferMemory(&handle, (void *) (uintptr_t) addr, size, perm);
+
+    return Py_BuildValue("II", rc, handle);
+}
+
+static PyObject *nx_svcCreateSharedMemory(PyObject *self, PyObject *args) {
+    unsigned long long size;
+    u32 local_perm, other_perm;
+
+    if (!PyArg_ParseTuple(args, "KII", &size, &local_perm, &other_perm))
+        return NULL;
+
+    Handle handle = 0;
+    Result rc = svcCreateSharedMemory(&handle, size, local_perm, other_perm);
+
+    return Py_BuildValue("II", rc, handle);
+}
+
+/*
+ * Mapping goes through libnx, which picks a free region
+ * of the address space to map the memory to
+ */
+
+static PyObject *nx_shmemMap(PyObject *self, PyObject *args) {
+    Handle handle;
+    unsigned long long size;
+    u32 perm;
+
+    if (!PyArg_ParseTuple(args, "IKI", &handle, &size, &perm))
+        return NULL;
+
+    SharedMemory s = {.handle = handle, .size = size, .perm = perm, .map_addr = NULL};
+    Result rc = shmemMap(&s);
+
+    return Py_BuildValue("IK", rc, (unsigned long long) (uintptr_t) s.map_addr);
+}
+
+static PyObject *nx_shmemUnmap(PyObject *self, PyObject *args) {
+    Handle handle;
+    unsigned long long addr, size;
+
+    if (!PyArg_ParseTuple(args, "IKK", &handle, &addr, &size))
+        return NULL;
+
+    SharedMemory s = {.handle = handle, .size = size, .map_addr = (void *) (uintptr_t) addr};
+
+    return PyLong_FromUnsignedLong(shmemUnmap(&s));
+}
+
+static PyObject *nx_tmemMap(PyObject *self, PyObject *args) {
+    Handle handle;
+    unsigned long long size;
+    u32 perm;
+
+    if (!PyArg_ParseTuple(args, "IKI", &handle, &size, &perm))
+        return NULL;
+
+    TransferMemory t = {.handle = handle, .size = size, .perm = perm, .map_addr = NULL};
+    Result rc = tmemMap(&t);
+
+    return Py_BuildValue("IK", rc, (unsigned long long) (uintptr_t) t.map_addr);
+}
+
+static PyObject *nx_tmemUnmap(PyObject *self, PyObject *args) {
+    Handle handle;
+    unsigned long long addr, size;
+
+    if (!PyArg_ParseTuple(args, "IKK", &handle, &addr, &size))
+        return NULL;
+
+    TransferMemory t = {.handle = handle, .size = size, .map_addr = (void *) (uintptr_t) addr};
+
+    return PyLong_FromUnsignedLong(tmemUnmap(&t));
+}
+
+static PyObject *nx_svcSetThreadCoreMask(PyObject *self, PyObject *args) {
+    Handle handle;
+    s32 core_id;
+    u32 affinity_mask;
+
+    if (!PyArg_ParseTuple(args, "IiI", &handle, &core_id, &affinity_mask))
+        return NULL;
+
+    return PyLong_FromUnsignedLong(svcSetThreadCoreMask(handle, core_id, affinity_mask));
+}
+
+static PyObject *nx_svcCloseHandle(PyObject *self, PyObject *args) {
+    Handle handle;
+
+    if (!PyArg_ParseTuple(args, "I", &handle))
+        return NULL;
+
+    return PyLong_FromUnsignedLong(svcCloseHandle(handle));
+}
+
+static PyObject *nx_threadGetCurHandle(PyObject *self, PyObject *args) {
+    return PyLong_FromUnsignedLong(threadGetCurHandle());
+}
+
+#ifndef __SWITCH__
+
+static PyObject *nx_hostSetKernel(PyObject *self, PyObject *args) {
+    PyObject *kernel;
+
+    if (!PyArg_ParseTuple(args, "O", &kernel))
+        return NULL;
+
+    PyObject *old = g_kernel;
+
+    if (kernel == Py_None) {
+        g_kernel = NULL;
+    } else {
+        Py_INCREF(kernel);
+        g_kernel = kernel;
+    }
+
+    Py_XDECREF(old);
 
     Py_RETURN_NONE;
 }
 
+/*
+ * Counts calls to the Python allocators, for benchmarks. The counting
+ * allocators wrap the previous ones, as tracemalloc's do, and are only
+ * installed the first time hostAllocationCount is called.
+ */
+static PyMemAllocatorEx g_mem_alloc, g_obj_alloc;
+static unsigned long long g_allocations = 0;
+static int g_counting_allocations = 0;
+
+static void *nx_count_malloc(void *ctx, size_t size) {
+    PyMemAllocatorEx *alloc = ctx;
+
+    g_allocations++;
+    return alloc->malloc(alloc->ctx, size);
+}
+
+static void *nx_count_calloc(void *ctx, size_t nelem, size_t elsize) {
+    PyMemAllocatorEx *alloc = ctx;
+
+    g_allocations++;
+    return alloc->calloc(alloc->ctx, nelem, elsize);
+}
+
+static void *nx_count_realloc(void *ctx, void *ptr, size_t new_size) {
+    PyMemAllocatorEx *alloc = ctx;
+
+    if (ptr == NULL)
+        g_allocations++;
+
+    return alloc->realloc(alloc->ctx, ptr, new_size);
+}
+
+static void nx_count_free(void *ctx, void *ptr) {
+    PyMemAllocatorEx *alloc = ctx;
+
+    alloc->free(alloc->ctx, ptr);
+}
+
+static void nx_count_allocations(PyMemAllocatorDomain domain, PyMemAllocatorEx *old) {
+    PyMem_GetAllocator(domain, old);
+
+    PyMemAllocatorEx alloc = {
+        .ctx = old,
+        .malloc = nx_count_malloc,
+        .calloc = nx_count_calloc,
+        .realloc = nx_count_realloc,
+        .free = nx_count_free,
+    };
+
+    PyMem_SetAllocator(domain, &alloc);
+}
+
+static PyObject *nx_hostAllocationCount(PyObject *self, PyObject *args) {
+    if (!g_counting_allocations) {
+        nx_count_allocations(PYMEM_DOMAIN_MEM, &g_mem_alloc);
+        nx_count_allocations(PYMEM_DOMAIN_OBJ, &g_obj_alloc);
+
+        g_counting_allocations = 1;
+    }
+
+    return PyLong_FromUnsignedLongLong(g_allocations);
+}
+
+#endif
+
+/*
+ * Encodes a CMIF request into the IPC buffer, sends it, and parses the
+ * response headers.
+ *
+ * Returns (result, data, objects, copy_handles, move_handles), the last
+ * four being offsets into the IPC buffer. The offsets are only
+ * meaningful if result is 0.
+ */
+static PyObject *nx_cmifDispatch(PyObject *self, PyObject *args) {
+    Handle session;
+    NxCmifFormat fmt = {0};
+    int send_pid;
+    Py_buffer in_data;
+    PyObject *buffers_seq, *objects_seq, *handles_seq;
+    unsigned int out_size;
+
+    if (!PyArg_ParseTuple(args, "IIIIpz*OOOII",
+            &session, &fmt.object_id, &fmt.request_id, &fmt.context, &send_pid,
+            &in_data, &buffers_seq, &objects_seq, &handles_seq,
+            &fmt.server_pointer_size, &out_size))
+    {
+        return NULL;
+    }
+
+    NxBuffer buffers[16];
+    u32 objects[8];
+    u32 handles[16];
+    Py_ssize_t num_buffers = 0, num_objects = 0, num_handles = 0;
+
+    if (nx_parse_buffers(buffers_seq, buffers, 16, &num_buffers) < 0 ||
+        nx_parse_u32_sequence(objects_seq, objects, 8, &num_objects, "objects") < 0 ||
+        nx_parse_u32_sequence(handles_seq, handles, 16, &num_handles, "handles") < 0)
+    {
+        PyBuffer_Release(&in_data);
+        return NULL;
+    }
+
+    fmt.data_size = in_data.buf != NULL ? (u32) in_data.len : 0;
+    fmt.num_objects = (u32) num_objects;
+    fmt.num_handles = (u32) num_handles;
+    fmt.send_pid = send_pid;
+
+    for (Py_ssize_t i = 0; i < num_buffers; i++)
+        nx_cmif_process_format(&fmt, buffers[i].attr);
+
+    u8 *base = armGetTls();
+    NxCmifRequest req;
+
+    if (nx_cmif_make_request(&req, base, &fmt) < 0) {
+        PyBuffer_Release(&in_data);
+        return NULL;
+    }
+
+    if (fmt.object_id != 0) {
+        for (Py_ssize_t i = 0; i < num_objects; i++)
+            nx_write_u32(req.objects + i, objects[i]);
+    }
+
+    for (Py_ssize_t i = 0; i < num_handles; i++)
+        nx_write_u32(req.copy_handles + i, handles[i]);
+
+    for (Py_ssize_t i = 0; i < num_buffers; i++)
+        nx_cmif_process_buffer(&req, &buffers[i]);
+
+    if (fmt.data_size > 0)
+        memcpy(req.data, in_data.buf, fmt.data_size);
+
+    PyBuffer_Release(&in_data);
+
+    Result rc;
+
+    Py_BEGIN_ALLOW_THREADS
+    rc = svcSendSyncRequest(session);
+    Py_END_ALLOW_THREADS
+
+    if (rc != 0)
+        return Py_BuildValue("Iiiii", rc, -1, -1, -1, -1);
+
+    /* Parse the HIPC response */
+    u32 hdr0 = nx_read_u32(base);
+    u32 hdr1 = nx_read_u32(base + 4);
+
+    u32 num_statics = (hdr0 >> 16) & 0xf;
+    u32 num_data_words = hdr1 & 0x3ff;
+    u32 num_copy_handles = 0, num_move_handles = 0;
+
+    u32 offset = 8;
+    if (hdr1 >> 31) {
+        u32 sp_hdr = nx_read_u32(base + offset);
+        offset += 4;
+
+        num_copy_handles = (sp_hdr >> 1) & 0xf;
+        num_move_handles = (sp_hdr >> 5) & 0xf;
+
+        if (sp_hdr & 1)
+            offset += 8;
+    }
+
+    u32 copy_handles = offset;
+    offset += 4 * num_copy_handles;
+
+    u32 move_handles = offset;
+    offset += 4 * num_move_handles;
+
+    offset += 8 * num_statics;
+
+    /* Parse the CMIF response */
+    u32 data = (offset + 15) & ~15;
+    int objects_offset = -1;
+
+    if (fmt.object_id != 0) {
+        data += 16;
+        objects_offset = data + 16 + out_size;
+    }
+
+    if (data + 16 > NX_IPC_BUFFER_SIZE || 4 * num_data_words < 16) {
+        PyErr_SetString(PyExc_ValueError, "Invalid response");
+        return NULL;
+    }
+
+    if (nx_read_u32(base + data) != NX_CMIF_OUT_MAGIC) {
+        PyObject *magic = PyBytes_FromStringAndSize((const char *) base + data, strnlen((const char *) base + data, 4));
+
+        if (magic != NULL) {
+            PyErr_Format(PyExc_ValueError, "Invalid magic for out header: %R", magic);
+            Py_DECREF(magic);
+        }
+
+        return NULL;
+    }
+
+    rc = nx_read_u32(base + data + 8);
+
+    return Py_BuildValue("Iiiii", rc, data + 16, objects_offset, copy_handles, move_handles);
+}
+
 static PyMethodDef NxMethods[] = {
     {"armGetTls", nx_armGetTls, METH_VARARGS},
+    {"armGetSystemTick", nx_armGetSystemTick, METH_NOARGS},
+    {"armGetSystemTickFreq", nx_armGetSystemTickFreq, METH_NOARGS},
+    {"svcGetSystemTick", nx_svcGetSystemTick, METH_NOARGS},
     {"svcSendSyncRequest", nx_svcSendSyncRequest, METH_VARARGS},
     {"svcConnectToNamedPort", nx_svcConnectToNamedPort, METH_VARARGS},
     {"svcSleepThread", nx_svcSleepThread, METH_VARARGS},
+    {"svcSendAsyncRequestWithUserBuffer", nx_svcSendAsyncRequestWithUserBuffer, METH_VARARGS},
+    {"svcWaitSynchronization", nx_svcWaitSynchronization, METH_VARARGS},
+    {"svcReplyAndReceive", nx_svcReplyAndReceive, METH_VARARGS},
+    {"svcAcceptSession", nx_svcAcceptSession, METH_VARARGS},
+    {"svcCreateSession", nx_svcCreateSession, METH_VARARGS},
+    {"svcCancelSynchronization", nx_svcCancelSynchronization, METH_VARARGS},
+    {"svcCreateEvent", nx_svcCreateEvent, METH_VARARGS},
+    {"svcSignalEvent", nx_svcSignalEvent, METH_VARARGS},
+    {"svcClearEvent", nx_svcClearEvent, METH_VARARGS},
+    {"svcResetSignal", nx_svcResetSignal, METH_VARARGS},
+    {"svcCreateTransferMemory", nx_svcCreateTransferMemory, METH_VARARGS},
+    {"svcCreateSharedMemory", nx_svcCreateSharedMemory, METH_VARARGS},
+    {"shmemMap", nx_shmemMap, METH_VARARGS},
+    {"shmemUnmap", nx_shmemUnmap, METH_VARARGS},
+    {"tmemMap", nx_tmemMap, METH_VARARGS},
+    {"tmemUnmap", nx_tmemUnmap, METH_VARARGS},
+    {"svcSetThreadCoreMask", nx_svcSetThreadCoreMask, METH_VARARGS},
+    {"svcCloseHandle", nx_svcCloseHandle, METH_VARARGS},
+    {"threadGetCurHandle", nx_threadGetCurHandle, METH_VARARGS},
+    {"cmifDispatch", nx_cmifDispatch, METH_VARARGS},
+#ifndef __SWITCH__
+    {"hostSetKernel", nx_hostSetKernel, METH_VARARGS},
+    {"hostAllocationCount", nx_hostAllocationCount, METH_VARARGS},
+#endif
     {NULL, NULL, 0, NULL}
 };
 
@@ -95,4 +1419,4 @@ static struct PyModuleDef nxmodule = {
 
 PyMODINIT_FUNC PyInit__nx() {
     return PyModule_Create(&nxmodule);
-}
\ No newline at end of file
+}
@@ -0,0 +1,87 @@
+"""
+Compares the per-call overhead of the generic Service.dispatch
+against a command declared with nx.sf.Command. Command only saves
+the argument handling dispatch does on every call, so the difference
+is small next to the cost of the request itself.
+
+On the host build of _nx the session echoes requests back as
+responses, so only command 0 (whose echoed result is 0) is used.
+
+Run from the repository root against a host build of _nx:
+
+    python build.py build_ext --inplace
+    python -m benchmarks.command
+"""
+
+import timeit
+from ctypes import *
+
+from nx import sf
+from nx.services import ServiceManager
+
+class BenchService(sf.Service):
+    cmd_get_handle = sf.Command(0, ServiceManager.ServiceName,
+        out_handle_attrs = (
+            sf.OutHandleAttr.HipcMove,
+        )
+    )
+
+    cmd_get_value = sf.Command(0, c_uint32, c_uint32)
+
+def bench(before, after, number, repeat=15):
+    """
+    Times both alternately, so that noise on the
+    machine affects them alike, keeping the fastest.
+    """
+
+    best_before = best_after = None
+
+    for i in range(repeat):
+        t = timeit.timeit(before, number=number) / number
+        if best_before is None or t < best_before:
+            best_before = t
+
+        t = timeit.timeit(after, number=number) / number
+        if best_after is None or t < best_after:
+            best_after = t
+
+    return best_before, best_after
+
+def main(number=10000):
+    srv = BenchService(1)
+
+    def dispatch_handle():
+        # ServiceManager.get_service before it used nx.sf.Command
+        srv.dispatch(0, ServiceManager.ServiceName(b"fsp-srv"),
+            out_handle_attrs = (
+                sf.OutHandleAttr.HipcMove,
+            )
+        )
+
+    def command_handle():
+        srv.cmd_get_handle(ServiceManager.ServiceName(b"fsp-srv"))
+
+    def dispatch_value():
+        srv.dispatch(0, c_uint32(1), c_uint32).out.value
+
+    def command_value():
+        srv.cmd_get_value(c_uint32(1)).out.value
+
+    cases = {
+        "handle out": (dispatch_handle, command_handle),
+        "value out":  (dispatch_value, command_value),
+    }
+
+    print(f"{'command':<12}{'path':<8}{'dispatch (us)':>15}{'Command (us)':>14}{'speedup':>10}")
+
+    for accel in (False, True):
+        srv.use_accel = accel
+        path = "_nx" if accel else "python"
+
+        for name, (before, after) in cases.items():
+            before, after = bench(before, after, number)
+
+            print(f"{name:<12}{path:<8}{before * 1e6:>15.2f}{after * 1e6:>14.2f}{before / after:>9.2f}x")
+
+if __name__ == "__main__":
+    main()
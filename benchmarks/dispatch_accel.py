@@ -0,0 +1,63 @@
+"""
+Compares a full Service.dispatch round trip through the Python
+encoder against the _nx.cmifDispatch fast path.
+
+On the host build of _nx the session echoes requests back as
+responses, so only command 0 (whose echoed result is 0) is used.
+
+Run from the repository root against a host build of _nx:
+
+    python build.py build_ext --inplace
+    python -m benchmarks.dispatch_accel
+"""
+
+import timeit
+from ctypes import *
+
+from nx import sf
+from nx.sf import BufferAttr
+
+class In(LittleEndianStructure):
+    _fields_ = [
+        ("a", c_uint64),
+        ("b", c_uint32),
+    ]
+
+shapes = {
+    "no buffers": (),
+
+    "map alias": (
+        (sf.Buffer(0x80000000, 0x1000), BufferAttr.HipcMapAlias | BufferAttr.In),
+    ),
+
+    "pointer + auto": (
+        (sf.Buffer(0x80000000, 0x10), BufferAttr.HipcPointer | BufferAttr.In),
+        (sf.Buffer(0x80001000, 0x200), BufferAttr.HipcAutoSelect | BufferAttr.In),
+    ),
+}
+
+def bench(srv, buffers, number):
+    data = In(1, 2)
+
+    def call():
+        srv.dispatch(0, data, c_uint32, buffers=buffers)
+
+    return min(timeit.repeat(call, number=number, repeat=5)) / number
+
+def main(number=10000):
+    srv = sf.Service(1)
+    srv.pointer_buffer_size = 0x400
+
+    print(f"{'shape':<16}{'python (us)':>14}{'_nx (us)':>12}{'speedup':>10}")
+
+    for name, buffers in shapes.items():
+        srv.use_accel = False
+        python = bench(srv, buffers, number)
+
+        srv.use_accel = True
+        accel = bench(srv, buffers, number)
+
+        print(f"{name:<16}{python * 1e6:>14.2f}{accel * 1e6:>12.2f}{python / accel:>9.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Compares the per-call cost of encoding a request from scratch
+against instantiating it from a cached request template. Templates
+are only used for requests encoded in Python, so this only applies to
+dispatch with Service.use_accel off, and to dispatch_async.
+
+Run from the repository root against a host build of _nx:
+
+    python build.py build_ext --inplace
+    python -m benchmarks.dispatch_template
+"""
+
+import timeit
+from ctypes import *
+
+from nx import arm, sf
+from nx.sf import cmif, BufferAttr
+
+class In(LittleEndianStructure):
+    _fields_ = [
+        ("a", c_uint64),
+        ("b", c_uint32),
+    ]
+
+shapes = {
+    "no buffers": (),
+
+    "map alias": (
+        (sf.Buffer(0x80000000, 0x1000), BufferAttr.HipcMapAlias | BufferAttr.In),
+    ),
+
+    "pointer + auto": (
+        (sf.Buffer(0x80000000, 0x10), BufferAttr.HipcPointer | BufferAttr.In),
+        (sf.Buffer(0x80001000, 0x200), BufferAttr.HipcAutoSelect | BufferAttr.Out),
+    ),
+}
+
+def bench(srv, buffers, number):
+    base = arm.ipc_buffer()
+    data = In(1, 2)
+    real_buffers = srv.parse_buffers(buffers)
+
+    def call():
+        req = srv.make_request(base, 1, 0, sizeof(data), False, real_buffers, (), ())
+        req.insert(req.data, data)
+
+    return min(timeit.repeat(call, number=number, repeat=5)) / number
+
+def main(number=10000):
+    srv = sf.Service(1)
+    srv.pointer_buffer_size = 0x400
+
+    print(f"{'shape':<16}{'cold (us)':>12}{'templated (us)':>16}{'speedup':>10}")
+
+    for name, buffers in shapes.items():
+        srv.use_templates = False
+        cold = bench(srv, buffers, number)
+
+        srv.use_templates = True
+        cmif.request_template.cache_clear()
+        templated = bench(srv, buffers, number)
+
+        print(f"{name:<16}{cold * 1e6:>12.2f}{templated * 1e6:>16.2f}{cold / templated:>9.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Measures event loop latency with nx.loop.HorizonEventLoop against
+asyncio's stock selector loop, on kernel handles simulated by nx.sim.
+
+"sleep(0)" is a bare trip through the loop, "wake from thread" the
+time from call_soon_threadsafe on another thread to the callback
+running, and "event" the same for a kernel event, which the stock
+loop waits on through nx.kernel.waiter's helper thread. "socket
+round trip" sends a byte over a socket pair and waits for it to
+arrive, "dispatch_async" sends an async request to a simulated
+service, and "timer 1 ms" is how late asyncio.sleep(0.001) wakes up.
+
+Run from the repository root against a host build of _nx:
+
+    python build.py build_ext --inplace
+    python -m benchmarks.loop
+"""
+
+import asyncio
+import socket
+import statistics
+import threading
+import time
+from ctypes import *
+
+from nx import kernel, sf, sim
+from nx.kernel import waiter
+from nx.loop import HorizonEventLoop
+from nx.sf import server
+from nx.services import ServiceManager
+
+class Bench(server.Object):
+    @server.command(0)
+    def value(self, ctx):
+        return c_uint32(0)
+
+class BenchService(sf.Service):
+    name = "bench"
+
+async def sleep_zero(loop, count):
+    start = time.perf_counter_ns()
+
+    for i in range(count):
+        await asyncio.sleep(0)
+
+    return [(time.perf_counter_ns() - start) / count]
+
+def wake_from_thread(loop, count):
+    samples = []
+
+    async def run():
+        for i in range(count):
+            fut = loop.create_future()
+
+            def wake():
+                fut.sent = time.perf_counter_ns()
+                loop.call_soon_threadsafe(fut.set_result, None)
+
+            threading.Timer(0.0002, wake).start()
+            await fut
+
+            samples.append(time.perf_counter_ns() - fut.sent)
+
+        return samples
+
+    return run()
+
+async def event(loop, count):
+    samples = []
+    ev = kernel.Event()
+
+    for i in range(count):
+        ev.clear()
+
+        sent = []
+        def signal():
+            sent.append(time.perf_counter_ns())
+            ev.signal()
+
+        threading.Timer(0.0002, signal).start()
+        await waiter.wait(loop, ev.handle)
+
+        samples.append(time.perf_counter_ns() - sent[0])
+
+    ev.close()
+
+    return samples
+
+async def socket_round_trip(loop, count):
+    a, b = socket.socketpair()
+    a.setblocking(False)
+    b.setblocking(False)
+
+    samples = []
+
+    for i in range(count):
+        start = time.perf_counter_ns()
+
+        await loop.sock_sendall(b, b"\0")
+        await loop.sock_recv(a, 1)
+
+        samples.append(time.perf_counter_ns() - start)
+
+    a.close()
+    b.close()
+
+    return samples
+
+async def dispatch_async(loop, count):
+    srv = BenchService()
+    samples = []
+
+    for i in range(count):
+        start = time.perf_counter_ns()
+        await srv.dispatch_async(0, out_type=c_uint32)
+        samples.append(time.perf_counter_ns() - start)
+
+    srv.close()
+
+    return samples
+
+async def timer(loop, count):
+    samples = []
+
+    for i in range(count):
+        start = time.perf_counter_ns()
+        await asyncio.sleep(0.001)
+        samples.append(time.perf_counter_ns() - start - 1000000)
+
+    return samples
+
+cases = {
+    "sleep(0)":          (sleep_zero, 20000),
+    "wake from thread":  (wake_from_thread, 500),
+    "event":             (event, 500),
+    "socket round trip": (socket_round_trip, 2000),
+    "dispatch_async":    (dispatch_async, 2000),
+    "timer 1 ms":        (timer, 200),
+}
+
+loops = {
+    "selector": asyncio.SelectorEventLoop,
+    "horizon":  HorizonEventLoop,
+}
+
+def main():
+    kernel_sim = sim.Kernel().install()
+    kernel_sim.register_service("bench", Bench)
+
+    sf.Service.sm = ServiceManager()
+
+    print(f"{'case':<20}" + "".join(f"{name + ' ns':>16}" for name in loops))
+
+    for case, (func, count) in cases.items():
+        line = f"{case:<20}"
+
+        for make_loop in loops.values():
+            loop = make_loop()
+
+            try:
+                samples = loop.run_until_complete(func(loop, count))
+            finally:
+                loop.close()
+
+            line += f"{statistics.median(samples):>16.0f}"
+
+        print(line)
+
+if __name__ == "__main__":
+    main()
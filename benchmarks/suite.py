@@ -0,0 +1,244 @@
+"""
+Benchmarks for the IPC marshalling layer and full dispatch round trips
+against services served by nx.sim.
+
+Each case is reported in ns/op and allocations/op, where an allocation
+is a call to one of Python's allocators. Results can be saved as JSON
+and compared against a previous run:
+
+    python build.py build_ext --inplace
+    python -m benchmarks.suite --save baseline.json
+    python -m benchmarks.suite --baseline baseline.json
+
+When comparing, the exit status is 1 if any case got slower by more
+than --threshold percent. Use --filter to only run cases whose name
+contains the given string.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import timeit
+from ctypes import *
+
+import _nx
+
+from nx import arm, sf, sim
+from nx.sf import cmif, hipc, server
+from nx.services import ServiceManager
+from nx.types import Result
+
+buffer_kinds = {
+    "in map alias":   sf.BufferAttr.In  | sf.BufferAttr.HipcMapAlias,
+    "out map alias":  sf.BufferAttr.Out | sf.BufferAttr.HipcMapAlias,
+    "in pointer":     sf.BufferAttr.In  | sf.BufferAttr.HipcPointer,
+    "out pointer":    sf.BufferAttr.Out | sf.BufferAttr.HipcPointer,
+    "out fixed":      sf.BufferAttr.Out | sf.BufferAttr.HipcPointer | sf.BufferAttr.FixedSize.value,
+    "in auto":        sf.BufferAttr.In  | sf.BufferAttr.HipcAutoSelect,
+    "out auto":       sf.BufferAttr.Out | sf.BufferAttr.HipcAutoSelect,
+}
+
+read_data = bytes(0x100000)
+
+class Counter(server.Object):
+    @server.command(0)
+    def get(self, ctx):
+        return c_uint32(0)
+
+class Bench(server.Object):
+    @server.command(0)
+    def value(self, ctx):
+        return ctx.data[:4]
+
+    @server.command(1)
+    def copy(self, ctx):
+        ctx.recv_buffer(0)[:] = ctx.send_buffer(0)
+
+    @server.command(2)
+    def open_counter(self, ctx):
+        ctx.out_objects.append(Counter())
+
+    @server.command(3)
+    def read(self, ctx):
+        buf = ctx.recv_buffer(0)
+        buf[:] = read_data[:len(buf)]
+
+class BenchService(sf.Service):
+    name = "bench"
+
+    cmd_value = sf.Command(0, c_uint32, c_uint32)
+
+class DomainBenchService(BenchService):
+    domain = True
+
+def marshalling_cases():
+    base = arm.ipc_buffer()
+    buf = sf.Buffer((c_char * 0x40)(), 0x40)
+
+    yield "hipc.Request", lambda: hipc.Request(base,
+        type = cmif.CommandType.Request,
+        num_data_words = 8,
+    )
+
+    yield "hipc.Request handles", lambda: hipc.Request(base,
+        type = cmif.CommandType.Request,
+        num_data_words = 8,
+        send_pid = True,
+        num_copy_handles = 2,
+    )
+
+    for kind, attr in buffer_kinds.items():
+        def make_request(attr=attr):
+            fmt = cmif.RequestFormat(request_id=1, data_size=4, server_pointer_size=0x500)
+            fmt.process_buffer(attr)
+
+            req = cmif.Request(base, fmt)
+            req.process_buffer(buf, attr)
+
+        yield f"cmif.Request {kind}", make_request
+
+    resp = bytearray(arm.ipc_buffer_size)
+    server.write_response(resp, Result(0), c_uint64(1))
+
+    domain_resp = bytearray(arm.ipc_buffer_size)
+    server.write_response(domain_resp, Result(0), c_uint64(1), is_domain=True, objects=(2,))
+
+    handles_resp = bytearray(arm.ipc_buffer_size)
+    server.write_response(handles_resp, Result(0), c_uint64(1), copy_handles=(1,), move_handles=(2,))
+
+    yield "hipc.Response", lambda: hipc.Response(resp)
+    yield "hipc.Response handles", lambda: hipc.Response(handles_resp)
+    yield "cmif.Response", lambda: cmif.Response(resp, False, 8)
+    yield "cmif.Response domain", lambda: cmif.Response(domain_resp, True, 8)
+
+def dispatch_cases():
+    kernel = sim.Kernel().install()
+    kernel.register_service("bench", Bench)
+
+    sf.Service.sm = ServiceManager()
+
+    srv = BenchService()
+    domain_srv = DomainBenchService()
+
+    src = sf.Buffer((c_char * 0x40)(), 0x40)
+    dst = sf.Buffer((c_char * 0x40)(), 0x40)
+    attrs = (sf.BufferAttr.In | sf.BufferAttr.HipcMapAlias, sf.BufferAttr.Out | sf.BufferAttr.HipcMapAlias)
+
+    for path, accel in (("python", False), ("_nx", True)):
+        def use(accel=accel):
+            sf.Service.use_accel = accel
+
+        for name, s in (("", srv), (" domain", domain_srv)):
+            yield f"dispatch value{name} {path}", use, lambda s=s: s.dispatch(0, c_uint32(1), c_uint32).out
+            yield f"Command value{name} {path}", use, lambda s=s: s.cmd_value(c_uint32(1)).out
+            yield f"dispatch buffers{name} {path}", use, lambda s=s: s.dispatch(1, buffers=[(src, attrs[0]), (dst, attrs[1])])
+            yield f"sub-object open/close{name} {path}", use, lambda s=s: s.dispatch(2, out_num_objects=1).objects[0].close()
+
+        def open_close():
+            BenchService().close()
+
+        yield f"session open/close {path}", use, open_close
+
+        for pool_name, pool in (("fresh", None), ("pooled", sf.transfer.default_pool)):
+            def use_pool(accel=accel, pool=pool):
+                use(accel)
+                sf.Service.transfer_pool = pool
+
+            for size_name, size in (("64K", 0x10000), ("1M", 0x100000)):
+                yield f"dispatch read {size_name} {pool_name} {path}", use_pool, lambda size=size: srv.dispatch(3, buffers=[(size, attrs[1])]).buffers
+
+def run_case(func, number, repeat):
+    times = timeit.repeat(func, number=number, repeat=repeat)
+    ns = min(times) / number * 1e9
+
+    allocations = _nx.hostAllocationCount()
+    for i in range(number):
+        func()
+    allocations = _nx.hostAllocationCount() - allocations
+
+    return ns, allocations / number
+
+def calibrate(number):
+    """
+    The allocations made by the measurement itself.
+    """
+
+    def nop():
+        pass
+
+    return run_case(nop, number, 1)[1]
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for nx.sf")
+    parser.add_argument("--number", type=int, default=2000, help="calls per measurement")
+    parser.add_argument("--repeat", type=int, default=5, help="measurements per case, the fastest is kept")
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results saved with --save")
+    parser.add_argument("--threshold", type=float, default=10, help="percent slowdown counted as a regression")
+
+    args = parser.parse_args(args)
+
+    overhead = calibrate(args.number)
+
+    cases = [(name, None, func) for name, func in marshalling_cases()]
+    cases += list(dispatch_cases())
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    regressions = []
+
+    header = f"{'case':<40}{'ns/op':>12}{'allocs/op':>12}"
+    if baseline is not None:
+        header += f"{'baseline':>12}{'change':>10}"
+
+    print(header)
+
+    for name, setup, func in cases:
+        if args.filter not in name:
+            continue
+
+        if setup is not None:
+            setup()
+
+        ns, allocations = run_case(func, args.number, args.repeat)
+        allocations = max(allocations - overhead, 0)
+
+        results[name] = {"ns": ns, "allocations": allocations}
+
+        line = f"{name:<40}{ns:>12.0f}{allocations:>12.1f}"
+
+        if baseline is not None and name in baseline:
+            base_ns = baseline[name]["ns"]
+            change = (ns - base_ns) / base_ns * 100
+
+            line += f"{base_ns:>12.0f}{change:>+9.1f}%"
+
+            if change > args.threshold:
+                regressions.append(name)
+                line += "  REGRESSION"
+
+        print(line)
+
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump({
+                "python": sys.version,
+                "platform": platform.platform(),
+                "number": args.number,
+                "results": results,
+            }, f, indent=4)
+
+    if regressions:
+        print(f"\n{len(regressions)} case(s) slower than the baseline by more than {args.threshold}%")
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""
+Measures Service.dispatch throughput with several Python threads
+sending requests at once.
+
+"dispatch" only sends requests, which on the host build of _nx are
+answered immediately. "slow server" additionally sleeps for 1 ms in
+svcSleepThread per call, standing in for a server that takes a while
+to reply. Blocking syscalls release the GIL, so its throughput should
+scale with the number of threads.
+
+Run from the repository root against a host build of _nx:
+
+    python build.py build_ext --inplace
+    python -m benchmarks.threads
+"""
+
+import threading
+import time
+from ctypes import *
+
+from nx import sf
+from nx.kernel import svc
+
+def run(num_threads, calls, work):
+    srv = sf.Service(1)
+    barrier = threading.Barrier(num_threads + 1)
+
+    def worker():
+        barrier.wait()
+
+        for i in range(calls):
+            work(srv)
+
+    threads = [threading.Thread(target=worker) for i in range(num_threads)]
+    for t in threads:
+        t.start()
+
+    barrier.wait()
+    start = time.perf_counter()
+
+    for t in threads:
+        t.join()
+
+    return num_threads * calls / (time.perf_counter() - start)
+
+def dispatch(srv):
+    srv.dispatch(0, c_uint32(1), c_uint32)
+
+def slow_server(srv):
+    srv.dispatch(0, c_uint32(1), c_uint32)
+    svc.sleep_thread(1000000)
+
+def main():
+    cases = {
+        "dispatch":    (dispatch, 20000),
+        "slow server": (slow_server, 200),
+    }
+
+    print(f"{'workload':<14}{'threads':>8}{'calls/s':>12}")
+
+    for name, (work, calls) in cases.items():
+        for num_threads in (1, 2, 4, 8):
+            rate = run(num_threads, calls, work)
+
+            print(f"{name:<14}{num_threads:>8}{rate:>12.0f}")
+
+if __name__ == "__main__":
+    main()
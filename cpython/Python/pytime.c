@@ -7,6 +7,10 @@
 #include <mach/mach_time.h>   /* mach_absolute_time(), mach_timebase_info() */
 #endif
 
+#ifdef __SWITCH__
+#include <switch/arm/counter.h>   /* armGetSystemTick(), armTicksToNs() */
+#endif
+
 #define _PyTime_check_mul_overflow(a, b) \
     (assert(b > 0), \
      (_PyTime_t)(a) < _PyTime_MIN / (_PyTime_t)(b) \
@@ -877,6 +881,18 @@ pymonotonic(_PyTime_t *tp, _Py_clock_info_t *info, int raise)
         info->adjustable = 0;
     }
 
+#elif defined(__SWITCH__)
+    /* Read straight from the counter register, without going
+       through newlib's clock_gettime() */
+    *tp = (_PyTime_t)armTicksToNs(armGetSystemTick());
+
+    if (info) {
+        info->implementation = "armGetSystemTick()";
+        info->monotonic = 1;
+        info->resolution = 1.0 / armGetSystemTickFreq();
+        info->adjustable = 0;
+    }
+
 #else
     struct timespec ts;
 #ifdef CLOCK_HIGHRES
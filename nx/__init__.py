@@ -1 +1 @@
-from . import arm, kernel, services, sf, types, util
\ No newline at end of file
+from . import arm, kernel, loop, services, sf, types, util
\ No newline at end of file
@@ -1,6 +1,31 @@
+import threading
 from ctypes import *
 
 import _nx
 
+ipc_buffer_size = 0x100
+
+_local = threading.local()
+
 def tls():
-    return cast(_nx.armGetTls(), POINTER(c_char))
\ No newline at end of file
+    return cast(_nx.armGetTls(), POINTER(c_char))
+
+def ipc_buffer():
+    """
+    Returns a writable memoryview of the IPC message area
+    at the start of the current thread's TLS.
+    """
+
+    try:
+        return _local.ipc_buffer
+    except AttributeError:
+        view = memoryview((c_ubyte * ipc_buffer_size).from_address(_nx.armGetTls())).cast("B")
+        _local.ipc_buffer = view
+
+        return view
+
+def get_system_tick():
+    return _nx.armGetSystemTick()
+
+def get_system_tick_freq():
+    return _nx.armGetSystemTickFreq()
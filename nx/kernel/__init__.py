@@ -2,7 +2,18 @@ from ..types import Result
 
 def result(desc_str):
     real_desc = {
-        "NotFound": 121,
+        "InvalidSize":    101,
+        "InvalidAddress": 102,
+        "InvalidHandle":  114,
+        "TimedOut":       117,
+        "Cancelled":      118,
+        "NotFound":       121,
+        "SessionClosed":  123,
+        "InvalidState":   125,
     }[desc_str]
 
-    return Result(module=1, description=real_desc)
\ No newline at end of file
+    return Result(module=1, description=real_desc)
+
+from .sync import Event, wait, cancel, current_thread
+from .memory import Permission, SharedMemory, TransferMemory
+from .tick import ticks, ticks_to_ns, ns_to_ticks
@@ -0,0 +1,199 @@
+"""
+Shared memory and transfer memory, for exchanging bulk data with
+another process through a single mapping instead of per request.
+
+Both are sent to the other process as copy handles, e.g. with
+Service.dispatch(in_handles=[shm]). Mapped memory is accessed through
+view, a memoryview, or by indexing the object itself, and view can
+also be passed as a buffer. Views must not be used once the memory
+is unmapped.
+"""
+
+import enum
+from ctypes import *
+
+from .. import util
+from ..types import ResultException
+
+from . import svc
+
+page_size = 0x1000
+
+class Permission(enum.IntFlag):
+    R        = util.bit(0)
+    W        = util.bit(1)
+    X        = util.bit(2)
+    RW       = R | W
+    DontCare = util.bit(28)
+
+class MappedMemory:
+    handle = 0
+    address = 0
+    view = None
+
+    own_handle = True
+
+    @property
+    def mapped(self):
+        return self.view is not None
+
+    @property
+    def closed(self):
+        return self.handle == 0
+
+    def make_view(self, perm):
+        view = memoryview((c_char * self.size).from_address(self.address)).cast("B")
+        if not perm & Permission.W:
+            view = view.toreadonly()
+
+        self.view = view
+
+    def drop_view(self):
+        # Released so that it can't be used after unmapping, unless
+        # something still holds a buffer exported from it, in which
+        # case that's up to whatever holds it
+        try:
+            self.view.release()
+        except BufferError:
+            pass
+
+        self.view = None
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        return self.view[key]
+
+    def __setitem__(self, key, value):
+        self.view[key] = value
+
+    def __del__(self):
+        try:
+            self.close()
+        except ResultException:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class SharedMemory(MappedMemory):
+    """
+    Memory mapped into both this process and another, with
+    perm for this one. Received handles are mapped with
+    map, and create makes new shared memory already mapped.
+    """
+
+    def __init__(self, handle, size, perm=Permission.RW):
+        self.handle = handle
+        self.size = util.align(size, page_size)
+        self.perm = Permission(perm)
+
+    @classmethod
+    def create(cls, size, local_perm=Permission.RW, remote_perm=Permission.R):
+        size = util.align(size, page_size)
+
+        shm = cls(svc.create_shared_memory(size, local_perm, remote_perm), size, local_perm)
+        shm.map()
+
+        return shm
+
+    def map(self):
+        if self.mapped:
+            return
+
+        self.address = svc.map_shared_memory(self.handle, self.size, self.perm)
+        self.make_view(self.perm)
+
+    def unmap(self):
+        if not self.mapped:
+            return
+
+        self.drop_view()
+
+        svc.unmap_shared_memory(self.handle, self.address, self.size)
+        self.address = 0
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.unmap()
+
+        if self.own_handle:
+            svc.close_handle(self.handle)
+
+        self.handle = 0
+
+class TransferMemory(MappedMemory):
+    """
+    Memory of one process lent to another.
+
+    create allocates memory here and lends it. While it's lent, this
+    process can only access it as perm allows, so its view is only
+    available with Permission.R, read-only. The process it was sent to
+    maps it with map, given the same perm, and can write to it.
+    """
+
+    def __init__(self, handle, size, perm=Permission(0)):
+        self.handle = handle
+        self.size = util.align(size, page_size)
+        self.perm = Permission(perm)
+
+        # The lent memory, when this process is the owner
+        self.memory = None
+
+    @classmethod
+    def create(cls, size, perm=Permission(0)):
+        size = util.align(size, page_size)
+        memory = util.aligned_array(size, page_size)
+
+        tmem = cls(svc.create_transfer_memory(addressof(memory), size, perm), size, perm)
+        tmem.memory = memory
+        tmem.address = addressof(memory)
+
+        if perm & Permission.R:
+            tmem.make_view(Permission.R)
+
+        return tmem
+
+    @property
+    def mapped(self):
+        return self.memory is None and self.view is not None
+
+    def map(self):
+        if self.memory is not None or self.mapped:
+            return
+
+        # perm has to match the owner's, the mapping itself is always writable
+        self.address = svc.map_transfer_memory(self.handle, self.size, self.perm)
+        self.make_view(Permission.RW)
+
+    def unmap(self):
+        if not self.mapped:
+            return
+
+        self.drop_view()
+
+        svc.unmap_transfer_memory(self.handle, self.address, self.size)
+        self.address = 0
+
+    def close(self):
+        """
+        Closes the handle. The owner only gets full access to the memory
+        back once the other process has unmapped it too, so it should be
+        closed after that, e.g. after the session it was sent on.
+        """
+
+        if self.closed:
+            return
+
+        self.unmap()
+
+        if self.own_handle:
+            svc.close_handle(self.handle)
+
+        self.handle = 0
@@ -8,6 +8,15 @@ def send_sync_request(h):
     if result.failed:
         raise ResultException(result)
 
+def send_async_request_with_user_buffer(buf, size, h):
+    result, event = _nx.svcSendAsyncRequestWithUserBuffer(buf, size, h)
+    result = Result(result)
+
+    if result.failed:
+        raise ResultException(result)
+
+    return event
+
 def connect_to_named_port(name):
     result, handle = _nx.svcConnectToNamedPort(name)
     result = Result(result)
@@ -17,5 +26,167 @@ def connect_to_named_port(name):
 
     return handle
 
+def wait_synchronization(handles, timeout=-1):
+    result, index = _nx.svcWaitSynchronization(handles, timeout)
+    result = Result(result)
+
+    if result.failed:
+        raise ResultException(result)
+
+    return index
+
+def reply_and_receive(handles, reply_target=0, timeout=-1):
+    """
+    Returns the index of the handle that was signaled. If receiving fails,
+    the index of the handle it failed for is set on the exception, e.g.
+    the session whose client was closed.
+    """
+
+    result, index = _nx.svcReplyAndReceive(handles, reply_target, timeout)
+    result = Result(result)
+
+    if result.failed:
+        e = ResultException(result)
+        e.index = index
+
+        raise e
+
+    return index
+
+def accept_session(port):
+    result, session = _nx.svcAcceptSession(port)
+    result = Result(result)
+
+    if result.failed:
+        raise ResultException(result)
+
+    return session
+
+def create_session():
+    """
+    Returns the (server, client) handles of a new session.
+    """
+
+    result, server, client = _nx.svcCreateSession()
+    result = Result(result)
+
+    if result.failed:
+        raise ResultException(result)
+
+    return server, client
+
+def cancel_synchronization(thread):
+    result = Result(_nx.svcCancelSynchronization(thread))
+
+    if result.failed:
+        raise ResultException(result)
+
+def create_event():
+    """
+    Returns the (writable, readable) handles of a new event.
+    """
+
+    result, writable, readable = _nx.svcCreateEvent()
+    result = Result(result)
+
+    if result.failed:
+        raise ResultException(result)
+
+    return writable, readable
+
+def signal_event(h):
+    result = Result(_nx.svcSignalEvent(h))
+
+    if result.failed:
+        raise ResultException(result)
+
+def clear_event(h):
+    result = Result(_nx.svcClearEvent(h))
+
+    if result.failed:
+        raise ResultException(result)
+
+def reset_signal(h):
+    result = Result(_nx.svcResetSignal(h))
+
+    if result.failed:
+        raise ResultException(result)
+
+def create_transfer_memory(address, size, perm):
+    result, handle = _nx.svcCreateTransferMemory(address, size, perm)
+    result = Result(result)
+
+    if result.failed:
+        raise ResultException(result)
+
+    return handle
+
+def create_shared_memory(size, local_perm, remote_perm):
+    result, handle = _nx.svcCreateSharedMemory(size, local_perm, remote_perm)
+    result = Result(result)
+
+    if result.failed:
+        raise ResultException(result)
+
+    return handle
+
+def map_shared_memory(h, size, perm):
+    """
+    Maps the shared memory h somewhere free in the
+    address space, returning the address.
+    """
+
+    result, address = _nx.shmemMap(h, size, perm)
+    result = Result(result)
+
+    if result.failed:
+        raise ResultException(result)
+
+    return address
+
+def unmap_shared_memory(h, address, size):
+    result = Result(_nx.shmemUnmap(h, address, size))
+
+    if result.failed:
+        raise ResultException(result)
+
+def map_transfer_memory(h, size, perm):
+    """
+    Maps the transfer memory h somewhere free in the
+    address space, returning the address.
+    """
+
+    result, address = _nx.tmemMap(h, size, perm)
+    result = Result(result)
+
+    if result.failed:
+        raise ResultException(result)
+
+    return address
+
+def unmap_transfer_memory(h, address, size):
+    result = Result(_nx.tmemUnmap(h, address, size))
+
+    if result.failed:
+        raise ResultException(result)
+
+def set_thread_core_mask(thread, core_id, affinity_mask):
+    result = Result(_nx.svcSetThreadCoreMask(thread, core_id, affinity_mask))
+
+    if result.failed:
+        raise ResultException(result)
+
+def close_handle(h):
+    result = Result(_nx.svcCloseHandle(h))
+
+    if result.failed:
+        raise ResultException(result)
+
+def get_current_thread_handle():
+    return _nx.threadGetCurHandle()
+
 def sleep_thread(nano):
-    _nx.svcSleepThread(nano)
\ No newline at end of file
+    _nx.svcSleepThread(nano)
+
+def get_system_tick():
+    return _nx.svcGetSystemTick()
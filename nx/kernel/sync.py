@@ -0,0 +1,119 @@
+"""
+Waiting on kernel objects from threads, without polling.
+
+Waits release the GIL while blocked, so other threads keep running,
+and a thread waiting in wait can be woken early with cancel.
+"""
+
+from ..types import ResultException
+
+from . import result, svc
+from .waiter import max_wait_handles
+
+def wait(objects, timeout=None):
+    """
+    Waits for one of objects, each either a handle or an object
+    with a handle attribute like Event, to be signaled. Returns
+    the index of the one that was, or None once timeout seconds
+    have passed. At most max_wait_handles can be waited on at once.
+
+    Raises ResultException with Cancelled if the thread is
+    woken with cancel.
+    """
+
+    handles = [getattr(obj, "handle", obj) for obj in objects]
+
+    if len(handles) > max_wait_handles:
+        raise ValueError(f"Cannot wait on more than {max_wait_handles} handles at once")
+
+    if timeout is None:
+        timeout = -1
+    else:
+        timeout = max(int(timeout * 1e9), 0)
+
+    try:
+        return svc.wait_synchronization(handles, timeout)
+    except ResultException as e:
+        if e.result == result("TimedOut"):
+            return None
+
+        raise e
+
+def current_thread():
+    """
+    The handle of the calling thread, for cancel.
+    """
+
+    return svc.get_current_thread_handle()
+
+def cancel(thread):
+    """
+    Wakes thread, a handle from current_thread, from the wait it is
+    in, or the next one it starts if it isn't waiting.
+    """
+
+    svc.cancel_synchronization(thread)
+
+class Event:
+    """
+    A kernel event, signaled and cleared through its writable
+    handle and waited on through its readable one, handle.
+
+    autoclear events are cleared by the wait that sees them
+    signaled, so each signal only wakes a single waiter.
+    """
+
+    def __init__(self, autoclear=False):
+        self.writable_handle, self.handle = svc.create_event()
+        self.autoclear = autoclear
+
+    @property
+    def closed(self):
+        return self.handle == 0
+
+    def signal(self):
+        svc.signal_event(self.writable_handle)
+
+    def clear(self):
+        svc.clear_event(self.writable_handle)
+
+    def wait(self, timeout=None):
+        """
+        Returns whether the event was signaled
+        within timeout seconds.
+        """
+
+        while True:
+            if wait((self.handle,), timeout) is None:
+                return False
+
+            if not self.autoclear:
+                return True
+
+            try:
+                svc.reset_signal(self.handle)
+                return True
+            except ResultException as e:
+                # Another waiter cleared it first
+                if e.result != result("InvalidState"):
+                    raise e
+
+    def close(self):
+        if self.closed:
+            return
+
+        svc.close_handle(self.writable_handle)
+        svc.close_handle(self.handle)
+
+        self.writable_handle = 0
+        self.handle = 0
+
+    def __del__(self):
+        if hasattr(self, "handle"):
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,22 @@
+"""
+The system tick, a counter that runs at a fixed frequency from boot.
+
+ticks reads the counter register directly, without a supervisor call
+or IPC to the time service, so it's cheap enough to time single
+requests and frames with. time.monotonic and time.perf_counter are
+backed by the same counter.
+"""
+
+import _nx
+
+# Ticks per second, 19.2 MHz on the Switch
+frequency = _nx.armGetSystemTickFreq()
+
+# Bound directly, since it's called around whatever is being timed
+ticks = _nx.armGetSystemTick
+
+def ticks_to_ns(ticks):
+    return ticks * 1000000000 // frequency
+
+def ns_to_ticks(ns):
+    return ns * frequency // 1000000000
@@ -0,0 +1,112 @@
+import threading
+import weakref
+
+from ..types import ResultException
+
+from . import result, svc
+
+# The most handles svcWaitSynchronization accepts at once
+max_wait_handles = 0x40
+
+class HandleWaiter:
+    """
+    Waits for kernel handles to be signaled on behalf of an
+    asyncio event loop.
+
+    A single background thread waits on every outstanding handle
+    at once with svcWaitSynchronization, and is woken with
+    svcCancelSynchronization whenever a handle is added. The
+    thread only runs while there are handles to wait on.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.thread = None
+        self.thread_handle = None
+
+    def wait(self, handle):
+        """
+        Returns a future that resolves to handle once it is signaled.
+        """
+
+        fut = self.loop.create_future()
+
+        with self.lock:
+            self.futures[handle] = fut
+
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            elif self.thread_handle is not None:
+                svc.cancel_synchronization(self.thread_handle)
+
+        return fut
+
+    def run(self):
+        with self.lock:
+            self.thread_handle = svc.get_current_thread_handle()
+
+        while True:
+            with self.lock:
+                if not self.futures:
+                    self.thread = None
+                    self.thread_handle = None
+                    return
+
+                handles = list(self.futures)[:max_wait_handles]
+
+            try:
+                index = svc.wait_synchronization(handles)
+            except ResultException as e:
+                if e.result == result("Cancelled"):
+                    continue
+
+                with self.lock:
+                    futures = [self.futures.pop(h) for h in handles]
+
+                for fut in futures:
+                    self.loop.call_soon_threadsafe(self.set_exception, fut, e)
+
+                continue
+
+            handle = handles[index]
+
+            with self.lock:
+                fut = self.futures.pop(handle)
+
+            self.loop.call_soon_threadsafe(self.set_result, fut, handle)
+
+    @staticmethod
+    def set_result(fut, value):
+        if not fut.done():
+            fut.set_result(value)
+
+    @staticmethod
+    def set_exception(fut, exc):
+        if not fut.done():
+            fut.set_exception(exc)
+
+_waiters = weakref.WeakKeyDictionary()
+
+def get_waiter(loop):
+    waiter = _waiters.get(loop)
+    if waiter is None:
+        waiter = HandleWaiter(loop)
+        _waiters[loop] = waiter
+
+    return waiter
+
+def wait(loop, handle):
+    """
+    Returns a future that resolves to handle once it is signaled, waited
+    on by loop itself if it can, like nx.loop.HorizonEventLoop.
+    """
+
+    wait_handle = getattr(loop, "wait_handle", None)
+    if wait_handle is not None:
+        return wait_handle(handle)
+
+    return get_waiter(loop).wait(handle)
@@ -0,0 +1,376 @@
+"""
+An asyncio event loop for Horizon, built around kernel handles.
+
+HorizonEventLoop's core wait is svcWaitSynchronization over the
+handles registered with it, like events, IPC sessions and server
+ports. Other threads wake it by signaling an event instead of writing
+to a socket, and its timers run on the system tick.
+
+Sockets are still waited on with the platform's selector, from a
+helper thread that signals an event the loop waits on along with its
+handles. When sockets are ready already, they're picked up without
+involving the helper. Either way, nothing runs while nothing is ready.
+
+    asyncio.set_event_loop_policy(nx.loop.HorizonEventLoopPolicy())
+"""
+
+import selectors
+import socket
+import threading
+from asyncio import events, selector_events
+
+from .kernel import result, sync, tick
+from .kernel.waiter import max_wait_handles
+from .types import ResultException
+
+class SocketPoller:
+    """
+    Waits on the sockets registered with selector from a helper
+    thread, between start and finish, signaling event once one of
+    them is ready.
+    """
+
+    def __init__(self, selector):
+        self.selector = selector
+        self.event = sync.Event()
+
+        # Interrupts the helper when the loop is done waiting first
+        self.wake_recv, self.wake_send = socket.socketpair()
+        self.wake_recv.setblocking(False)
+        self.wake_send.setblocking(False)
+
+        selector.register(self.wake_recv, selectors.EVENT_READ)
+
+        self.cond = threading.Condition()
+        self.polling = False
+        self.closing = False
+        self.ready = []
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.polling:
+                    self.cond.wait()
+
+                if self.closing:
+                    return
+
+            ready = self.selector.select()
+
+            with self.cond:
+                self.ready = ready
+                self.polling = False
+
+                self.event.signal()
+                self.cond.notify_all()
+
+    def start(self):
+        with self.cond:
+            self.polling = True
+            self.cond.notify_all()
+
+    def finish(self):
+        """
+        Stops waiting, returning the events of the sockets that are ready.
+        """
+
+        with self.cond:
+            if self.polling:
+                self.wake_send.send(b"\0")
+
+                while self.polling:
+                    self.cond.wait()
+
+            ready = self.ready
+            self.ready = []
+
+            self.event.clear()
+
+        self.drain()
+
+        return [(key, mask) for key, mask in ready if key.fileobj is not self.wake_recv]
+
+    def drain(self):
+        try:
+            while self.wake_recv.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        with self.cond:
+            self.closing = True
+            self.polling = True
+            self.cond.notify_all()
+
+        self.wake_send.send(b"\0")
+        self.thread.join()
+
+        self.selector.unregister(self.wake_recv)
+        self.wake_recv.close()
+        self.wake_send.close()
+
+        self.event.close()
+
+class HandleSelector(selectors.BaseSelector):
+    """
+    A selector over sockets and kernel handles. Sockets are registered
+    as with any selector, and handles with add_handle. select returns
+    the ready sockets and leaves the ready handles, along with their
+    data, in ready_handles.
+    """
+
+    def __init__(self):
+        self.handles = {}
+        self.ready_handles = []
+
+        self.wakeup = sync.Event()
+
+        self.sockets = selectors.DefaultSelector()
+        self.poller = None
+
+    def register(self, fileobj, events, data=None):
+        key = self.sockets.register(fileobj, events, data)
+
+        if self.poller is None:
+            self.poller = SocketPoller(self.sockets)
+
+        return key
+
+    def unregister(self, fileobj):
+        return self.sockets.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self.sockets.modify(fileobj, events, data)
+
+    def get_map(self):
+        return self.sockets.get_map()
+
+    def add_handle(self, handle, data=None):
+        """
+        Waits on handle, returning the data it was previously added with.
+        """
+
+        # Leave room for the wakeup and poller events
+        if handle not in self.handles and len(self.handles) + 2 >= max_wait_handles:
+            raise ValueError(f"Cannot wait on more than {max_wait_handles - 2} handles")
+
+        old = self.handles.get(handle)
+        self.handles[handle] = data
+
+        return old
+
+    def remove_handle(self, handle):
+        return self.handles.pop(handle, None)
+
+    def wake(self):
+        """
+        Makes a select in progress, or the next one, return. Thread-safe.
+        """
+
+        if not self.wakeup.closed:
+            self.wakeup.signal()
+
+    def select(self, timeout=None):
+        handles = [self.wakeup.handle, *self.handles]
+        ready = []
+
+        # Besides the poller's own socket
+        polling = False
+        if len(self.sockets.get_map()) > 1:
+            ready = [(key, mask) for key, mask in self.sockets.select(0) if key.fileobj is not self.poller.wake_recv]
+
+            if ready:
+                timeout = 0
+            elif timeout is None or timeout > 0:
+                self.poller.start()
+                handles.append(self.poller.event.handle)
+
+                polling = True
+
+        try:
+            # The wakeup event only matters when the loop would block
+            if timeout == 0 and not self.handles:
+                signaled = []
+            else:
+                signaled = self.wait(handles, timeout)
+        finally:
+            if polling:
+                ready = self.poller.finish()
+
+        if self.wakeup.handle in signaled:
+            self.wakeup.clear()
+
+        self.ready_handles = [(h, self.handles[h]) for h in signaled if h in self.handles]
+
+        return ready
+
+    @staticmethod
+    def wait(handles, timeout):
+        """
+        Returns every handle that's signaled, waiting up to timeout for the first.
+        """
+
+        signaled = []
+        start = 0
+
+        while start < len(handles):
+            try:
+                index = sync.wait(handles[start:], timeout if not signaled else 0)
+            except ResultException as e:
+                # The thread was woken with nx.kernel.cancel
+                if e.result == result("Cancelled"):
+                    break
+
+                raise e
+
+            if index is None:
+                break
+
+            signaled.append(handles[start + index])
+            start += index + 1
+
+        return signaled
+
+    def close(self):
+        if self.poller is not None:
+            self.poller.close()
+            self.poller = None
+
+        self.sockets.close()
+        self.wakeup.close()
+
+        self.handles.clear()
+        self.ready_handles = []
+
+class LoopServer:
+    """
+    Serves an nx.sf.server.ServerManager's ports and sessions from the
+    loop, following the sessions it accepts and closes.
+    """
+
+    def __init__(self, loop, manager):
+        self.loop = loop
+        self.manager = manager
+        self.handles = set()
+
+    def update(self):
+        handles = set(self.manager.ports) | set(self.manager.sessions)
+
+        for handle in self.handles - handles:
+            self.loop.remove_handle_reader(handle)
+
+        for handle in handles - self.handles:
+            self.loop.add_handle_reader(handle, self.process, handle)
+
+        self.handles = handles
+
+    def process(self, handle):
+        try:
+            self.manager.process_handle(handle)
+        finally:
+            self.update()
+
+    def close(self):
+        for handle in self.handles:
+            self.loop.remove_handle_reader(handle)
+
+        self.handles = set()
+
+class HorizonEventLoop(selector_events.BaseSelectorEventLoop):
+    def __init__(self):
+        super().__init__(HandleSelector())
+
+        self._clock_resolution = 1 / tick.frequency
+
+    def time(self):
+        return tick.ticks() / tick.frequency
+
+    # The selector's wakeup event stands in for the self-pipe
+
+    def _make_self_pipe(self):
+        pass
+
+    def _close_self_pipe(self):
+        pass
+
+    def _write_to_self(self):
+        selector = self._selector
+        if selector is not None:
+            selector.wake()
+
+    def _process_events(self, event_list):
+        super()._process_events(event_list)
+
+        for handle, callback in self._selector.ready_handles:
+            if callback._cancelled:
+                self.remove_handle_reader(handle)
+            else:
+                self._add_callback(callback)
+
+    def add_handle_reader(self, handle, callback, *args):
+        """
+        Calls callback with args whenever handle is signaled.
+        """
+
+        self._check_closed()
+
+        callback = events.Handle(callback, args, self, None)
+
+        old = self._selector.add_handle(handle, callback)
+        if old is not None:
+            old.cancel()
+
+    def remove_handle_reader(self, handle):
+        if self.is_closed():
+            return False
+
+        callback = self._selector.remove_handle(handle)
+        if callback is None:
+            return False
+
+        callback.cancel()
+
+        return True
+
+    def wait_handle(self, handle):
+        """
+        Returns a future that resolves to handle once it is signaled.
+        """
+
+        fut = self.create_future()
+
+        def signaled():
+            self.remove_handle_reader(handle)
+
+            if not fut.done():
+                fut.set_result(handle)
+
+        def done(fut):
+            if fut.cancelled():
+                self.remove_handle_reader(handle)
+
+        self.add_handle_reader(handle, signaled)
+        fut.add_done_callback(done)
+
+        return fut
+
+    def add_server(self, manager):
+        """
+        Serves manager, an nx.sf.server.ServerManager, from the loop.
+        Returns a LoopServer, whose close stops serving it.
+        """
+
+        server = LoopServer(self, manager)
+        server.update()
+
+        return server
+
+class HorizonEventLoopPolicy(events.BaseDefaultEventLoopPolicy):
+    _loop_factory = HorizonEventLoop
+
+def new_event_loop():
+    return HorizonEventLoop()
@@ -1,7 +1,107 @@
+import threading
+import time
 from ctypes import *
 
 from .. import sf, kernel
 from ..types import ResultException
+from ..sf.service import close_session
+
+class SharedSession:
+    def __init__(self, handle):
+        self.handle = handle
+        self.refs = 0
+        self.idle_since = time.monotonic()
+
+class ServiceRegistry:
+    """
+    Sessions to services shared by name and reference counted.
+
+    A session stays open while it has references. Once it has none it
+    is idle, and idle sessions are closed when idle_timeout seconds
+    have passed, or never if idle_timeout is None. Idle sessions are
+    only closed by collect, which acquire calls, so that releasing a
+    session from __del__ never sends a request.
+    """
+
+    def __init__(self, sm, idle_timeout=None):
+        self.sm = sm
+        self.idle_timeout = idle_timeout
+
+        self.lock = threading.Lock()
+        self.sessions = {}
+
+    def acquire(self, name):
+        self.collect()
+
+        with self.lock:
+            entry = self.sessions.get(name)
+            if entry is None:
+                handle, _ = self.sm.get_service(name, original=True)
+
+                entry = SharedSession(handle)
+                self.sessions[name] = entry
+
+            entry.refs += 1
+
+            return entry.handle
+
+    def release(self, name):
+        with self.lock:
+            entry = self.sessions.get(name)
+            if entry is None:
+                return
+
+            entry.refs -= 1
+            if entry.refs == 0:
+                entry.idle_since = time.monotonic()
+
+    def prewarm(self, names):
+        """
+        Opens idle sessions to each service in names ahead of time.
+        """
+
+        with self.lock:
+            for name in names:
+                if name not in self.sessions:
+                    handle, _ = self.sm.get_service(name, original=True)
+                    self.sessions[name] = SharedSession(handle)
+
+    def collect(self, idle_timeout=None):
+        """
+        Closes sessions that have been idle for longer than idle_timeout,
+        which defaults to the registry's. Returns how many were closed.
+        """
+
+        if idle_timeout is None:
+            idle_timeout = self.idle_timeout
+
+            if idle_timeout is None:
+                return 0
+
+        now = time.monotonic()
+
+        with self.lock:
+            names = [name for name, entry in self.sessions.items()
+                        if entry.refs == 0 and now - entry.idle_since >= idle_timeout]
+
+            handles = [self.sessions.pop(name).handle for name in names]
+
+        for handle in handles:
+            close_session(handle)
+
+        return len(handles)
+
+    def close(self):
+        """
+        Closes every session, including ones that are still referenced.
+        """
+
+        with self.lock:
+            handles = [entry.handle for entry in self.sessions.values()]
+            self.sessions.clear()
+
+        for handle in handles:
+            close_session(handle)
 
 class ServiceManager(sf.Service):
     class ServiceName(LittleEndianStructure):
@@ -9,7 +109,56 @@ class ServiceManager(sf.Service):
             ("name", c_char * 8)
         ]
 
-    def __init__(self):
+    class RegisterServiceIn(LittleEndianStructure):
+        _fields_ = [
+            ("name",         c_char * 8),
+            ("is_light",     c_bool),
+            ("max_sessions", c_int32)
+        ]
+
+    class MitmProcessInfo(LittleEndianStructure):
+        _fields_ = [
+            ("process_id",      c_uint64),
+            ("program_id",      c_uint64),
+            ("override_status", c_uint64)
+        ]
+
+    cmd_initialize = sf.Command(0, c_uint64, in_send_pid=True)
+
+    cmd_get_service_handle = sf.Command(1, ServiceName,
+        out_handle_attrs = (
+            sf.OutHandleAttr.HipcMove,
+        )
+    )
+
+    cmd_register_service = sf.Command(2, RegisterServiceIn,
+        out_handle_attrs = (
+            sf.OutHandleAttr.HipcMove,
+        )
+    )
+
+    cmd_unregister_service = sf.Command(3, ServiceName)
+
+    cmd_atmosphere_install_mitm = sf.Command(65000, ServiceName,
+        out_handle_attrs = (
+            sf.OutHandleAttr.HipcMove,
+            sf.OutHandleAttr.HipcMove,
+        )
+    )
+
+    cmd_atmosphere_uninstall_mitm = sf.Command(65001, ServiceName)
+
+    cmd_atmosphere_acknowledge_mitm_session = sf.Command(65003, ServiceName, MitmProcessInfo,
+        out_handle_attrs = (
+            sf.OutHandleAttr.HipcMove,
+        )
+    )
+
+    cmd_atmosphere_has_mitm = sf.Command(65004, ServiceName, c_bool)
+
+    cmd_is_service_registered = sf.Command(65100, ServiceName, c_bool)
+
+    def __init__(self, prewarm=(), idle_timeout=None):
         while True:
             try:
                 handle = kernel.svc.connect_to_named_port("sm:")
@@ -23,6 +172,7 @@ class ServiceManager(sf.Service):
         super().__init__(handle)
 
         self.overrides = {}
+        self.registry = ServiceRegistry(self, idle_timeout)
 
         try:
             self.get_service("")
@@ -30,51 +180,100 @@ class ServiceManager(sf.Service):
             if e.result == 0x415:
                 self.initialize()
 
+        if prewarm:
+            self.registry.prewarm(prewarm)
+
     def initialize(self):
-        self.dispatch(0, c_uint64(),
-            in_send_pid = True,
-        )
+        self.cmd_initialize(c_uint64())
 
     def get_service(self, name, original=False):
         if not original and name in self.overrides:
             handle = self.overrides[name]
             own_handle = False
         else:
-            out = self.dispatch(1, self.ServiceName(name.encode()),
-                out_handle_attrs = (
-                    sf.OutHandleAttr.HipcMove,
-                )
-            )
+            out = self.cmd_get_service_handle(self.ServiceName(name.encode()))
 
-            handle = out["handles"][0]
+            handle = out.handles[0]
             own_handle = True
 
         return handle, own_handle
 
+    def acquire_service(self, name):
+        """
+        Like get_service, but returns a session shared through the
+        registry along with whether it has to be released with
+        release_service once it's no longer used.
+        """
+
+        if name in self.overrides:
+            return self.overrides[name], False
+
+        return self.registry.acquire(name), True
+
+    def release_service(self, name):
+        self.registry.release(name)
+
     def register_service(self, name, is_light=False, max_sessions=1):
-        class In(LittleEndianStructure):
-            _fields_ = [
-                ("name",         self.ServiceName),
-                ("is_light",     c_bool),
-                ("max_sessions", c_int32)
-            ]
-
-        out = self.dispatch(2, In(self.ServiceName(name.encode()), is_light, max_sessions),
-            out_handle_attrs = (
-                sf.OutHandleAttr.HipcMove,
-            )
-        )
+        out = self.cmd_register_service(self.RegisterServiceIn(name.encode(), is_light, max_sessions))
 
-        return out["handles"][0]
+        return out.handles[0]
 
     def unregister_service(self, name):
-        self.dispatch(3, self.ServiceName(name.encode()))
+        self.cmd_unregister_service(self.ServiceName(name.encode()))
 
     def is_service_registered(self, name):
         """
         Atmopshere extension
         """
 
-        out = self.dispatch(65100, self.ServiceName(name.encode()), c_bool)
+        out = self.cmd_is_service_registered(self.ServiceName(name.encode()))
+
+        return out.out.value
+
+    def install_mitm(self, name):
+        """
+        Atmosphere extension
+
+        Returns the port that clients of the service are sent
+        to instead, and the session sm asks whether a client
+        should be intercepted on, see nx.sf.mitm.
+        """
+
+        out = self.cmd_atmosphere_install_mitm(self.ServiceName(name.encode()))
+
+        return out.handles[0], out.handles[1]
+
+    def uninstall_mitm(self, name):
+        """
+        Atmosphere extension
+        """
+
+        self.cmd_atmosphere_uninstall_mitm(self.ServiceName(name.encode()))
+
+    def acknowledge_mitm_session(self, name):
+        """
+        Atmosphere extension
+
+        Returns the client's process info and a session to the
+        real service for the session last accepted on the mitm port.
+        """
+
+        out = self.cmd_atmosphere_acknowledge_mitm_session(self.ServiceName(name.encode()))
+
+        return out.out, out.handles[0]
+
+    def has_mitm(self, name):
+        """
+        Atmosphere extension
+        """
+
+        out = self.cmd_atmosphere_has_mitm(self.ServiceName(name.encode()))
+
+        return out.out.value
+
+    def close(self):
+        registry = getattr(self, "registry", None)
+        if registry is not None:
+            registry.close()
 
-        return out["out"].value
\ No newline at end of file
+        super().close()
@@ -25,28 +25,84 @@ class OutHandleAttr(enum.Enum):
     HipcMove = 2
 
 class Buffer:
-    def __init__(self, ptr=None, size=0):
+    """
+    Memory sent with a request.
+
+    ptr is either an address, a ctypes pointer, or an object supporting
+    the buffer protocol, like bytes, bytearray, memoryview, array, mmap
+    or a ctypes instance, whose memory is used in place. size defaults
+    to the size of that memory.
+
+    Read-only memory other than bytes is copied once, and can only be
+    sent to the server.
+    """
+
+    def __init__(self, ptr=None, size=None):
         self.ptr_orig = ptr
+        self.view = None
+        self.readonly = False
+
+        if ptr is None or isinstance(ptr, (int, _ctypes._Pointer, c_void_p)):
+            address = cast(ptr, c_void_p).value
+            nbytes = 0
+        elif isinstance(ptr, bytes):
+            # Its memory is never written, so it can be sent as it is
+            address = cast(c_char_p(ptr), c_void_p).value
+            nbytes = len(ptr)
+
+            self.readonly = True
+        else:
+            view = memoryview(ptr)
+            nbytes = view.nbytes
+
+            if view.readonly:
+                storage = (c_char * nbytes).from_buffer_copy(view if view.c_contiguous else view.tobytes())
+                self.readonly = True
+            elif view.c_contiguous:
+                storage = (c_char * nbytes).from_buffer(view)
+            else:
+                raise ValueError("Buffers must be contiguous")
 
-        ptr = cast(ptr, c_void_p).value
+            # Keeps the memory alive, and mutable objects from being resized while it's in use
+            self.storage = storage
+            self.view = memoryview(storage).cast("B")
 
-        if ptr is None:
-            ptr = 0
+            address = addressof(storage)
 
-        self.ptr = ptr
+        if address is None:
+            address = 0
+
+        if size is None:
+            size = nbytes
+
+        self.ptr = address
         self.size = size
 
     @property
     def contents(self):
-        if isinstance(self.ptr_orig, _ctypes._Pointer):
-            return self.ptr_orig.contents
-        elif isinstance(self.ptr_orig, _ctypes.Array):
-            if len(self.ptr_orig) > 0 and isinstance(self.ptr_orig[0], bytes):
-                return b"".join(self.ptr_orig)
+        """
+        The buffer's memory, as a memoryview unless
+        it was given as a ctypes pointer or instance.
+        """
 
-            return self.ptr_orig
-        else:
-            p = cast(self.ptr, POINTER(c_char))
-            return p[:self.size]
+        obj = self.ptr_orig
+
+        if isinstance(obj, _ctypes._Pointer):
+            return obj.contents
+        elif isinstance(obj, (Structure, Union, _ctypes._SimpleCData)):
+            return obj
+        elif isinstance(obj, Array) and obj._type_ is not c_char:
+            return obj
+        elif self.view is not None:
+            return self.view[:self.size]
+        elif self.ptr == 0 or self.size == 0:
+            return memoryview(b"")
+
+        return memoryview((c_char * self.size).from_address(self.ptr)).cast("B")
+
+from .service import Service, SubService, Response
+from .command import Command
+from .transfer import BufferPool, TransferPolicy
 
-from .service import Service, SubService
\ No newline at end of file
+from . import instrument
+from .instrument import stats
@@ -1,4 +1,6 @@
 import enum
+import functools
+import struct
 from ctypes import *
 
 from .. import arm
@@ -69,6 +71,21 @@ class DomainOutHeader(LittleEndianStructure):
         ("padding",         c_uint32 * 3)
     ]
 
+# The headers above, as encoded into messages
+_in_header = struct.Struct("<4sIII")
+_out_header = struct.Struct("<4sIII")
+_domain_in_header = struct.Struct("<BBHIII")
+_domain_out_header = struct.Struct("<I12x")
+
+_u16 = struct.Struct("<H")
+_u32 = struct.Struct("<I")
+
+# Sent in place of auto-select buffers that went the other way
+_null_buffer = Buffer()
+_normal_mode = hipc.BufferMode.Normal.value
+
+_zeros = memoryview(bytes(arm.ipc_buffer_size))
+
 class RequestFormat:
     def __init__(self, **kwargs):
         self.object_id = 0
@@ -126,9 +143,9 @@ class Request:
         actual_size = 16
 
         if fmt.object_id != 0:
-            actual_size += sizeof(DomainInHeader) + fmt.num_objects * sizeof(c_uint32)
+            actual_size += _domain_in_header.size + fmt.num_objects * sizeof(c_uint32)
 
-        actual_size += sizeof(InHeader) + fmt.data_size
+        actual_size += _in_header.size + fmt.data_size
         actual_size = util.align(actual_size, 2)
 
         out_pointer_size_table_offset = actual_size
@@ -151,38 +168,43 @@ class Request:
             num_move_handles = 0,
         )
 
-        self.data = util.align(self.hipc.data_words, 16)
+        # Zero the padding before the payload and the payload itself,
+        # so nothing is left in them from the last message
+        data_words = self.hipc.data_words
+        util.extend_buf_to_offset(base, data_words)
+        base[data_words : data_words + 4 * num_data_words] = _zeros[:4 * num_data_words]
+
+        self.data = util.align(data_words, 16)
 
         if fmt.object_id != 0:
-            payload_size = sizeof(InHeader) + fmt.data_size
-
-            domain_hdr = DomainInHeader(
-                type = DomainRequestType.SendMessage.value,
-                num_in_objects = fmt.num_objects,
-                data_size = payload_size,
-                object_id = fmt.object_id,
-                padding = 0,
-                token = fmt.context,
-            )
-
-            self.insert(self.data, domain_hdr)
-            self.data += sizeof(domain_hdr)
+            payload_size = _in_header.size + fmt.data_size
+
+            _domain_in_header.pack_into(base, self.data, DomainRequestType.SendMessage.value,
+                fmt.num_objects, payload_size, fmt.object_id, 0, fmt.context)
+
+            self.data += _domain_in_header.size
             self.objects = self.data + payload_size
 
-        hdr = InHeader(
-            version = 1 if fmt.context else 0,
-            command_id = fmt.request_id,
-            token = 0 if fmt.object_id else fmt.context,
-        )
+        _in_header.pack_into(base, self.data, b"SFCI", 1 if fmt.context else 0,
+            fmt.request_id, 0 if fmt.object_id else fmt.context)
 
-        self.insert(self.data, hdr)
-        self.data += sizeof(hdr)
+        self.data += _in_header.size
 
         self.out_pointer_sizes = self.hipc.data_words + out_pointer_size_table_offset
         self.server_pointer_size = fmt.server_pointer_size
 
         self.cur_in_ptr_id = 0
 
+    def copy(self, base):
+        req = type(self).__new__(type(self))
+        req.__dict__.update(self.__dict__)
+
+        req.base = base
+        req.hipc = hipc.Request.__new__(hipc.Request)
+        req.hipc.__dict__.update(self.hipc.__dict__)
+
+        return req
+
     def extend_to_offset(self, offset):
         util.extend_buf_to_offset(self.base, offset)
 
@@ -190,75 +212,59 @@ class Request:
         util.buf_insert(self.base, offset, obj)
 
     def add_object(self, obj):
-        obj_id = c_uint32(obj.object_id)
-        self.insert(self.objects, obj_id)
-
-        self.objects += sizeof(obj_id)
+        _u32.pack_into(self.base, self.objects, obj.object_id)
+        self.objects += 4
 
     def add_handle(self, h):
-        h = Handle(h)
-        self.insert(self.hipc.copy_handles, h)
-
-        self.hipc.copy_handles += sizeof(h)
+        _u32.pack_into(self.base, self.hipc.copy_handles, h)
+        self.hipc.copy_handles += sizeof(Handle)
 
     def add_in_buffer(self, buf, mode):
-        send = hipc.BufferDescriptor(buf, mode)
-        self.insert(self.hipc.send_buffers, send)
-
-        self.hipc.send_buffers += sizeof(send)
+        hipc.pack_buffer(self.base, self.hipc.send_buffers, buf.ptr, buf.size, mode)
+        self.hipc.send_buffers += hipc.buffer_descriptor_size
 
     def add_out_buffer(self, buf, mode):
-        recv = hipc.BufferDescriptor(buf, mode)
-        self.insert(self.hipc.recv_buffers, recv)
-
-        self.hipc.recv_buffers += sizeof(recv)
+        hipc.pack_buffer(self.base, self.hipc.recv_buffers, buf.ptr, buf.size, mode)
+        self.hipc.recv_buffers += hipc.buffer_descriptor_size
 
     def add_inout_buffer(self, buf, mode):
-        exch = hipc.BufferDescriptor(buf, mode)
-        self.insert(self.hipc.exch_buffers, exch)
-
-        self.hipc.exch_buffers += sizeof(exch)
+        hipc.pack_buffer(self.base, self.hipc.exch_buffers, buf.ptr, buf.size, mode)
+        self.hipc.exch_buffers += hipc.buffer_descriptor_size
 
     def add_in_pointer(self, buf):
-        send = hipc.StaticDescriptor(buf, self.cur_in_ptr_id)
-        self.cur_in_ptr_id += 1
-
-        self.insert(self.hipc.send_statics, send)
-        self.hipc.send_statics += sizeof(send)
+        hipc.pack_static(self.base, self.hipc.send_statics, self.cur_in_ptr_id, buf.ptr, buf.size)
+        self.hipc.send_statics += hipc.static_size
 
+        self.cur_in_ptr_id += 1
         self.server_pointer_size -= buf.size
 
     def add_out_fixed_pointer(self, buf):
-        recv = hipc.RecvListEntry(buf)
-        
-        self.insert(self.hipc.recv_list, recv)
-        self.hipc.recv_list += sizeof(recv)
+        hipc.pack_recv_entry(self.base, self.hipc.recv_list, buf.ptr, buf.size)
+        self.hipc.recv_list += hipc.recv_entry_size
 
         self.server_pointer_size -= buf.size
 
     def add_out_pointer(self, buf):
         self.add_out_fixed_pointer(buf)
 
-        size = c_uint16(buf.size)
-        self.insert(self.out_pointer_sizes, size)
-
-        self.out_pointer_sizes += sizeof(size)
+        _u16.pack_into(self.base, self.out_pointer_sizes, buf.size & 0xffff)
+        self.out_pointer_sizes += 2
 
     def add_in_auto_buffer(self, buf):
         if self.server_pointer_size > 0 and buf.size <= self.server_pointer_size:
             self.add_in_pointer(buf)
-            self.add_in_buffer(Buffer(), hipc.BufferMode.Normal)
+            self.add_in_buffer(_null_buffer, _normal_mode)
         else:
-            self.add_in_pointer(Buffer())
-            self.add_in_buffer(buf, hipc.BufferMode.Normal)
+            self.add_in_pointer(_null_buffer)
+            self.add_in_buffer(buf, _normal_mode)
 
     def add_out_auto_buffer(self, buf):
         if self.server_pointer_size > 0 and buf.size <= self.server_pointer_size:
             self.add_out_pointer(buf)
-            self.add_out_buffer(Buffer(), hipc.BufferMode.Normal)
+            self.add_out_buffer(_null_buffer, _normal_mode)
         else:
-            self.add_out_pointer(Buffer())
-            self.add_out_buffer(buf, hipc.BufferMode.Normal)
+            self.add_out_pointer(_null_buffer)
+            self.add_out_buffer(buf, _normal_mode)
 
     def process_buffer(self, buf, attr):
         if attr == 0:
@@ -281,11 +287,11 @@ class Request:
                 else:
                     self.add_out_pointer(buf)
         elif attr & BufferAttr.HipcMapAlias.value:
-            mode = hipc.BufferMode.Normal
+            mode = _normal_mode
             if attr & BufferAttr.HipcMapTransferAllowsNonSecure.value:
-                mode = hipc.BufferMode.NonSecure
+                mode = hipc.BufferMode.NonSecure.value
             if attr & BufferAttr.HipcMapTransferAllowsNonDevice.value:
-                mode = hipc.BufferMode.NonDevice
+                mode = hipc.BufferMode.NonDevice.value
 
             if is_in and is_out:
                 self.add_inout_buffer(buf, mode)
@@ -294,6 +300,50 @@ class Request:
             elif is_out:
                 self.add_out_buffer(buf, mode)
 
+class RequestTemplate:
+    """
+    A request with its headers already encoded, for
+    commands that are sent with the same shape repeatedly.
+
+    Only the handles, objects, buffer descriptors and
+    the payload need to be written on each instantiation.
+    """
+
+    def __init__(self, fmt):
+        base = bytearray(arm.ipc_buffer_size)
+        req = Request(base, fmt)
+
+        req.base = None
+
+        self.request = req
+        self.base = bytes(base[:req.hipc.size])
+        self.size = len(self.base)
+
+    def instantiate(self, base):
+        util.extend_buf_to_offset(base, self.size)
+        base[:self.size] = self.base
+
+        return self.request.copy(base)
+
+@functools.lru_cache(maxsize=256)
+def request_template(object_id, request_id, context, data_size, send_pid,
+                        buffer_attrs, num_objects, num_handles, server_pointer_size):
+    fmt = RequestFormat(
+        object_id = object_id,
+        request_id = request_id,
+        context = context,
+        data_size = data_size,
+        server_pointer_size = server_pointer_size,
+        num_objects = num_objects,
+        num_handles = num_handles,
+        send_pid = send_pid,
+    )
+
+    for attr in buffer_attrs:
+        fmt.process_buffer(attr)
+
+    return RequestTemplate(fmt)
+
 class Response:
     def __init__(self, base, is_domain, size):
         h = hipc.Response(base)
@@ -304,89 +354,115 @@ class Response:
 
         self.objects = -1
         if is_domain:
-            domain_hdr = DomainOutHeader.from_buffer(base, self.data)
-            self.data += sizeof(domain_hdr)
-
-            self.objects = self.data + sizeof(OutHeader) + size
+            self.data += _domain_out_header.size
+            self.objects = self.data + _out_header.size + size
 
-        hdr = OutHeader.from_buffer(base, self.data)
-        self.data += sizeof(hdr)
+        magic, version, result, token = _out_header.unpack_from(base, self.data)
+        self.data += _out_header.size
 
-        if not hdr.valid:
-            raise ValueError(f"Invalid magic for out header: {hdr.magic}")
+        if magic != b"SFCO":
+            raise ValueError(f"Invalid magic for out header: {magic}")
 
-        if hdr.result.failed:
-            raise ResultException(hdr.result)
+        if result != 0:
+            raise ResultException(Result(result))
 
         self.base = base
 
+    @classmethod
+    def from_offsets(cls, base, data, objects, copy_handles, move_handles):
+        """
+        Creates a response from offsets that have
+        already been parsed, e.g. by _nx.cmifDispatch.
+        """
+
+        res = cls.__new__(cls)
+
+        res.base = base
+        res.data = data
+        res.objects = objects
+        res.copy_handles = copy_handles
+        res.move_handles = move_handles
+
+        return res
+
     def get_object(self):
-        obj = c_uint32.from_buffer(self.base, self.objects)
-        self.objects += sizeof(obj)
+        obj, = _u32.unpack_from(self.base, self.objects)
+        self.objects += 4
 
-        return obj.value
+        return obj
 
     def get_copy_handle(self):
-        h = Handle.from_buffer(self.base, self.copy_handles)
-        self.copy_handles += sizeof(h)
+        h, = _u32.unpack_from(self.base, self.copy_handles)
+        self.copy_handles += sizeof(Handle)
 
-        return h.value
+        return h
 
     def get_move_handle(self):
-        h = Handle.from_buffer(self.base, self.move_handles)
-        self.move_handles += sizeof(h)
+        h, = _u32.unpack_from(self.base, self.move_handles)
+        self.move_handles += sizeof(Handle)
 
-        return h.value
+        return h
 
 def make_control_request(base, request_id, size):
-        actual_size = 16 + sizeof(InHeader) + size
+        actual_size = 16 + _in_header.size + size
 
         h = hipc.Request(base,
-            type = CommandType.Control.value,
+            type = CommandType.Control,
             num_data_words = (actual_size + 3) // 4,
         )
 
         data_offset = util.align(h.data_words, 16)
 
-        hdr = InHeader(
-            version = 0,
-            command_id = request_id,
-            token = 0,
-        )
-        util.buf_insert(base, data_offset, hdr)
+        _in_header.pack_into(base, data_offset, b"SFCI", 0, request_id, 0)
 
-        return data_offset + sizeof(hdr)
+        return data_offset + _in_header.size
 
 def make_close_request(base, object_id):
     if object_id != 0:
         h = hipc.Request(base,
-            type = CommandType.Request.value,
-            num_data_words = (16 + sizeof(DomainInHeader)) // 4,
+            type = CommandType.Request,
+            num_data_words = (16 + _domain_in_header.size) // 4,
         )
 
         data_offset = util.align(h.data_words, 16)
 
-        domain_hdr = DomainInHeader(
-            type=DomainRequestType.Close.value,
-            object_id = object_id,
-        )
-        util.buf_insert(base, data_offset, domain_hdr)
+        _domain_in_header.pack_into(base, data_offset, DomainRequestType.Close.value, 0, 0, object_id, 0, 0)
     else:
         hipc.Request(base,
             type = CommandType.Close
         )
 
+def convert_current_object_to_domain(handle):
+    base = arm.ipc_buffer()
+    make_control_request(base, 0, 0)
+
+    svc.send_sync_request(handle)
+
+    resp = Response(base, False, sizeof(c_uint32))
+
+    return c_uint32.from_buffer(base, resp.data).value
+
+def clone_current_object(handle, tag=None):
+    base = arm.ipc_buffer()
+
+    if tag is None:
+        make_control_request(base, 2, 0)
+    else:
+        data = make_control_request(base, 4, sizeof(c_uint32))
+        util.buf_insert(base, data, c_uint32(tag))
+
+    svc.send_sync_request(handle)
+
+    resp = Response(base, False, 0)
+
+    return resp.get_move_handle()
+
 def query_pointer_buffer_size(handle):
-    base = bytearray()
+    base = arm.ipc_buffer()
     make_control_request(base, 3, 0)
 
-    tls = arm.tls()
-    for i, v in enumerate(base):
-        tls[i] = v
-
     svc.send_sync_request(handle)
 
-    base = bytearray(tls[:0x100])
-    resp = Response(base, false, sizeof(c_uint16))
+    resp = Response(base, False, sizeof(c_uint16))
 
-    return c_uint16.from_buffer(base, resp.data).value
\ No newline at end of file
+    return c_uint16.from_buffer(base, resp.data).value
@@ -0,0 +1,120 @@
+import enum
+from ctypes import sizeof
+
+from ..types import HosVersion, Result, ResultException
+
+from .service import Response
+
+# LibnxError_IncompatSysVer
+incompatible_version = Result(module=345, description=100)
+
+class Command:
+    """
+    Declares an IPC command on a Service subclass.
+
+    Everything that only depends on the declaration is resolved
+    once, when the class is created, and the attribute is replaced
+    with a function specialized for the command:
+
+        srv.command(in_data=None, buffers=(), objects=(), handles=())
+
+    which sends the request and returns an nx.sf.Response.
+    buffers holds one buffer per attribute in buffer_attrs, and
+    in_data has to be the size of in_type, or a TypeError is raised.
+    """
+
+    def __init__(self, request_id, in_type=None, out_type=None, *,
+                    context=0, buffer_attrs=(), in_send_pid=False,
+                    out_num_objects=0, out_handle_attrs=(), version=None):
+        self.request_id = request_id
+        self.in_type = in_type
+        self.out_type = out_type
+        self.context = context
+        self.buffer_attrs = tuple(attr.value if isinstance(attr, enum.Enum) else attr for attr in buffer_attrs)
+        self.in_send_pid = in_send_pid
+        self.out_num_objects = out_num_objects
+        self.out_handle_attrs = tuple(out_handle_attrs)
+
+        if version is not None and not isinstance(version, HosVersion.Range):
+            version = HosVersion.Range(*version)
+
+        self.version = version
+
+    def __set_name__(self, owner, name):
+        func = self.specialize()
+
+        func.__name__ = name
+        func.__qualname__ = f"{owner.__qualname__}.{name}"
+        func.command = self
+
+        setattr(owner, name, func)
+
+    def specialize(self):
+        request_id = self.request_id
+        context = self.context
+        send_pid = self.in_send_pid
+        out_type = self.out_type
+        out_num_objects = self.out_num_objects
+        out_handle_attrs = self.out_handle_attrs
+
+        if self.in_type is None:
+            in_size = 0
+        elif isinstance(self.in_type, int):
+            in_size = self.in_type
+        else:
+            in_size = sizeof(self.in_type)
+
+        # Anything else is checked by size, like dispatch would send it
+        if isinstance(self.in_type, type):
+            exact_in_type = self.in_type
+        else:
+            exact_in_type = type(None)
+
+        if out_type is None:
+            out_size = 0
+        elif isinstance(out_type, int):
+            out_size = out_type
+        else:
+            out_size = sizeof(out_type)
+
+        buffer_attrs = self.buffer_attrs
+
+        if self.version is None:
+            version_low = version_high = None
+        else:
+            version_low, version_high = self.version.a, self.version.b
+
+        def command(srv, in_data=None, buffers=(), objects=(), handles=()):
+            if version_low is not None and not version_low <= srv.version.packed <= version_high:
+                raise ResultException(incompatible_version)
+
+            if type(in_data) is not exact_in_type:
+                size = data_size(in_data)
+
+                if size != in_size:
+                    raise TypeError(f"Command {request_id} takes {in_size} bytes of input data, not {size}")
+
+            if buffer_attrs:
+                buffers = tuple(zip(buffers, buffer_attrs))
+                real_buffers = srv.parse_buffers(buffers)
+            else:
+                real_buffers = ()
+
+            if handles:
+                handles = srv.parse_handles(handles)
+
+            res = srv.send_request(0, request_id, context, in_data, in_size,
+                        send_pid, real_buffers, objects, handles, out_size)
+
+            return Response(srv, res, out_type, out_size, out_num_objects,
+                        out_handle_attrs, buffers, real_buffers)
+
+        return command
+
+def data_size(in_data):
+    if in_data is None:
+        return 0
+    elif isinstance(in_data, (bytes, bytearray)):
+        return len(in_data)
+
+    return sizeof(in_data)
@@ -1,4 +1,6 @@
+import collections
 import enum
+import struct
 from ctypes import *
 
 from .. import util
@@ -8,12 +10,22 @@ from . import cmif
 
 auto_recv_static = 0xff
 
+header_size = 8
+special_header_size = 4
+static_size = 8
+buffer_descriptor_size = 12
+recv_entry_size = 8
+
 class BufferMode(enum.Enum):
     Normal    = 0
     NonSecure = 1
     Invalid   = 2
     NonDevice = 3
 
+# ctypes views of the message words, for inspecting messages, e.g.
+# Header.from_buffer_copy(msg). Messages themselves are encoded and
+# decoded with the pack and unpack functions below.
+
 class Header(LittleEndianStructure):
     _fields_ = [
         ("type",               c_uint32, 16),
@@ -25,7 +37,7 @@ class Header(LittleEndianStructure):
         ("recv_static_mode",   c_uint32, 4),
         ("padding",            c_uint32, 6),
         ("recv_list_offset",   c_uint32, 11),
-        ("has_special_header", c_bool, 1)
+        ("has_special_header", c_uint32, 1)
     ]
 
 class SpecialHeader(LittleEndianStructure):
@@ -119,6 +131,72 @@ class RecvListEntry(LittleEndianStructure):
         self.address_high = util.bits(addr, 32, 48)
         self.address_low = util.bits(addr, 0, 32)
 
+_words = [struct.Struct(f"<{n}I") for n in range(0x10)]
+_pid = struct.Struct("<Q")
+
+def pack_header(base, type, num_send_statics=0, num_send_buffers=0, num_recv_buffers=0,
+                num_exch_buffers=0, num_data_words=0, recv_static_mode=0,
+                recv_list_offset=0, has_special_header=False):
+    _words[2].pack_into(base, 0,
+        type | (num_send_statics << 16) | (num_send_buffers << 20) | (num_recv_buffers << 24) | (num_exch_buffers << 28),
+        num_data_words | (recv_static_mode << 10) | (recv_list_offset << 20) | (has_special_header << 31))
+
+def unpack_header(base):
+    """
+    Returns type, num_send_statics, num_send_buffers, num_recv_buffers,
+    num_exch_buffers, num_data_words, recv_static_mode, recv_list_offset
+    and has_special_header.
+    """
+
+    hdr0, hdr1 = _words[2].unpack_from(base, 0)
+
+    return (hdr0 & 0xffff, (hdr0 >> 16) & 0xf, (hdr0 >> 20) & 0xf, (hdr0 >> 24) & 0xf, hdr0 >> 28,
+            hdr1 & 0x3ff, (hdr1 >> 10) & 0xf, (hdr1 >> 20) & 0x7ff, hdr1 >> 31)
+
+def pack_special_header(base, offset, send_pid=False, num_copy_handles=0, num_move_handles=0):
+    _words[1].pack_into(base, offset, send_pid | (num_copy_handles << 1) | (num_move_handles << 5))
+
+def unpack_special_header(base, offset):
+    """
+    Returns send_pid, num_copy_handles and num_move_handles.
+    """
+
+    sp_hdr, = _words[1].unpack_from(base, offset)
+
+    return sp_hdr & 1, (sp_hdr >> 1) & 0xf, (sp_hdr >> 5) & 0xf
+
+def pack_static(base, offset, index, address, size):
+    _words[2].pack_into(base, offset,
+        index | ((address >> 30) & 0xfc0) | ((address >> 20) & 0xf000) | ((size & 0xffff) << 16),
+        address & 0xffffffff)
+
+def unpack_static(base, offset):
+    w0, w1 = _words[2].unpack_from(base, offset)
+
+    return ParsedStatic(w0 & 0x3f, w1 | ((w0 & 0xf000) << 20) | ((w0 & 0xfc0) << 30), w0 >> 16)
+
+def pack_buffer(base, offset, address, size, mode=0):
+    _words[3].pack_into(base, offset,
+        size & 0xffffffff,
+        address & 0xffffffff,
+        mode | ((address >> 34) & 0xfffffc) | ((size >> 8) & 0xf000000) | ((address >> 4) & 0xf0000000))
+
+def unpack_buffer(base, offset):
+    size_low, address_low, w2 = _words[3].unpack_from(base, offset)
+
+    address = address_low | ((w2 & 0xf0000000) << 4) | ((w2 & 0xfffffc) << 34)
+    size = size_low | ((w2 & 0xf000000) << 8)
+
+    return ParsedBuffer(address, size, w2 & 3)
+
+def pack_recv_entry(base, offset, address, size):
+    _words[2].pack_into(base, offset, address & 0xffffffff, ((address >> 32) & 0xffff) | ((size & 0xffff) << 16))
+
+def unpack_recv_entry(base, offset):
+    w0, w1 = _words[2].unpack_from(base, offset)
+
+    return ParsedRecvEntry(w0 | ((w1 & 0xffff) << 32), w1 >> 16)
+
 class Metadata:
     def __init__(self, **kwargs):
         self.type = cmif.CommandType.Invalid
@@ -149,68 +227,59 @@ class Request:
         else:
             recv_static_mode = 0
 
-        hdr = Header(
-            type = meta.type.value,
+        pack_header(base, meta.type.value,
             num_send_statics = meta.num_send_statics,
             num_send_buffers = meta.num_send_buffers,
             num_recv_buffers = meta.num_recv_buffers,
             num_exch_buffers = meta.num_exch_buffers,
             num_data_words = meta.num_data_words,
             recv_static_mode = recv_static_mode,
-            padding = 0,
-            recv_list_offset = 0,
             has_special_header = has_special_header,
         )
 
-        base.extend(bytes(hdr))
+        offset = header_size
 
         if has_special_header:
-            sp_hdr = SpecialHeader(
-                send_pid = meta.send_pid,
-                num_copy_handles = meta.num_copy_handles,
-                num_move_handles = meta.num_move_handles,
-            )
-
-            base.extend(bytes(sp_hdr))
+            pack_special_header(base, offset, meta.send_pid, meta.num_copy_handles, meta.num_move_handles)
+            offset += special_header_size
 
             if meta.send_pid:
-                base.extend(bytes(c_uint64()))
-
-        offset = len(base)
+                _pid.pack_into(base, offset, 0)
+                offset += 8
 
         if meta.num_copy_handles > 0:
             self.copy_handles = offset
             offset += sizeof(Handle) * meta.num_copy_handles
         else:
-            self.num_copy_handles = -1
+            self.copy_handles = -1
 
         if meta.num_move_handles > 0:
             self.move_handles = offset
             offset += sizeof(Handle) * meta.num_move_handles
         else:
-            self.num_move_handles = -1
+            self.move_handles = -1
 
         if meta.num_send_statics > 0:
             self.send_statics = offset
-            offset += sizeof(StaticDescriptor) * meta.num_send_statics
+            offset += static_size * meta.num_send_statics
         else:
             self.send_statics = -1
 
         if meta.num_send_buffers > 0:
             self.send_buffers = offset
-            offset += sizeof(BufferDescriptor) * meta.num_send_buffers
+            offset += buffer_descriptor_size * meta.num_send_buffers
         else:
             self.send_buffers = -1
 
         if meta.num_recv_buffers > 0:
             self.recv_buffers = offset
-            offset += sizeof(BufferDescriptor) * meta.num_recv_buffers
+            offset += buffer_descriptor_size * meta.num_recv_buffers
         else:
             self.recv_buffers = -1
 
         if meta.num_exch_buffers > 0:
             self.exch_buffers = offset
-            offset += sizeof(BufferDescriptor) * meta.num_exch_buffers
+            offset += buffer_descriptor_size * meta.num_exch_buffers
         else:
             self.exch_buffers = -1
 
@@ -222,31 +291,30 @@ class Request:
 
         if meta.num_recv_statics > 0:
             self.recv_list = offset
-            offset += sizeof(RecvListEntry) * meta.num_recv_statics
+            offset += recv_entry_size * meta.num_recv_statics
         else:
             self.recv_list = -1
 
+        self.size = offset
+
 class Response:
     def __init__(self, base):
-        hdr = Header.from_buffer(base)
-        offset = sizeof(hdr)
+        hdr0, hdr1 = _words[2].unpack_from(base, 0)
+        offset = header_size
 
-        self.num_statics = hdr.num_send_statics
-        self.num_data_words = hdr.num_data_words
+        self.num_statics = (hdr0 >> 16) & 0xf
+        self.num_data_words = hdr1 & 0x3ff
         self.num_copy_handles = 0
         self.num_move_handles = 0
         self.pid = 0xFFFFFFFF
 
-        if hdr.has_special_header:
-            sp_hdr = SpecialHeader.from_buffer(base, offset)
-            offset += sizeof(sp_hdr)
-
-            self.num_copy_handles = sp_hdr.num_copy_handles
-            self.num_move_handles = sp_hdr.num_move_handles
+        if hdr1 >> 31:
+            send_pid, self.num_copy_handles, self.num_move_handles = unpack_special_header(base, offset)
+            offset += special_header_size
 
-            if sp_hdr.send_pid:
-                self.pid = c_uint64.from_buffer(base, offset).value
-                offset += sizeof(c_uint64)
+            if send_pid:
+                self.pid, = _pid.unpack_from(base, offset)
+                offset += 8
 
         self.copy_handles = offset
         offset += sizeof(Handle) * self.num_copy_handles
@@ -254,4 +322,89 @@ class Response:
         self.move_handles = offset
         offset += sizeof(Handle) * self.num_move_handles
 
-        self.data_words = offset
\ No newline at end of file
+        self.statics = offset
+        offset += static_size * self.num_statics
+
+        self.data_words = offset
+
+# Descriptors as seen by the server
+ParsedStatic = collections.namedtuple("ParsedStatic", "index address size")
+ParsedBuffer = collections.namedtuple("ParsedBuffer", "address size mode")
+ParsedRecvEntry = collections.namedtuple("ParsedRecvEntry", "address size")
+
+def data_offset(base):
+    """
+    The offset of a message's data words, without parsing the rest of it.
+    """
+
+    hdr0, hdr1 = _words[2].unpack_from(base, 0)
+    offset = header_size
+
+    if hdr1 >> 31:
+        sp_hdr, = _words[1].unpack_from(base, offset)
+        offset += special_header_size + 8 * (sp_hdr & 1) + 4 * (((sp_hdr >> 1) & 0xf) + ((sp_hdr >> 5) & 0xf))
+
+    num_buffers = ((hdr0 >> 20) & 0xf) + ((hdr0 >> 24) & 0xf) + ((hdr0 >> 28) & 0xf)
+
+    return offset + static_size * ((hdr0 >> 16) & 0xf) + buffer_descriptor_size * num_buffers
+
+class ParsedRequest:
+    """
+    A request as seen by the server. Everything is copied out
+    of base, so the response can be written over it.
+    """
+
+    def __init__(self, base):
+        (self.type, num_send_statics, num_send_buffers, num_recv_buffers, num_exch_buffers,
+            self.num_data_words, recv_static_mode, recv_list_offset, has_special_header) = unpack_header(base)
+
+        offset = header_size
+
+        self.pid = None
+        self.copy_handles = ()
+        self.move_handles = ()
+
+        if has_special_header:
+            send_pid, num_copy_handles, num_move_handles = unpack_special_header(base, offset)
+            offset += special_header_size
+
+            if send_pid:
+                self.pid, = _pid.unpack_from(base, offset)
+                offset += 8
+
+            self.copy_handles = _words[num_copy_handles].unpack_from(base, offset)
+            offset += 4 * num_copy_handles
+
+            self.move_handles = _words[num_move_handles].unpack_from(base, offset)
+            offset += 4 * num_move_handles
+
+        self.send_statics_offset = offset
+
+        self.send_statics = [unpack_static(base, offset + static_size * i) for i in range(num_send_statics)]
+        offset += static_size * num_send_statics
+
+        self.send_buffers, offset = self.parse_buffers(base, offset, num_send_buffers)
+        self.recv_buffers, offset = self.parse_buffers(base, offset, num_recv_buffers)
+        self.exch_buffers, offset = self.parse_buffers(base, offset, num_exch_buffers)
+
+        self.data_words = offset
+        offset += 4 * self.num_data_words
+
+        self.recv_static_mode = recv_static_mode
+        if recv_static_mode == 2:
+            num_recv_statics = 1
+        elif recv_static_mode > 2:
+            num_recv_statics = recv_static_mode - 2
+        else:
+            num_recv_statics = 0
+
+        if recv_list_offset != 0:
+            offset = 4 * recv_list_offset
+
+        self.recv_list = [unpack_recv_entry(base, offset + recv_entry_size * i) for i in range(num_recv_statics)]
+
+    @staticmethod
+    def parse_buffers(base, offset, num):
+        buffers = [unpack_buffer(base, offset + buffer_descriptor_size * i) for i in range(num)]
+
+        return buffers, offset + buffer_descriptor_size * num
@@ -0,0 +1,199 @@
+"""
+Per-command statistics for requests sent by Service.
+
+Instrumentation is enabled by swapping in instrumented versions of
+Service.send_request and Service.send_request_async, so it costs
+nothing while disabled.
+"""
+
+import collections
+import json
+import threading
+
+from ..kernel import tick
+from ..types import ResultException
+
+from . import BufferAttr
+from .service import Service
+
+# Latency percentiles are taken over this many recent calls
+max_samples = 1024
+
+transfer_kinds = ("data", "pointer", "map_alias")
+
+_lock = threading.Lock()
+_stats = {}
+
+_send_request = Service.send_request
+_send_request_async = Service.send_request_async
+
+class CommandStats:
+    def __init__(self):
+        self.calls = 0
+        self.ticks = 0
+        self.samples = collections.deque(maxlen=max_samples)
+        self.failures = collections.Counter()
+
+        self.sent = dict.fromkeys(transfer_kinds, 0)
+        self.received = dict.fromkeys(transfer_kinds, 0)
+
+        # Which way HipcAutoSelect buffers went
+        self.auto_select = dict.fromkeys(transfer_kinds[1:], 0)
+
+    def as_dict(self, freq):
+        to_ns = 1e9 / freq
+
+        samples = sorted(self.samples)
+
+        def percentile(p):
+            if not samples:
+                return 0
+
+            return samples[min(len(samples) * p // 100, len(samples) - 1)] * to_ns
+
+        return {
+            "calls": self.calls,
+            "total_ns": self.ticks * to_ns,
+            "mean_ns": self.ticks * to_ns / self.calls if self.calls else 0,
+            "p50_ns": percentile(50),
+            "p90_ns": percentile(90),
+            "p99_ns": percentile(99),
+            "max_ns": samples[-1] * to_ns if samples else 0,
+            "failures": {f"{result:#x}": count for result, count in self.failures.items()},
+            "sent": dict(self.sent),
+            "received": dict(self.received),
+            "auto_select": dict(self.auto_select),
+        }
+
+def service_name(srv):
+    return srv.name or type(srv).__name__
+
+def record(srv, request_id, ticks, in_size, out_size, buffers, pointer_size, result=0):
+    key = (service_name(srv), request_id)
+
+    with _lock:
+        stats = _stats.get(key)
+        if stats is None:
+            stats = CommandStats()
+            _stats[key] = stats
+
+        stats.calls += 1
+        stats.ticks += ticks
+        stats.samples.append(ticks)
+
+        if result != 0:
+            stats.failures[result] += 1
+            out_size = 0
+
+        stats.sent["data"] += in_size
+        stats.received["data"] += out_size
+
+        for buf, attr in buffers:
+            kind = transfer_kind(attr, buf.size, pointer_size)
+            if kind is None:
+                continue
+
+            if kind == "pointer":
+                pointer_size -= buf.size
+
+            if attr & BufferAttr.HipcAutoSelect.value:
+                stats.auto_select[kind] += 1
+
+            if attr & BufferAttr.In.value:
+                stats.sent[kind] += buf.size
+            if attr & BufferAttr.Out.value:
+                stats.received[kind] += buf.size
+
+def transfer_kind(attr, size, pointer_size):
+    """
+    How a buffer is sent, following cmif.Request.process_buffer.
+    """
+
+    if attr & BufferAttr.HipcAutoSelect.value:
+        if pointer_size > 0 and size <= pointer_size:
+            return "pointer"
+
+        return "map_alias"
+    elif attr & BufferAttr.HipcPointer.value:
+        return "pointer"
+    elif attr & BufferAttr.HipcMapAlias.value:
+        return "map_alias"
+
+    return None
+
+def instrumented_send_request(self, session, request_id, context, in_data, in_size,
+                                send_pid, buffers, objects, handles, out_size):
+    if session == 0 and self.pool is not None:
+        # Recorded once a pooled session has been picked
+        return _send_request(self, session, request_id, context, in_data, in_size,
+                    send_pid, buffers, objects, handles, out_size)
+
+    start = tick.ticks()
+
+    try:
+        res = _send_request(self, session, request_id, context, in_data, in_size,
+                    send_pid, buffers, objects, handles, out_size)
+    except ResultException as e:
+        record(self, request_id, tick.ticks() - start, in_size, out_size,
+            buffers, self.server_pointer_size(buffers, request_id), e.result.value)
+        raise
+
+    record(self, request_id, tick.ticks() - start, in_size, out_size,
+        buffers, self.server_pointer_size(buffers, request_id))
+
+    return res
+
+async def instrumented_send_request_async(self, session, request_id, context, in_data, in_size,
+                                            send_pid, buffers, objects, handles, out_size, parse):
+    start = tick.ticks()
+
+    try:
+        res = await _send_request_async(self, session, request_id, context, in_data, in_size,
+                        send_pid, buffers, objects, handles, out_size, parse)
+    except ResultException as e:
+        record(self, request_id, tick.ticks() - start, in_size, out_size,
+            buffers, self.server_pointer_size(buffers, request_id), e.result.value)
+        raise
+
+    record(self, request_id, tick.ticks() - start, in_size, out_size,
+        buffers, self.server_pointer_size(buffers, request_id))
+
+    return res
+
+def enable():
+    Service.send_request = instrumented_send_request
+    Service.send_request_async = instrumented_send_request_async
+
+def disable():
+    Service.send_request = _send_request
+    Service.send_request_async = _send_request_async
+
+def enabled():
+    return Service.send_request is instrumented_send_request
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+def stats():
+    """
+    Returns the statistics recorded so far, keyed
+    by (service name, request id).
+    """
+
+    freq = tick.frequency
+
+    with _lock:
+        return {key: s.as_dict(freq) for key, s in _stats.items()}
+
+def dump(path):
+    """
+    Writes the statistics recorded so far to path as JSON.
+    """
+
+    entries = []
+    for (name, request_id), s in stats().items():
+        entries.append({"service": name, "request_id": request_id, **s})
+
+    with open(path, "w") as f:
+        json.dump(entries, f, indent=4)
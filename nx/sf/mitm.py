@@ -0,0 +1,227 @@
+"""
+Man-in-the-middle services, through Atmosphere's sm extensions.
+
+Clients of an intercepted service are sent to a MitmObject, which
+only decodes the commands it has handlers for. Every other request
+is forwarded to the real service as it was received, and the reply
+is sent back the same way, without either being decoded.
+"""
+
+import struct
+from ctypes import *
+
+from .. import util
+from ..kernel import svc
+from ..types import Result, ResultException
+from ..services.sm import ServiceManager
+
+from . import cmif, hipc, server
+from .service import Service
+
+# Has Atmosphere's kernel send a forwarded request on behalf of the client's process
+forward_pid_tag = 0xfffe << 48
+
+_words = hipc._words
+_pid = struct.Struct("<Q")
+_domain_header = struct.Struct("<BBHI")
+_pointer_buffer_size = struct.Struct("<H")
+
+_request_types = (cmif.CommandType.Request.value, cmif.CommandType.RequestWithContext.value)
+_control_types = (cmif.CommandType.Control.value, cmif.CommandType.ControlWithContext.value)
+
+_close_type = cmif.CommandType.Close.value
+_send_message_type = cmif.DomainRequestType.SendMessage.value
+
+class MitmObject(server.Object):
+    """
+    Intercepts commands sent to a service.
+
+    info is the client's MitmProcessInfo, and service an nx.sf.Service
+    for the session to the real service, which handlers can use to send
+    the original command. Objects returned by handlers are served on
+    sessions of their own, so once the client has converted its session
+    to a domain, requests returning them fail with not_supported.
+    """
+
+    def __init__(self, info, service):
+        self.info = info
+        self.service = service
+
+    @classmethod
+    def should_mitm(cls, info):
+        """
+        Whether to intercept the client described by info.
+        """
+
+        return True
+
+class QueryObject(server.Object):
+    """
+    Answers sm on whether a client should be intercepted.
+    """
+
+    def __init__(self, cls):
+        self.cls = cls
+
+    @server.command(65000)
+    def should_mitm(self, ctx):
+        info = ServiceManager.MitmProcessInfo.from_buffer_copy(ctx.data)
+
+        return c_bool(self.cls.should_mitm(info))
+
+class MitmSession(server.Session):
+    """
+    The session to an intercepted client, forwarding the requests
+    its object doesn't handle to forward, the session to the real
+    service.
+    """
+
+    def __init__(self, manager, obj, forward, pointer_buffer_size=0):
+        super().__init__(manager, obj, pointer_buffer_size)
+
+        self.forward = forward
+
+        # The object's id in the real service's domain
+        self.forward_object_id = 0
+
+        # Pointer buffers in replies are received here and sent on from here
+        self.pointer_buffer, recv_list_words = server.make_recv_list(pointer_buffer_size)
+        self.recv_entry = recv_list_words[2:]
+
+    def sub_session(self, obj):
+        return server.Session(self.manager, obj, self.pointer_buffer_size)
+
+    def add_object(self, obj):
+        # Ids in the domain are handed out by the real service, so only
+        # the request returning the object fails
+        obj.close()
+
+        raise ResultException(server.not_supported)
+
+    def close(self):
+        if not self.closed:
+            svc.close_handle(self.forward)
+
+        super().close()
+
+    def process(self, base, pointer_buffer=None):
+        hdr0, = _words[1].unpack_from(base, 0)
+        request_type = hdr0 & 0xffff
+
+        if request_type == _close_type:
+            self.close()
+            return False
+
+        data = util.align(hipc.data_offset(base), 16)
+
+        if request_type in _control_types:
+            self.forward_control(base, data)
+            return True
+
+        if request_type in _request_types and self.intercepts(base, data):
+            return super().process(base, pointer_buffer)
+
+        self.forward_request(base)
+
+        return True
+
+    def intercepts(self, base, data):
+        if self.forward_object_id != 0:
+            domain_type, _, _, object_id = _domain_header.unpack_from(base, data)
+            if domain_type != _send_message_type or object_id != self.forward_object_id:
+                return False
+
+            data += cmif._domain_in_header.size
+
+        request_id, = _words[1].unpack_from(base, data + 8)
+
+        return request_id in self.object.commands
+
+    def forward_request(self, base):
+        """
+        Sends the request in base on to the real service,
+        leaving its reply in base.
+        """
+
+        hdr0, hdr1 = _words[2].unpack_from(base, 0)
+
+        if hdr1 >> 31:
+            sp_hdr, = _words[1].unpack_from(base, 8)
+
+            if sp_hdr & 1:
+                pid, = _pid.unpack_from(base, 12)
+                _pid.pack_into(base, 12, forward_pid_tag | pid)
+
+        if (hdr1 >> 10) & 0xf:
+            recv_list_offset = 4 * ((hdr1 >> 20) & 0x7ff)
+            if recv_list_offset == 0:
+                recv_list_offset = hipc.data_offset(base) + 4 * (hdr1 & 0x3ff)
+
+            _words[1].pack_into(base, 4, (hdr1 & ~(0xf << 10)) | (2 << 10))
+            _words[2].pack_into(base, recv_list_offset, *self.recv_entry)
+
+        try:
+            svc.send_sync_request(self.forward)
+        except ResultException as e:
+            server.write_response(base, e.result, is_domain=self.forward_object_id != 0)
+
+    def forward_control(self, base, data):
+        request_id, = _words[1].unpack_from(base, data + 8)
+
+        self.forward_request(base)
+
+        data = util.align(hipc.data_offset(base), 16)
+        result, = _words[1].unpack_from(base, data + 8)
+        out = data + cmif._out_header.size
+
+        if result != 0:
+            return
+
+        if request_id == 0:
+            # ConvertCurrentObjectToDomain
+            object_id, = _words[1].unpack_from(base, out)
+
+            self.forward_object_id = object_id
+            self.domain = {object_id: self.object}
+
+            service = getattr(self.object, "service", None)
+            if service is not None:
+                service.set_domain(object_id)
+        elif request_id in (2, 4):
+            # CloneCurrentObject(Ex)
+            forward = hipc.ParsedRequest(base).move_handles[0]
+
+            session = type(self)(self.manager, self.object, forward, self.pointer_buffer_size)
+            session.forward_object_id = self.forward_object_id
+            session.domain = self.domain
+
+            server.write_response(base, Result(), move_handles=(self.manager.add_session(session),))
+        elif request_id == 3:
+            # QueryPointerBufferSize, pointer buffers have to fit in both
+            size, = _pointer_buffer_size.unpack_from(base, out)
+            _pointer_buffer_size.pack_into(base, out, min(size, self.pointer_buffer_size))
+
+def install(manager, sm, name, cls):
+    """
+    Intercepts the clients of the service name that cls.should_mitm
+    returns True for, serving them with manager, an
+    nx.sf.server.ServerManager. Returns the port sessions are
+    accepted on.
+    """
+
+    port, query = sm.install_mitm(name)
+
+    manager.add_session(server.Session(manager, QueryObject(cls)), query)
+
+    def accept():
+        info, forward = sm.acknowledge_mitm_session(name)
+
+        # The session is closed along with the client's
+        service = Service(forward)
+        service.own_handle = False
+
+        return MitmSession(manager, cls(info, service), forward, manager.pointer_buffer_size)
+
+    manager.add_port(port, accept)
+
+    return port
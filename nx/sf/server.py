@@ -0,0 +1,770 @@
+import logging
+import queue
+import struct
+import threading
+from ctypes import *
+
+from .. import arm, kernel, util
+from ..types import Result, ResultException
+from ..kernel import svc
+
+from . import cmif, hipc
+
+# sf results
+not_supported      = Result(module=10, description=1)
+invalid_in_header  = Result(module=10, description=211)
+unknown_command_id = Result(module=10, description=221)
+target_not_found   = Result(module=10, description=261)
+
+_in_header = cmif._in_header
+_out_header = cmif._out_header
+_domain_in_header = cmif._domain_in_header
+_domain_out_header = cmif._domain_out_header
+_recv_list_header = struct.Struct("<IIII")
+
+_words = hipc._words
+
+_request_types = (cmif.CommandType.Request.value, cmif.CommandType.RequestWithContext.value)
+_control_types = (cmif.CommandType.Control.value, cmif.CommandType.ControlWithContext.value)
+
+_close_type = cmif.CommandType.Close.value
+_domain_close_type = cmif.DomainRequestType.Close.value
+
+_logger = logging.getLogger(__name__)
+
+def static_address(desc, pointer_buffer):
+    """
+    The address of an in pointer buffer, which the kernel
+    copied into the pointer_buffer it was received with.
+
+    Static descriptors only have room for 42 bits of address, which
+    is enough on the Switch but not in a host process, so the bits
+    above that are taken from the pointer buffer.
+    """
+
+    if pointer_buffer is None:
+        return desc.address
+
+    base = addressof(pointer_buffer)
+
+    return base + ((desc.address - base) & ((1 << 42) - 1))
+
+def command(request_id):
+    """
+    Marks a method of an Object as the handler for request_id.
+    """
+
+    def decorator(func):
+        func.request_id = request_id
+
+        return func
+
+    return decorator
+
+class Object:
+    """
+    An object served over IPC.
+
+    Methods marked with command are called with a Context, and
+    return the out data as bytes or a ctypes instance, or None.
+    Failures are reported by raising ResultException. Any other
+    exception is logged and fails the request with not_supported.
+    """
+
+    commands = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        commands = dict(cls.commands)
+        for value in cls.__dict__.values():
+            request_id = getattr(value, "request_id", None)
+            if request_id is not None:
+                commands[request_id] = value
+
+        cls.commands = commands
+
+    def close(self):
+        pass
+
+class Context:
+    """
+    A request to an Object, along with what to send back
+    besides the out data.
+    """
+
+    def __init__(self, session, req, request_id, data, in_objects=(), pointer_buffer=None):
+        self.session = session
+        self.request_id = request_id
+        self.data = data
+        self.pid = req.pid
+        self.copy_handles = req.copy_handles
+        self.move_handles = req.move_handles
+        self.in_objects = in_objects
+
+        self.send_statics = req.send_statics
+        self.send_buffers = req.send_buffers
+        self.recv_buffers = req.recv_buffers
+        self.exch_buffers = req.exch_buffers
+        self.recv_list = req.recv_list
+        self.pointer_buffer = pointer_buffer
+
+        self.out_copy_handles = []
+        self.out_move_handles = []
+        self.out_objects = []
+        self.out_statics = []
+
+    @staticmethod
+    def view(address, size):
+        if size == 0:
+            return memoryview(b"")
+
+        return memoryview((c_ubyte * size).from_address(address)).cast("B")
+
+    def static(self, index):
+        """
+        The in pointer buffer sent with index.
+        """
+
+        for desc in self.send_statics:
+            if desc.index == index:
+                return self.view(static_address(desc, self.pointer_buffer), desc.size)
+
+        raise IndexError(index)
+
+    def send_buffer(self, index):
+        desc = self.send_buffers[index]
+        return self.view(desc.address, desc.size)
+
+    def recv_buffer(self, index):
+        desc = self.recv_buffers[index]
+        return self.view(desc.address, desc.size)
+
+    def exch_buffer(self, index):
+        desc = self.exch_buffers[index]
+        return self.view(desc.address, desc.size)
+
+    def recv_static(self, index):
+        """
+        A buffer for the out pointer buffer with index. It is sent
+        back with the reply and copied into the client's buffer.
+        """
+
+        size = self.recv_list[min(index, len(self.recv_list) - 1)].size
+        buf = (c_ubyte * size)()
+
+        self.out_statics.append((index, buf))
+
+        return memoryview(buf).cast("B")
+
+class Session:
+    """
+    The server side of a session, bound to an Object or,
+    once converted, to a domain of them.
+
+    manager is what the session is served by, and provides
+    add_session(session), which returns a handle to send
+    to the client for a new session.
+    """
+
+    def __init__(self, manager, obj, pointer_buffer_size=0):
+        self.manager = manager
+        self.object = obj
+        self.pointer_buffer_size = pointer_buffer_size
+
+        self.domain = None
+        self.next_object_id = 1
+
+        # Kept alive until the reply has been sent
+        self.out_statics = ()
+
+        self.closed = False
+
+    def clone(self):
+        session = type(self)(self.manager, self.object, self.pointer_buffer_size)
+
+        # Clones share the domain, as with sf
+        session.domain = self.domain
+
+        return session
+
+    def sub_session(self, obj):
+        """
+        The session to serve an object returned by a command on.
+        """
+
+        return type(self)(self.manager, obj, self.pointer_buffer_size)
+
+    def add_object(self, obj):
+        object_id = self.next_object_id
+        self.next_object_id += 1
+
+        self.domain[object_id] = obj
+
+        return object_id
+
+    def close(self):
+        self.closed = True
+
+        if self.domain is None:
+            self.object.close()
+
+    def process(self, base, pointer_buffer=None):
+        """
+        Handles the request in base and writes the response over it.
+        Returns False if the request closed the session, in which
+        case nothing is written.
+
+        pointer_buffer is where the kernel copied the request's in
+        pointer buffers, per the receive list it was received with.
+        """
+
+        req = hipc.ParsedRequest(base)
+
+        data = util.align(req.data_words, 16)
+        end = req.data_words + 4 * req.num_data_words
+
+        if req.type == _close_type:
+            self.close()
+            return False
+
+        if req.type in _control_types:
+            magic, version, request_id, token = _in_header.unpack_from(base, data)
+
+            try:
+                if magic != b"SFCI":
+                    raise ResultException(invalid_in_header)
+
+                out, move_handles = self.control(request_id, bytes(base[data + _in_header.size : end]))
+
+                write_response(base, Result(), out, move_handles=move_handles)
+            except ResultException as e:
+                write_response(base, e.result)
+            except Exception:
+                _logger.exception("Control request %d failed", request_id)
+                write_response(base, not_supported)
+
+            return True
+
+        if req.type not in _request_types:
+            write_response(base, not_supported)
+            return True
+
+        is_domain = self.domain is not None
+
+        if not is_domain:
+            obj = self.object
+            in_objects = ()
+        else:
+            domain_type, num_in_objects, data_size, object_id, _, _ = _domain_in_header.unpack_from(base, data)
+            data += _domain_in_header.size
+
+            obj = self.domain.get(object_id)
+            if obj is None:
+                write_response(base, target_not_found, is_domain=True)
+                return True
+
+            if domain_type == _domain_close_type:
+                del self.domain[object_id]
+                obj.close()
+
+                write_response(base, Result(), is_domain=True)
+                return True
+
+            ids = _words[num_in_objects].unpack_from(base, data + data_size)
+            in_objects = [self.domain.get(i) for i in ids]
+
+            end = data + data_size
+
+        magic, version, request_id, token = _in_header.unpack_from(base, data)
+        func = obj.commands.get(request_id)
+
+        try:
+            if magic != b"SFCI":
+                raise ResultException(invalid_in_header)
+
+            if func is None:
+                raise ResultException(unknown_command_id)
+
+            ctx = Context(self, req, request_id, bytes(base[data + _in_header.size : end]),
+                          in_objects, pointer_buffer)
+            out = func(obj, ctx)
+
+            if is_domain:
+                objects = [self.add_object(o) for o in ctx.out_objects]
+                move_handles = ctx.out_move_handles
+            else:
+                objects = ()
+                move_handles = [self.manager.add_session(self.sub_session(o))
+                                    for o in ctx.out_objects] + ctx.out_move_handles
+
+            write_response(base, Result(), out, is_domain, ctx.out_copy_handles,
+                        move_handles, objects, ctx.out_statics)
+
+            self.out_statics = ctx.out_statics
+        except ResultException as e:
+            write_response(base, e.result, is_domain=is_domain)
+        except Exception:
+            # The client still needs a reply, and the server has other sessions to serve
+            _logger.exception("Command %d of %s failed", request_id, type(obj).__name__)
+            write_response(base, not_supported, is_domain=is_domain)
+
+        return True
+
+    def control(self, request_id, data):
+        if request_id == 0:
+            # ConvertCurrentObjectToDomain
+            if self.domain is not None:
+                raise ResultException(not_supported)
+
+            self.domain = {}
+
+            return c_uint32(self.add_object(self.object)), ()
+        elif request_id in (2, 4):
+            # CloneCurrentObject(Ex)
+            return None, (self.manager.add_session(self.clone()),)
+        elif request_id == 3:
+            # QueryPointerBufferSize
+            return c_uint16(self.pointer_buffer_size), ()
+
+        raise ResultException(unknown_command_id)
+
+def write_response(base, result, out=None, is_domain=False, copy_handles=(),
+                    move_handles=(), objects=(), statics=()):
+    if out is None or result.failed:
+        out = b""
+    else:
+        out = bytes(out)
+
+    if result.failed:
+        copy_handles = move_handles = objects = statics = ()
+
+    size = 16 + _out_header.size + len(out)
+    if is_domain:
+        size += _domain_out_header.size + 4 * len(objects)
+
+    num_data_words = (size + 3) // 4
+    has_special_header = len(copy_handles) > 0 or len(move_handles) > 0
+
+    hipc.pack_header(base, 0,
+        num_send_statics = len(statics),
+        num_data_words = num_data_words,
+        has_special_header = has_special_header,
+    )
+
+    offset = hipc.header_size
+
+    if has_special_header:
+        hipc.pack_special_header(base, offset, False, len(copy_handles), len(move_handles))
+        offset += hipc.special_header_size
+
+        _words[len(copy_handles)].pack_into(base, offset, *copy_handles)
+        offset += 4 * len(copy_handles)
+
+        _words[len(move_handles)].pack_into(base, offset, *move_handles)
+        offset += 4 * len(move_handles)
+
+    for index, buf in statics:
+        hipc.pack_static(base, offset, index, addressof(buf), sizeof(buf))
+        offset += hipc.static_size
+
+    data = util.align(offset, 16)
+
+    if is_domain:
+        _domain_out_header.pack_into(base, data, len(objects))
+        data += _domain_out_header.size
+
+    _out_header.pack_into(base, data, b"SFCO", 0, result.value, 0)
+    data += _out_header.size
+
+    base[data : data + len(out)] = out
+    data += len(out)
+
+    if is_domain:
+        _words[len(objects)].pack_into(base, data, *objects)
+
+def make_recv_list(pointer_buffer_size):
+    """
+    Allocates a pointer buffer, returning it along with the
+    receive list words that have in pointer buffers received into it.
+    """
+
+    pointer_buffer = util.aligned_array(max(pointer_buffer_size, 1), 0x10)
+
+    address = addressof(pointer_buffer)
+    words = (
+        0,
+        2 << 10,
+        util.bits(address, 0, 32),
+        util.bits(address, 32, 48) | (pointer_buffer_size << 16),
+    )
+
+    return pointer_buffer, words
+
+class ServerManager:
+    """
+    Serves sessions to ports from a single thread, waiting on the
+    ports and every session at once with svcReplyAndReceive.
+
+    The kernel can only wait on 0x40 handles at a time. Past that,
+    the handles are waited on in turns with a short timeout, so
+    services with many clients are better off using domains.
+    """
+
+    max_wait_handles = 0x40
+
+    # How long to wait on each group of handles when there are too many to wait on at once
+    poll_timeout = 1000000
+
+    def __init__(self, pointer_buffer_size=0x500):
+        self.pointer_buffer_size = pointer_buffer_size
+        self.pointer_buffer, self.recv_list_words = make_recv_list(pointer_buffer_size)
+
+        self.ports = {}
+        self.sessions = {}
+
+        self.wait_handles = None
+        self.wait_offset = 0
+
+        self.running = False
+        self.thread_handle = None
+
+    def add_port(self, port, factory):
+        """
+        Serves sessions accepted on port, each with a new object
+        returned by factory. factory may also return the Session
+        itself, once the session has been accepted.
+        """
+
+        self.ports[port] = factory
+        self.wait_handles = None
+
+    def register_service(self, sm, name, factory, max_sessions=max_wait_handles):
+        port = sm.register_service(name, max_sessions=max_sessions)
+        self.add_port(port, factory)
+
+        return port
+
+    def add_session(self, session, handle=None):
+        """
+        Serves session on handle, or on a new session if handle
+        is None, in which case the client's handle is returned.
+        """
+
+        client = None
+        if handle is None:
+            handle, client = svc.create_session()
+
+        self.sessions[handle] = session
+        self.wait_handles = None
+
+        return client
+
+    def close_session(self, handle):
+        session = self.sessions.pop(handle)
+        self.wait_handles = None
+
+        if not session.closed:
+            session.close()
+
+        svc.close_handle(handle)
+
+    def handles(self):
+        if self.wait_handles is None:
+            self.wait_handles = list(self.ports) + list(self.sessions)
+
+        handles = self.wait_handles
+        if len(handles) <= self.max_wait_handles:
+            return handles, -1
+
+        if self.wait_offset >= len(handles):
+            self.wait_offset = 0
+
+        offset = self.wait_offset
+        self.wait_offset += self.max_wait_handles
+
+        return handles[offset : offset + self.max_wait_handles], self.poll_timeout
+
+    def process(self, timeout=-1):
+        """
+        Waits for a message or connection and handles it. Returns
+        False if nothing arrived before timeout.
+        """
+
+        base = arm.ipc_buffer()
+
+        handles, wait_timeout = self.handles()
+        if timeout < 0 or 0 <= wait_timeout < timeout:
+            timeout = wait_timeout
+
+        _recv_list_header.pack_into(base, 0, *self.recv_list_words)
+
+        try:
+            index = svc.reply_and_receive(handles, 0, timeout)
+        except ResultException as e:
+            if e.result == kernel.result("TimedOut") or e.result == kernel.result("Cancelled"):
+                return False
+
+            if e.result == kernel.result("SessionClosed"):
+                self.close_session(handles[e.index])
+                return True
+
+            raise
+
+        handle = handles[index]
+
+        if handle in self.ports:
+            self.accept(handle)
+        else:
+            self.handle_request(handle, base)
+
+        return True
+
+    def process_handle(self, handle):
+        """
+        Handles a port or session that was seen signaled, without
+        waiting on anything else. Returns False if there was nothing
+        to receive after all.
+        """
+
+        if handle in self.ports:
+            self.accept(handle)
+            return True
+
+        base = arm.ipc_buffer()
+        _recv_list_header.pack_into(base, 0, *self.recv_list_words)
+
+        try:
+            svc.reply_and_receive((handle,), 0, 0)
+        except ResultException as e:
+            if e.result == kernel.result("SessionClosed"):
+                self.close_session(handle)
+                return True
+
+            if e.result == kernel.result("TimedOut"):
+                return False
+
+            raise
+
+        self.handle_request(handle, base)
+
+        return True
+
+    def accept(self, port):
+        handle = svc.accept_session(port)
+
+        session = self.ports[port]()
+        if not isinstance(session, Session):
+            session = Session(self, session, self.pointer_buffer_size)
+
+        self.add_session(session, handle)
+
+    def handle_request(self, handle, base, pointer_buffer=None):
+        """
+        Handles the request received into base on handle and replies
+        to it. pointer_buffer is the one given in the receive list,
+        the manager's own by default.
+        """
+
+        if pointer_buffer is None:
+            pointer_buffer = self.pointer_buffer
+
+        session = self.sessions[handle]
+
+        try:
+            keep = session.process(base, pointer_buffer)
+        except Exception:
+            # Handlers' failures are replied to by process itself,
+            # this is for requests it couldn't make sense of at all
+            _logger.exception("Failed to process a request on session %#x", handle)
+
+            write_response(base, not_supported, is_domain=session.domain is not None)
+            keep = True
+
+        if not keep:
+            self.close_session(handle)
+            return
+
+        self.reply(handle)
+        session.out_statics = ()
+
+    def reply(self, handle):
+        # Replying without waiting on anything always times out
+        try:
+            svc.reply_and_receive((), handle, 0)
+        except ResultException as e:
+            if e.result != kernel.result("TimedOut"):
+                self.close_session(handle)
+
+    def serve(self):
+        """
+        Handles requests until stop is called.
+        """
+
+        self.thread_handle = svc.get_current_thread_handle()
+        self.running = True
+
+        while self.running:
+            self.process()
+
+    def stop(self):
+        self.running = False
+
+        if self.thread_handle is not None:
+            svc.cancel_synchronization(self.thread_handle)
+
+    def close(self):
+        for handle in list(self.sessions):
+            self.close_session(handle)
+
+        for port in self.ports:
+            svc.close_handle(port)
+
+        self.ports.clear()
+        self.wait_handles = None
+
+class ThreadedServerManager(ServerManager):
+    """
+    Serves sessions from a pool of worker threads, so that handlers
+    blocking on I/O only hold up their own client.
+
+    The thread calling serve waits for sessions to be signaled and
+    hands them to the workers, which receive and reply to the message
+    with their own TLS and pointer buffer. A session isn't waited on
+    again until its reply is sent, so each session's requests are
+    still handled in order.
+
+    If cores is given, the workers are pinned to those cores in turn.
+    """
+
+    def __init__(self, num_threads=4, pointer_buffer_size=0x500, cores=None):
+        super().__init__(pointer_buffer_size)
+
+        self.num_threads = num_threads
+        self.cores = cores
+        self.lock = threading.Lock()
+
+        self.busy = set()
+        self.requests = queue.Queue()
+
+        self.dispatcher = None
+        self.threads = []
+
+    def add_session(self, session, handle=None):
+        with self.lock:
+            client = super().add_session(session, handle)
+
+        self.wake()
+
+        return client
+
+    def close_session(self, handle):
+        with self.lock:
+            self.busy.discard(handle)
+            super().close_session(handle)
+
+    def handles(self):
+        with self.lock:
+            if self.wait_handles is None:
+                self.wait_handles = [h for h in list(self.ports) + list(self.sessions) if h not in self.busy]
+
+            return super().handles()
+
+    def wake(self):
+        # Has the dispatcher wait on the sessions again
+        if self.thread_handle is not None and threading.current_thread() is not self.dispatcher:
+            svc.cancel_synchronization(self.thread_handle)
+
+    def process(self, timeout=-1):
+        handles, wait_timeout = self.handles()
+        if timeout < 0 or 0 <= wait_timeout < timeout:
+            timeout = wait_timeout
+
+        try:
+            index = svc.wait_synchronization(handles, timeout)
+        except ResultException as e:
+            if e.result == kernel.result("TimedOut") or e.result == kernel.result("Cancelled"):
+                return False
+
+            raise
+
+        handle = handles[index]
+
+        if handle in self.ports:
+            self.accept(handle)
+            return True
+
+        with self.lock:
+            self.busy.add(handle)
+            self.wait_handles = None
+
+        self.requests.put(handle)
+
+        return True
+
+    def work(self, index):
+        if self.cores:
+            core = self.cores[index % len(self.cores)]
+            svc.set_thread_core_mask(svc.get_current_thread_handle(), core, 1 << core)
+
+        recv_list = make_recv_list(self.pointer_buffer_size)
+
+        while True:
+            handle = self.requests.get()
+            if handle is None:
+                break
+
+            try:
+                self.serve_session(handle, recv_list)
+            except Exception:
+                # The worker keeps serving the other sessions
+                _logger.exception("Failed to serve session %#x", handle)
+
+                if handle in self.sessions:
+                    self.close_session(handle)
+
+            with self.lock:
+                if handle not in self.busy:
+                    continue
+
+                self.busy.discard(handle)
+                self.wait_handles = None
+
+            self.wake()
+
+    def serve_session(self, handle, recv_list):
+        pointer_buffer, recv_list_words = recv_list
+
+        base = arm.ipc_buffer()
+        _recv_list_header.pack_into(base, 0, *recv_list_words)
+
+        try:
+            svc.reply_and_receive((handle,), 0, 0)
+        except ResultException as e:
+            if e.result == kernel.result("SessionClosed"):
+                self.close_session(handle)
+            elif e.result != kernel.result("TimedOut"):
+                raise
+
+            # Otherwise there was nothing to receive after all
+            return
+
+        self.handle_request(handle, base, pointer_buffer)
+
+    def serve(self):
+        self.dispatcher = threading.current_thread()
+        self.threads = [threading.Thread(target=self.work, args=(i,), daemon=True) for i in range(self.num_threads)]
+
+        for thread in self.threads:
+            thread.start()
+
+        try:
+            super().serve()
+        finally:
+            for thread in self.threads:
+                self.requests.put(None)
+
+            for thread in self.threads:
+                thread.join()
+
+            self.threads = []
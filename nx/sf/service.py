@@ -1,12 +1,36 @@
+import asyncio
+import collections
 import enum
+import threading
+import weakref
 from ctypes import *
 import _ctypes
 
+import _nx
+
 from .. import arm, util
-from ..types import HosVersion
-from ..kernel import svc
+from ..types import HosVersion, Result, ResultException
+from ..kernel import svc, waiter
+
+from . import cmif, transfer, Buffer, BufferAttr, OutHandleAttr
+
+# User buffers for async requests must be page-aligned and page-sized
+async_buffer_size = 0x1000
+
+_async_buffers = []
+
+# Pointer buffer sizes by service name, they're a property
+# of the server so every session to a service shares one
+_pointer_buffer_sizes = {}
+
+def acquire_async_buffer():
+    try:
+        return _async_buffers.pop()
+    except IndexError:
+        return util.aligned_array(async_buffer_size, 0x1000)
 
-from . import cmif, Buffer, BufferAttr, OutHandleAttr
+def release_async_buffer(buf):
+    _async_buffers.append(buf)
 
 class Service:
     name = None
@@ -16,23 +40,62 @@ class Service:
 
     sm = None
 
+    # Encode requests from cached cmif.request_templates. That's only
+    # done for requests encoded in Python, which are the ones sent by
+    # dispatch_async, and the ones sent by dispatch when use_accel is
+    # False. With use_accel, _nx encodes them itself.
+    use_templates = True
+    use_accel = hasattr(_nx, "cmifDispatch")
+
+    pool = None
+
+    # A transfer.BufferPool to take out buffers given as a size from
+    # for map-alias transfers, like transfer.default_pool, or None to
+    # allocate a fresh buffer each time
+    transfer_pool = None
+
+    # A transfer.TransferPolicy for HipcAutoSelect buffers, or None to
+    # use the pointer buffer whenever they fit
+    transfer_policy = None
+
+    # Get the session from sm's registry, shared with
+    # every other instance that sets this
+    shared = False
+    shared_name = None
+
+    # Only query the pointer buffer size once a request needs it
+    lazy_pointer_buffer_size = True
+
+    # The service that owns the domain this object belongs to
+    domain_root = None
+
     def __init__(self, handle=0):
+        # Guards the session's lifetime, requests themselves
+        # can be sent from several threads at once
+        self.lock = threading.Lock()
+
         if handle == 0:
-            handle, own_handle = self.sm.get_service(self.name)
-            super().__init__(handle)
-            self.own_handle = own_handle
+            if self.shared and not self.domain:
+                handle, shared = self.sm.acquire_service(self.name)
+                own_handle = False
 
-            if self.domain:
-                self.convert_to_domain()
+                if shared:
+                    self.shared_name = self.name
+            else:
+                handle, own_handle = self.sm.get_service(self.name)
         else:
-            self.session = handle
-            self.own_handle = True
-            self.object_id = 0
+            own_handle = True
 
-            try:
-                self.pointer_buffer_size = cmif.query_pointer_buffer_size(handle)
-            except:
-                self.pointer_buffer_size = 0
+        self.session = handle
+        self.own_handle = own_handle
+        self.object_id = 0
+        self.pointer_buffer_size = _pointer_buffer_sizes.get(self.name)
+
+        if self.pointer_buffer_size is None and not self.lazy_pointer_buffer_size:
+            self.load_pointer_buffer_size()
+
+        if self.domain:
+            self.convert_to_domain()
 
     def dispatch(self, request_id, in_data=None, out_type=None, *,
                     target_session=0, context=0, buffers=(),
@@ -49,59 +112,176 @@ class Service:
             out_size = 0
         elif isinstance(out_type, int):
             out_size = out_type
-        elif isinstance(out_type, type):
+        else:
+            # Either a ctypes type or an instance to decode into
             out_size = sizeof(out_type)
+
+        real_buffers = self.parse_buffers(buffers)
+
+        if in_handles:
+            in_handles = self.parse_handles(in_handles)
+
+        res = self.send_request(target_session, request_id, context, in_data, in_size, in_send_pid,
+                    real_buffers, in_objects, in_handles, out_size)
+
+        return self.parse_response(res, out_type, out_size, out_num_objects,
+                    out_handle_attrs, buffers, real_buffers)
+
+    async def dispatch_async(self, request_id, in_data=None, out_type=None, *,
+                                target_session=0, context=0, buffers=(),
+                                in_send_pid=False, in_objects=(), in_handles=(),
+                                out_num_objects=0, out_handle_attrs=()):
+        """
+        Like dispatch, but sends the request with
+        svcSendAsyncRequestWithUserBuffer and waits for
+        the reply without blocking the event loop.
+        """
+
+        if in_data is None:
+            in_size = 0
+        elif isinstance(in_data, (bytes, bytearray)):
+            in_size = len(in_data)
         else:
-            raise ValueError("Invalid argument for out_type")
+            in_size = sizeof(in_data)
+
+        if out_type is None:
+            out_size = 0
+        elif isinstance(out_type, int):
+            out_size = out_type
+        else:
+            out_size = sizeof(out_type)
 
         real_buffers = self.parse_buffers(buffers)
 
-        base = bytearray()
-        in_off = self.make_request(base, request_id, context, in_size,
-                    in_send_pid, real_buffers, in_objects, in_handles)
+        if in_handles:
+            in_handles = self.parse_handles(in_handles)
+
+        def parse(res):
+            return self.parse_response(res, out_type, out_size, out_num_objects,
+                        out_handle_attrs, buffers, real_buffers).detach()
+
+        return await self.send_request_async(target_session, request_id, context, in_data, in_size,
+                    in_send_pid, real_buffers, in_objects, in_handles, out_size, parse)
+
+    async def send_request_async(self, session, request_id, context, in_data, in_size,
+                                    send_pid, buffers, objects, handles, out_size, parse):
+        """
+        Like send_request, for dispatch_async. The reply only lives
+        as long as the request's message buffer, so it's returned
+        as parsed by parse.
+        """
+
+        root = self.domain_root
+        if root is not None and root.pending_closes:
+            root.flush_closes()
+
+        msg = acquire_async_buffer()
+        base = memoryview(msg).cast("B")
+
+        try:
+            req = self.make_request(base, request_id, context, in_size,
+                        send_pid, buffers, objects, handles)
+
+            req.insert(req.data, in_data)
+        except:
+            release_async_buffer(msg)
+            raise
+
+        pool = None
+
+        if session == 0:
+            # Don't block the event loop waiting for a pooled session
+            pool = self.pool
+            if pool is not None:
+                session = pool.acquire(blocking=False)
+                if session is None:
+                    pool = None
+
+            if pool is None:
+                session = self.session
+
+        try:
+            event = svc.send_async_request_with_user_buffer(addressof(msg), sizeof(msg), session)
+        except:
+            finish_async(None, msg, pool, session)
+            raise
+
+        fut = None
+
+        try:
+            fut = waiter.wait(asyncio.get_running_loop(), event)
+            await asyncio.shield(fut)
+
+            return parse(cmif.Response(base, self.object_id != 0, out_size))
+        finally:
+            if fut is None or fut.done():
+                finish_async(event, msg, pool, session)
+            else:
+                # The kernel will still write the reply into msg, so
+                # it can only be reused once the request completes
+                fut.add_done_callback(lambda f: finish_async(event, msg, pool, session))
+
+    def send_request(self, session, request_id, context, in_data, in_size,
+                        send_pid, buffers, objects, handles, out_size):
+        root = self.domain_root
+        if root is not None and root.pending_closes:
+            root.flush_closes()
+
+        if session == 0:
+            # close can drop the pool from another thread at any point
+            pool = self.pool
+            if pool is not None:
+                session = pool.acquire()
 
-        util.buf_insert(base, in_off, in_data)
+                try:
+                    return self.send_request(session, request_id, context, in_data, in_size,
+                                send_pid, buffers, objects, handles, out_size)
+                finally:
+                    pool.release(session)
 
-        print(base)
+            session = self.session
 
-        tls = arm.tls()
-        for i, v in enumerate(base):
-            tls[i] = v
+        base = arm.ipc_buffer()
 
-        svc.send_sync_request(self.session if target_session == 0 else target_session)
+        if self.use_accel:
+            return self.dispatch_accel(base, session, request_id, context, in_data,
+                        send_pid, buffers, objects, handles, out_size)
 
-        base = bytearray(tls[:0x100])
-        base = base.replace(b"SFCI", b"SFCO")
+        req = self.make_request(base, request_id, context, in_size,
+                    send_pid, buffers, objects, handles)
 
-        out = self.parse_response(base, out_size, out_num_objects, out_handle_attrs)
-        
-        if isinstance(out_type, type):
-            out["out"] = out_type.from_buffer_copy(out["out"])
+        req.insert(req.data, in_data)
 
-        out["buffers"] = []
-        for buf, real_buf in zip(buffers, real_buffers):
-            if not isinstance(buf[0], Buffer) and real_buf[1] & BufferAttr.Out.value:
-                out["buffers"].append(real_buf[0].contents)
+        svc.send_sync_request(session)
 
-        return out
+        return cmif.Response(base, self.object_id != 0, out_size)
 
     def make_request(self, base, request_id, context, data_size,
                         send_pid, buffers, objects, handles):
-        fmt = cmif.RequestFormat(
-            object_id = self.object_id,
-            request_id = request_id,
-            context = context,
-            data_size = data_size,
-            server_pointer_size = self.pointer_buffer_size,
-            num_objects = len(objects),
-            num_handles = len(handles),
-            send_pid = send_pid,
-        )
+        pointer_size = self.server_pointer_size(buffers, request_id)
 
-        for _, attr in buffers:
-            fmt.process_buffer(attr)
+        if self.use_templates:
+            tmpl = cmif.request_template(self.object_id, request_id, context, data_size, send_pid,
+                        tuple(attr for _, attr in buffers), len(objects), len(handles),
+                        pointer_size)
 
-        req = cmif.Request(base, fmt)
+            req = tmpl.instantiate(base)
+        else:
+            fmt = cmif.RequestFormat(
+                object_id = self.object_id,
+                request_id = request_id,
+                context = context,
+                data_size = data_size,
+                server_pointer_size = pointer_size,
+                num_objects = len(objects),
+                num_handles = len(handles),
+                send_pid = send_pid,
+            )
+
+            for _, attr in buffers:
+                fmt.process_buffer(attr)
+
+            req = cmif.Request(base, fmt)
 
         if self.object_id != 0:
             for obj in objects:
@@ -113,36 +293,74 @@ class Service:
         for buf, attr in buffers:
             req.process_buffer(buf, attr)
 
-        return req.data
+        return req
 
-    def parse_response(self, base, out_size, num_out_objects, out_handle_attrs):
-        out = {
-            "objects": [],
-            "handles": [],
-        }
+    def dispatch_accel(self, base, session, request_id, context, in_data,
+                        send_pid, buffers, objects, handles, out_size):
+        pointer_size = self.server_pointer_size(buffers, request_id)
 
-        is_domain = self.object_id != 0
+        result, data, objects_off, copy_handles, move_handles = _nx.cmifDispatch(
+            session, self.object_id, request_id, context, send_pid, in_data,
+            [(buf.ptr, buf.size, attr) for buf, attr in buffers],
+            [obj.object_id for obj in objects], handles,
+            pointer_size, out_size,
+        )
+
+        if result != 0:
+            raise ResultException(Result(result))
 
-        res = cmif.Response(base, is_domain, out_size)
+        return cmif.Response.from_offsets(base, data, objects_off, copy_handles, move_handles)
 
-        out["out"] = bytes(base[res.data : res.data + out_size])
+    def server_pointer_size(self, buffers, request_id=None):
+        """
+        The pointer buffer size to encode a request with buffers.
+        It only matters for HipcAutoSelect buffers, so it's only
+        queried once a request has one.
+        """
 
-        for i in range(num_out_objects):
-            if is_domain:
-                out["objects"].append(DomainSubService(self, res.get_object()))
+        size = self.pointer_buffer_size
+        if size is None:
+            for _, attr in buffers:
+                if attr & BufferAttr.HipcAutoSelect.value:
+                    size = self.load_pointer_buffer_size()
+                    break
             else:
-                out["objects"].append(NonDomainSubService(self, res.get_move_handle()))
+                return 0
 
-        for attr in out_handle_attrs:
-            if attr == OutHandleAttr.HipcCopy:
-                out["handles"].append(res.get_copy_handle())
-            elif attr == OutHandleAttr.HipcMove:
-                out["handles"].append(res.get_move_handle())
+        if self.transfer_policy is not None:
+            return self.transfer_policy.pointer_size(request_id, size)
+
+        return size
+
+    def load_pointer_buffer_size(self):
+        size = _pointer_buffer_sizes.get(self.name)
+
+        if size is None:
+            try:
+                size = cmif.query_pointer_buffer_size(self.session)
+            except ResultException:
+                # Left unknown, so that the next request to need it asks again
+                return 0
+
+            if self.name is not None:
+                _pointer_buffer_sizes[self.name] = size
+
+        self.pointer_buffer_size = size
+
+        return size
+
+    def parse_response(self, res, out_type, out_size, num_out_objects,
+                        out_handle_attrs, buffers, real_buffers):
+        out = Response(self, res, out_type, out_size, num_out_objects,
+                    out_handle_attrs, buffers, real_buffers)
+
+        if out_size > 0 and not isinstance(out_type, (type, int)):
+            out.out_into(out_type)
+            out._out = out_type
 
         return out
 
-    @staticmethod
-    def parse_buffers(buffers):
+    def parse_buffers(self, buffers):
         real_buffers = []
         for first, attr in buffers:
             if isinstance(attr, enum.Enum):
@@ -150,35 +368,41 @@ class Service:
 
             if isinstance(first, Buffer):
                 buf = first
-            else:
-                if isinstance(first, int):
-                    size = first
-                    first = (c_char * size)()
-                    attr |= BufferAttr.Out.value
-                elif isinstance(first, type):
-                    size = sizeof(first)
-
-                    if _ctypes.Array in first.__bases__:
-                        first = first()
-                    else:
-                        first = pointer(first())
-
-                    attr |= BufferAttr.Out.value
-                elif isinstance(first, (bytes, bytearray)):
-                    size = len(first)
-                    first = (c_char * size)(*first)
-                    attr |= BufferAttr.In.value
+            elif isinstance(first, int):
+                pool = self.transfer_pool
+
+                if attr & BufferAttr.HipcMapAlias.value and pool is not None:
+                    buf = Buffer(pool.acquire(first), first)
+                else:
+                    buf = Buffer(bytearray(first))
+
+                attr |= BufferAttr.Out.value
+            elif isinstance(first, type):
+                if _ctypes.Array in first.__bases__:
+                    buf = Buffer(first())
                 else:
-                    size = sizeof(first)
-                    first = pointer(first)
+                    buf = Buffer(pointer(first()), sizeof(first))
+
+                attr |= BufferAttr.Out.value
+            else:
+                # Anything else is used in place, and sent unless told otherwise
+                buf = Buffer(first)
+
+                if attr & (BufferAttr.In.value | BufferAttr.Out.value) == 0:
                     attr |= BufferAttr.In.value
 
-                buf = Buffer(first, size)
+            if buf.readonly and attr & BufferAttr.Out.value:
+                raise TypeError("Read-only buffers cannot be received into")
 
             real_buffers.append((buf, attr))
 
         return real_buffers
 
+    @staticmethod
+    def parse_handles(handles):
+        # Kernel objects like nx.kernel.SharedMemory are sent by their handle
+        return [getattr(h, "handle", h) for h in handles]
+
     @property
     def active(self):
         return self.session != 0
@@ -196,34 +420,135 @@ class Service:
         return self.active and not self.own_handle and self.object_id != 0
 
     def close(self):
-        if not self.closed:
-            if self.own_handle or self.object_id != 0:
-                base = bytearray()
-                cmif.make_close_request(base, 0 if self.own_handle else self.object_id)
+        with self.lock:
+            if self.closed:
+                return
 
-                tls = arm.tls()
-                for i, v in enumerate(base):
-                    tls[i] = v
-
-                try:
-                    svc.send_sync_request(self.session)
-                except:
-                    pass
-
-                try:
-                    if self.own_handle:
-                        svc.close_handle(self.session)
-                except:
-                    pass
+            session = self.session
+            own_handle = self.own_handle
+            object_id = self.object_id
+            shared_name = self.shared_name
 
             self.session = 0
             self.own_handle = False
             self.object_id = 0
             self.pointer_buffer_size = 0
+            self.shared_name = None
+
+            if self.domain_root is self:
+                # Closing the session closes every object in the domain
+                objects = list(self.domain_objects.values())
+                self.domain_objects.clear()
+                self.pending_closes.clear()
+            else:
+                objects = ()
+
+        for obj in objects:
+            obj.session = 0
+
+        pool = self.pool
+        self.pool = None
+
+        if pool is not None:
+            pool.close()
+
+        if own_handle:
+            close_session(session)
+        elif object_id != 0 and self.domain_root is not self:
+            self.domain_root.release_object(object_id)
+        elif shared_name is not None:
+            self.sm.release_service(shared_name)
+
+    def enable_pool(self, max_size, max_idle=None, tag=None):
+        """
+        Sends requests over a pool of up to max_size sessions, cloned
+        from this one as needed, so that several threads can have
+        requests in flight at once.
+        """
+
+        if self.object_id != 0:
+            raise ValueError("Domain objects cannot be pooled")
+
+        with self.lock:
+            if self.pool is None:
+                self.pool = SessionPool(self.session, max_size, max_idle, tag)
+
+        return self.pool
 
     def convert_to_domain(self):
-        if not self.own_handle:
-            pass
+        """
+        Converts the session into a domain, so that the objects
+        it hands out are referred to by id over this session
+        instead of each needing a session of their own.
+        """
+
+        with self.lock:
+            if self.object_id != 0:
+                return
+
+            if self.pool is not None:
+                raise ValueError("Pooled services cannot be converted to domains")
+
+            if not self.own_handle:
+                # Don't convert a session someone else owns, convert a clone of it
+                self.session = cmif.clone_current_object(self.session)
+                self.own_handle = True
+
+                if self.shared_name is not None:
+                    # Only the clone is used from here on
+                    self.sm.release_service(self.shared_name)
+                    self.shared_name = None
+
+            self.set_domain(cmif.convert_current_object_to_domain(self.session))
+
+    def set_domain(self, object_id):
+        """
+        Makes this the root of the domain its session
+        has been converted to, with object_id.
+        """
+
+        self.object_id = object_id
+
+        self.domain_root = self
+        self.domain_objects = weakref.WeakValueDictionary()
+        self.pending_closes = collections.deque()
+
+    def release_object(self, object_id):
+        """
+        Queues a close request for an object in this domain.
+
+        Objects are often closed from __del__, which can run in the
+        middle of another request on the same thread, so the close
+        requests are only sent by flush_closes, which is called
+        before the next request to the domain. If the domain itself
+        is closed first, they are never sent at all.
+
+        That can happen while this thread holds the lock, so the lock
+        isn't taken here. pending_closes is a deque, which is safe to
+        use from any thread without it.
+        """
+
+        if self.closed:
+            return
+
+        self.domain_objects.pop(object_id, None)
+        self.pending_closes.append(object_id)
+
+    def flush_closes(self):
+        """
+        Sends the close requests queued by release_object.
+        """
+
+        session = self.session
+        pending = self.pending_closes
+
+        while pending:
+            try:
+                object_id = pending.popleft()
+            except IndexError:
+                break
+
+            close_session(session, object_id)
 
     def __del__(self):
         self.close()
@@ -234,8 +559,224 @@ class Service:
     def __exit__(self):
         self.close()
 
+def close_session(session, object_id=0):
+    cmif.make_close_request(arm.ipc_buffer(), object_id)
+
+    try:
+        svc.send_sync_request(session)
+    except:
+        pass
+
+    try:
+        if object_id == 0:
+            svc.close_handle(session)
+    except:
+        pass
+
+def finish_async(event, msg, pool=None, session=0):
+    if event is not None:
+        svc.close_handle(event)
+
+    release_async_buffer(msg)
+
+    if pool is not None:
+        pool.release(session)
+
+class SessionPool:
+    """
+    Sessions to the same object, cloned from an original session
+    with CloneCurrentObject, or CloneCurrentObjectEx if a tag
+    is given.
+
+    Sessions are cloned when a request is sent while all others are
+    busy, up to max_size including the original. Once more than
+    max_idle sessions are idle, released clones are closed again,
+    as are all of them once the pool is closed.
+    """
+
+    def __init__(self, session, max_size, max_idle=None, tag=None):
+        if max_idle is None:
+            max_idle = max_size
+
+        self.session = session
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.tag = tag
+
+        self.cond = threading.Condition()
+        self.idle = [session]
+        self.size = 1
+
+        self.closed = False
+
+    def acquire(self, blocking=True):
+        with self.cond:
+            while not self.idle and self.size >= self.max_size:
+                if not blocking:
+                    return None
+
+                self.cond.wait()
+
+            if self.idle:
+                return self.idle.pop()
+
+            self.size += 1
+
+        try:
+            return cmif.clone_current_object(self.session, self.tag)
+        except:
+            with self.cond:
+                self.size -= 1
+                self.cond.notify()
+
+            raise
+
+    def release(self, session):
+        with self.cond:
+            shrink = session != self.session and (self.closed or len(self.idle) >= self.max_idle)
+
+            if shrink:
+                self.size -= 1
+            else:
+                self.idle.append(session)
+
+            self.cond.notify()
+
+        if shrink:
+            close_session(session)
+
+    def close(self):
+        """
+        Closes every idle clone. The original session is left open.
+        """
+
+        with self.cond:
+            self.closed = True
+
+            clones = [s for s in self.idle if s != self.session]
+
+            self.idle = [s for s in self.idle if s == self.session]
+            self.size -= len(clones)
+
+        for session in clones:
+            close_session(session)
+
+class Response:
+    """
+    The response to a request sent with Service.dispatch.
+
+    The out data, handles and objects are only decoded from the
+    received message when they are first accessed. The message is
+    read from the IPC buffer in place, so the response must either
+    be used before the next request is sent from the same thread,
+    or be detached from the IPC buffer with detach().
+    """
+
+    __slots__ = (
+        "srv", "res", "out_type", "out_size", "num_out_objects", "out_handle_attrs",
+        "buffer_args", "real_buffers", "_out", "_object_ids", "_objects", "_handles",
+    )
+
+    def __init__(self, srv, res, out_type, out_size, num_out_objects,
+                    out_handle_attrs, buffer_args, real_buffers):
+        self.srv = srv
+        self.res = res
+        self.out_type = out_type
+        self.out_size = out_size
+        self.num_out_objects = num_out_objects
+        self.out_handle_attrs = out_handle_attrs
+        self.buffer_args = buffer_args
+        self.real_buffers = real_buffers
+
+        self._out = None
+        self._object_ids = None
+        self._objects = None
+        self._handles = None
+
+    @property
+    def out(self):
+        if self._out is None:
+            res = self.res
+
+            if isinstance(self.out_type, type):
+                self._out = self.out_type.from_buffer_copy(res.base, res.data)
+            else:
+                self._out = bytes(res.base[res.data : res.data + self.out_size])
+
+        return self._out
+
+    def out_into(self, obj):
+        """
+        Decodes the out data directly into the ctypes instance obj.
+        """
+
+        res = self.res
+        size = sizeof(obj)
+
+        memoryview(obj).cast("B")[:] = res.base[res.data : res.data + size]
+
+        return obj
+
+    def decode_handles(self):
+        res = self.res
+
+        if self.srv.object_id != 0:
+            self._object_ids = [res.get_object() for i in range(self.num_out_objects)]
+        else:
+            self._object_ids = [res.get_move_handle() for i in range(self.num_out_objects)]
+
+        handles = []
+        for attr in self.out_handle_attrs:
+            if attr == OutHandleAttr.HipcCopy:
+                handles.append(res.get_copy_handle())
+            elif attr == OutHandleAttr.HipcMove:
+                handles.append(res.get_move_handle())
+
+        self._handles = handles
+
+    @property
+    def handles(self):
+        if self._handles is None:
+            self.decode_handles()
+
+        return self._handles
+
+    @property
+    def objects(self):
+        if self._objects is None:
+            if self._object_ids is None:
+                self.decode_handles()
+
+            if self.srv.object_id != 0:
+                self._objects = [DomainSubService(self.srv, i) for i in self._object_ids]
+            else:
+                self._objects = [NonDomainSubService(self.srv, h) for h in self._object_ids]
+
+        return self._objects
+
+    @property
+    def buffers(self):
+        buffers = []
+        for buf, real_buf in zip(self.buffer_args, self.real_buffers):
+            if not isinstance(buf[0], Buffer) and real_buf[1] & BufferAttr.Out.value:
+                buffers.append(real_buf[0].contents)
+
+        return buffers
+
+    def detach(self):
+        """
+        Copies the received message out of the IPC buffer so
+        the response stays valid after further requests.
+        """
+
+        res = self.res
+        res.base = bytearray(res.base[:arm.ipc_buffer_size])
+
+        return self
+
 class NonDomainSubService(Service):
     def __init__(self, parent, handle):
+        self.lock = threading.Lock()
         self.session = handle
         self.own_handle = True
         self.object_id = 0
@@ -243,11 +784,15 @@ class NonDomainSubService(Service):
 
 class DomainSubService(Service):
     def __init__(self, parent, object_id):
+        self.lock = threading.Lock()
         self.session = parent.session
         self.own_handle = False
         self.object_id = object_id
         self.pointer_buffer_size = parent.pointer_buffer_size
 
+        self.domain_root = parent.domain_root
+        self.domain_root.domain_objects[object_id] = self
+
 class SubService:
     def __init__(self, srv):
         self.srv = srv
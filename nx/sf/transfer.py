@@ -0,0 +1,263 @@
+"""
+How buffers are transferred to services.
+
+The kernel maps HipcMapAlias buffers into the server page by page,
+and the partial pages at either end of an unaligned buffer have to
+be copied instead. Buffers from a BufferPool are page-aligned and
+rounded up to power of two size classes, so they map cleanly and
+can be reused by requests of similar sizes. Services only use one
+if their transfer_pool is set, since where mapping costs nothing,
+like on host builds, a fresh buffer is cheaper to get.
+
+HipcAutoSelect buffers are either copied through the server's pointer
+buffer or mapped, and a TransferPolicy decides which.
+"""
+
+import threading
+import time
+from ctypes import *
+
+from .. import util
+
+page_size = 0x1000
+
+class BufferPool:
+    """
+    Page-aligned buffers in power of two size classes, from a page up
+    to max_class_size. Larger buffers are still aligned, but never kept.
+
+    acquire hands out a c_char array over a pooled block, which goes
+    back to the pool once the array and every view of it are gone, so
+    memory is never reused while something can still see it. At most
+    max_held bytes are kept for reuse, the rest is freed.
+    """
+
+    def __init__(self, max_class_size=0x100000, max_held=0x800000):
+        self.max_class_size = max_class_size
+        self.max_held = max_held
+
+        self.lock = threading.RLock()
+        self.free = {}
+        self.types = {}
+
+        self.bytes_held = 0
+        self.bytes_in_use = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def size_class(self, size):
+        if size <= page_size:
+            return page_size
+
+        block_size = 1 << (size - 1).bit_length()
+        if block_size > self.max_class_size:
+            return util.align(size, page_size)
+
+        return block_size
+
+    def array_type(self, block_size):
+        array_type = self.types.get(block_size)
+
+        if array_type is None:
+            class array_type(c_char * block_size):
+                pool = self
+
+                def __del__(self):
+                    self.pool.release(self.block)
+
+            self.types[block_size] = array_type
+
+        return array_type
+
+    def acquire(self, size):
+        """
+        Returns a page-aligned c_char array of at least size bytes,
+        the first size of which are zeroed.
+        """
+
+        block_size = self.size_class(size)
+
+        if block_size > self.max_class_size:
+            with self.lock:
+                self.misses += 1
+
+            return (c_char * block_size).from_buffer(util.aligned_array(block_size, page_size))
+
+        with self.lock:
+            blocks = self.free.get(block_size)
+
+            if blocks:
+                block = blocks.pop()
+                self.bytes_held -= block_size
+                self.hits += 1
+            else:
+                block = None
+                self.misses += 1
+
+            self.bytes_in_use += block_size
+
+        if block is None:
+            block = util.aligned_array(block_size, page_size)
+        else:
+            # Whatever the server doesn't write mustn't show an earlier request's data
+            memset(block, 0, size)
+
+        buf = self.array_type(block_size).from_buffer(block)
+        buf.block = block
+
+        return buf
+
+    def release(self, block):
+        block_size = len(block)
+
+        with self.lock:
+            self.bytes_in_use -= block_size
+
+            if self.bytes_held + block_size > self.max_held:
+                return
+
+            self.free.setdefault(block_size, []).append(block)
+            self.bytes_held += block_size
+
+    def trim(self):
+        """
+        Frees every buffer kept for reuse.
+        """
+
+        with self.lock:
+            self.free.clear()
+            self.bytes_held = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+
+        return self.hits / total
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits":         self.hits,
+                "misses":       self.misses,
+                "hit_rate":     self.hit_rate,
+                "bytes_held":   self.bytes_held,
+                "bytes_in_use": self.bytes_in_use,
+            }
+
+class TransferPolicy:
+    """
+    Decides whether HipcAutoSelect buffers are sent through the
+    server's pointer buffer or mapped, for a Service's transfer_policy.
+
+    A request's auto-select buffers are copied through the pointer
+    buffer while they fit in pointer_limit bytes of it, and mapped
+    otherwise. limits overrides pointer_limit by request id, and None
+    allows the whole pointer buffer, like when there's no policy.
+    """
+
+    def __init__(self, pointer_limit=None, limits=None):
+        self.pointer_limit = pointer_limit
+        self.limits = dict(limits or {})
+
+        # Measurements from calibrate by request id, as
+        # lists of (size, pointer ns, map-alias ns)
+        self.calibrations = {}
+
+    def limit(self, request_id):
+        return self.limits.get(request_id, self.pointer_limit)
+
+    def pointer_size(self, request_id, pointer_buffer_size):
+        """
+        How much of the pointer buffer a request may use.
+        """
+
+        limit = self.limit(request_id)
+        if limit is None:
+            return pointer_buffer_size
+
+        return min(limit, pointer_buffer_size)
+
+    def calibrate(self, srv, request_id, call, sizes=None, number=16):
+        """
+        Measures both paths against srv, which has to use this policy,
+        and stores the crossover point as the limit for request_id.
+
+        call(size) has to send request_id with a single auto-select
+        buffer of size bytes. Each size, by default powers of two and
+        the pointer buffer's size, is timed through the pointer buffer
+        and mapped, taking the fastest of number calls. The limit is
+        where mapping becomes faster, interpolated between the sizes
+        measured either side of it, or the whole pointer buffer if it
+        never does. Returns it.
+        """
+
+        if srv.transfer_policy is not self:
+            raise ValueError("The service does not use this policy")
+
+        pointer_buffer_size = srv.pointer_buffer_size
+        if pointer_buffer_size is None:
+            pointer_buffer_size = srv.load_pointer_buffer_size()
+
+        if sizes is None:
+            sizes = []
+
+            size = 0x40
+            while size < pointer_buffer_size:
+                sizes.append(size)
+                size *= 2
+
+            sizes.append(pointer_buffer_size)
+
+        def measure(size):
+            best = None
+            for i in range(number):
+                start = time.perf_counter_ns()
+                call(size)
+                elapsed = time.perf_counter_ns() - start
+
+                if best is None or elapsed < best:
+                    best = elapsed
+
+            return best
+
+        measurements = []
+        limit = None
+
+        last_size = last_margin = 0
+        for size in sorted(sizes):
+            if size > pointer_buffer_size:
+                break
+
+            self.limits[request_id] = pointer_buffer_size
+            pointer_ns = measure(size)
+
+            self.limits[request_id] = 0
+            map_alias_ns = measure(size)
+
+            measurements.append((size, pointer_ns, map_alias_ns))
+
+            if limit is not None:
+                continue
+
+            # How much faster the pointer buffer is
+            margin = map_alias_ns - pointer_ns
+            if margin < 0:
+                limit = last_size + (size - last_size) * last_margin // (last_margin - margin)
+            else:
+                last_size, last_margin = size, margin
+
+        if limit is None:
+            limit = pointer_buffer_size
+
+        limit = min(limit, pointer_buffer_size)
+
+        self.limits[request_id] = limit
+        self.calibrations[request_id] = measurements
+
+        return limit
+
+# Shared by the services that set it as their transfer_pool
+default_pool = BufferPool()
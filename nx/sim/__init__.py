@@ -0,0 +1,7 @@
+"""
+A simulated Horizon kernel for host builds of _nx, so that nx.sf
+can be used and measured without a Switch.
+"""
+
+from .kernel import Kernel
+from .sm import ServiceManager
@@ -0,0 +1,662 @@
+import collections
+import threading
+import time
+from ctypes import addressof, memmove
+
+import _nx
+
+from .. import kernel, util
+from ..sf import hipc, server
+
+from .sm import ServiceManager
+
+_maps = None
+
+class Port:
+    """
+    A port served by Python objects on the thread connecting to it.
+    """
+
+    def __init__(self, factory, pointer_buffer_size):
+        self.factory = factory
+        self.pointer_buffer_size = pointer_buffer_size
+
+class RemotePort:
+    """
+    A port served by whoever holds its handle, with accept_session.
+    """
+
+    def __init__(self, max_sessions):
+        self.max_sessions = max_sessions
+        self.pending = collections.deque()
+
+    @property
+    def signaled(self):
+        return len(self.pending) > 0
+
+class Request:
+    def __init__(self, msg, event=None):
+        self.msg = msg
+        self.event = event
+
+        req = hipc.ParsedRequest(msg)
+        self.recv_list = req.recv_list
+        self.recv_static_mode = req.recv_static_mode
+
+        self.done = False
+        self.rc = 0
+
+class ServerSession:
+    def __init__(self):
+        self.requests = collections.deque()
+        self.current = None
+
+        self.client_closed = False
+        self.closed = False
+
+    @property
+    def signaled(self):
+        return len(self.requests) > 0 or self.client_closed
+
+class ClientSession:
+    def __init__(self, server):
+        self.server = server
+
+class Event:
+    def __init__(self, signaled=False):
+        self.signaled = signaled
+
+class WritableEvent:
+    def __init__(self, event):
+        self.event = event
+
+class SharedMemory:
+    def __init__(self, size):
+        self.memory = util.aligned_array(size, 0x1000)
+        self.size = size
+
+        self.mappings = 0
+
+class TransferMemory:
+    def __init__(self, address, size, perm):
+        self.address = address
+        self.size = size
+        self.perm = perm
+
+        self.mapped = False
+
+class Thread:
+    def __init__(self):
+        self.signaled = False
+        self.cancelled = False
+
+        self.core_id = -2
+        self.affinity_mask = 0
+
+class ThreadHandle:
+    """
+    Closes a thread's handle once the thread exits.
+    """
+
+    def __init__(self, kernel, handle):
+        self.kernel = kernel
+        self.handle = handle
+
+    def __del__(self):
+        self.kernel.close_handle(self.handle)
+
+class Kernel:
+    """
+    Handles the svcs of a host build of _nx once installed.
+
+    Services registered with register_service are served by
+    nx.sf.server Objects, which are called on the thread sending
+    the request and decode the message from its IPC buffer, just
+    as a real server would. Services registered through sm instead
+    get a port to serve with svcReplyAndReceive, for instance with
+    nx.sf.server.ServerManager on another thread.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.handles = {}
+        self.next_handle = 1
+
+        # Receive buffers for the sessions served on the sending thread
+        self.pointer_buffers = {}
+
+        self.named_ports = {}
+        self.services = {}
+        self.mitms = {}
+
+        self.local = threading.local()
+
+        self.create_named_port("sm:", lambda: ServiceManager(self))
+
+    def install(self):
+        _nx.hostSetKernel(self)
+
+        return self
+
+    def uninstall(self):
+        _nx.hostSetKernel(None)
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.uninstall()
+
+    def create_named_port(self, name, factory, pointer_buffer_size=0):
+        self.named_ports[name] = Port(factory, pointer_buffer_size)
+
+    def register_service(self, name, factory, pointer_buffer_size=0x500):
+        """
+        Makes a service available through sm, each session to
+        it being served by a new object returned by factory.
+        """
+
+        self.services[name] = Port(factory, pointer_buffer_size)
+
+    def register_remote_service(self, name, max_sessions):
+        """
+        Makes a service available through sm, returning
+        a handle to the port its sessions are accepted on.
+        """
+
+        port, handle = self.create_port(max_sessions)
+        self.services[name] = port
+
+        return handle
+
+    def create_port(self, max_sessions):
+        port = RemotePort(max_sessions)
+
+        return port, self.add_handle(port)
+
+    def unregister_service(self, name):
+        del self.services[name]
+
+    def add_handle(self, obj):
+        with self.cond:
+            handle = self.next_handle
+            self.next_handle += 1
+
+            self.handles[handle] = obj
+
+        return handle
+
+    def add_session(self, session):
+        return self.add_handle(session)
+
+    def connect(self, port):
+        if isinstance(port, RemotePort):
+            server_session = ServerSession()
+            handle = self.add_handle(ClientSession(server_session))
+
+            with self.cond:
+                port.pending.append(server_session)
+                self.cond.notify_all()
+
+            return handle
+
+        return self.add_session(server.Session(self, port.factory(), port.pointer_buffer_size))
+
+    def process(self, handle, msg):
+        session = self.handles.get(handle)
+
+        if not isinstance(session, server.Session):
+            return kernel.result("InvalidHandle").value
+
+        if session.closed:
+            return kernel.result("SessionClosed").value
+
+        req = hipc.ParsedRequest(msg)
+
+        # Received into the session's own pointer buffer, as a server would have
+        pointer_buffer = self.pointer_buffers.get(handle)
+        if pointer_buffer is None:
+            pointer_buffer = util.aligned_array(max(session.pointer_buffer_size, 1), 0x10)
+            self.pointer_buffers[handle] = pointer_buffer
+
+        recv_entry = hipc.ParsedRecvEntry(addressof(pointer_buffer), session.pointer_buffer_size)
+        copy_statics(msg, [recv_entry], 2)
+
+        if session.process(msg, pointer_buffer):
+            copy_statics(msg, req.recv_list, req.recv_static_mode)
+
+        session.out_statics = ()
+
+        return 0
+
+    def send(self, handle, msg, event=None):
+        """
+        Queues a request on a session served through a port.
+        """
+
+        client = self.handles.get(handle)
+        if not isinstance(client, ClientSession):
+            return kernel.result("InvalidHandle").value, None
+
+        req = Request(msg, event)
+
+        with self.cond:
+            if client.server.closed:
+                return kernel.result("SessionClosed").value, None
+
+            client.server.requests.append(req)
+            self.cond.notify_all()
+
+        return 0, req
+
+    def wait(self, handles, timeout):
+        """
+        Waits for one of handles to be signaled, with cond held.
+        """
+
+        thread = self.current_thread()
+
+        if timeout >= 0:
+            deadline = time.monotonic() + timeout / 1e9
+        else:
+            deadline = None
+
+        while True:
+            if thread.cancelled:
+                thread.cancelled = False
+                return kernel.result("Cancelled").value, -1
+
+            for i, handle in enumerate(handles):
+                obj = self.handles.get(handle)
+                if obj is None:
+                    return kernel.result("InvalidHandle").value, i
+
+                if getattr(obj, "signaled", False):
+                    return 0, i
+
+            if deadline is None:
+                self.cond.wait()
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return kernel.result("TimedOut").value, -1
+
+                self.cond.wait(remaining)
+
+    def reply(self, handle, msg):
+        """
+        Sends the reply in msg to the request being handled on handle, with cond held.
+        """
+
+        session = self.handles.get(handle)
+        if not isinstance(session, ServerSession):
+            return kernel.result("InvalidHandle").value
+
+        req = session.current
+        if req is None:
+            return kernel.result("InvalidState").value
+
+        session.current = None
+
+        if not session.client_closed:
+            size = min(len(msg), len(req.msg))
+
+            req.msg[:size] = msg[:size]
+            copy_statics(req.msg, req.recv_list, req.recv_static_mode)
+
+        self.complete(req, 0)
+
+        return 0
+
+    def complete(self, req, rc):
+        req.done = True
+        req.rc = rc
+
+        if req.event is not None:
+            req.event.signaled = True
+
+        self.cond.notify_all()
+
+    # svcs
+
+    def send_sync_request(self, handle, msg):
+        if not isinstance(self.handles.get(handle), ClientSession):
+            return self.process(handle, msg)
+
+        rc, req = self.send(handle, msg)
+        if rc != 0:
+            return rc
+
+        with self.cond:
+            while not req.done:
+                self.cond.wait()
+
+        return req.rc
+
+    def send_async_request_with_user_buffer(self, handle, msg):
+        if not isinstance(self.handles.get(handle), ClientSession):
+            rc = self.process(handle, msg)
+            if rc != 0:
+                return rc, 0
+
+            # The reply has already been written
+            return 0, self.add_handle(Event(signaled=True))
+
+        event = Event()
+
+        rc, req = self.send(handle, msg, event)
+        if rc != 0:
+            return rc, 0
+
+        return 0, self.add_handle(event)
+
+    def connect_to_named_port(self, name):
+        port = self.named_ports.get(name)
+        if port is None:
+            return kernel.result("NotFound").value, 0
+
+        return 0, self.connect(port)
+
+    def wait_synchronization(self, handles, timeout):
+        with self.cond:
+            rc, index = self.wait(handles, timeout)
+
+        if rc != 0:
+            index = -1
+
+        return rc, index
+
+    def reply_and_receive(self, handles, reply_target, timeout, msg):
+        with self.cond:
+            if reply_target != 0:
+                rc = self.reply(reply_target, msg)
+                if rc != 0:
+                    return rc, -1
+
+                # The reply was sent, only the receive timed out
+                if len(handles) == 0:
+                    return kernel.result("TimedOut").value, -1
+
+            while True:
+                rc, index = self.wait(handles, timeout)
+                if rc != 0:
+                    return rc, index
+
+                session = self.handles[handles[index]]
+                if not isinstance(session, ServerSession):
+                    return 0, index
+
+                if len(session.requests) == 0:
+                    # Only signaled because the client closed its handle
+                    return kernel.result("SessionClosed").value, index
+
+                req = session.requests.popleft()
+                if req.done:
+                    continue
+
+                session.current = req
+
+                # The receive list the server left in its buffer
+                recv = hipc.ParsedRequest(msg)
+
+                size = min(len(msg), len(req.msg))
+                msg[:size] = req.msg[:size]
+
+                copy_statics(msg, recv.recv_list, recv.recv_static_mode)
+
+                return 0, index
+
+    def accept_session(self, handle):
+        with self.cond:
+            port = self.handles.get(handle)
+            if not isinstance(port, RemotePort):
+                return kernel.result("InvalidHandle").value, 0
+
+            if len(port.pending) == 0:
+                return kernel.result("NotFound").value, 0
+
+            session = port.pending.popleft()
+
+        return 0, self.add_handle(session)
+
+    def create_session(self):
+        session = ServerSession()
+
+        return 0, self.add_handle(session), self.add_handle(ClientSession(session))
+
+    def cancel_synchronization(self, handle):
+        with self.cond:
+            thread = self.handles.get(handle)
+            if not isinstance(thread, Thread):
+                return kernel.result("InvalidHandle").value
+
+            thread.cancelled = True
+            self.cond.notify_all()
+
+        return 0
+
+    def create_event(self):
+        event = Event()
+
+        return 0, self.add_handle(WritableEvent(event)), self.add_handle(event)
+
+    def signal_event(self, handle):
+        with self.cond:
+            writable = self.handles.get(handle)
+            if not isinstance(writable, WritableEvent):
+                return kernel.result("InvalidHandle").value
+
+            writable.event.signaled = True
+            self.cond.notify_all()
+
+        return 0
+
+    def clear_event(self, handle):
+        with self.cond:
+            event = self.handles.get(handle)
+            if isinstance(event, WritableEvent):
+                event = event.event
+
+            if not isinstance(event, Event):
+                return kernel.result("InvalidHandle").value
+
+            event.signaled = False
+
+        return 0
+
+    def reset_signal(self, handle):
+        with self.cond:
+            event = self.handles.get(handle)
+            if not isinstance(event, Event):
+                return kernel.result("InvalidHandle").value
+
+            if not event.signaled:
+                return kernel.result("InvalidState").value
+
+            event.signaled = False
+
+        return 0
+
+    # Every simulated process shares this one's address space,
+    # so memory is mapped at the address it already has
+
+    def create_shared_memory(self, size, local_perm, remote_perm):
+        if size == 0 or size % 0x1000 != 0:
+            return kernel.result("InvalidSize").value, 0
+
+        return 0, self.add_handle(SharedMemory(size))
+
+    def map_shared_memory(self, handle, size, perm):
+        shm = self.handles.get(handle)
+        if not isinstance(shm, SharedMemory):
+            return kernel.result("InvalidHandle").value, 0
+
+        if size != shm.size:
+            return kernel.result("InvalidSize").value, 0
+
+        shm.mappings += 1
+
+        return 0, addressof(shm.memory)
+
+    def unmap_shared_memory(self, handle, address, size):
+        shm = self.handles.get(handle)
+        if not isinstance(shm, SharedMemory):
+            return kernel.result("InvalidHandle").value
+
+        if address != addressof(shm.memory) or shm.mappings == 0:
+            return kernel.result("InvalidAddress").value
+
+        shm.mappings -= 1
+
+        return 0
+
+    def create_transfer_memory(self, address, size, perm):
+        if address % 0x1000 != 0:
+            return kernel.result("InvalidAddress").value, 0
+
+        if size == 0 or size % 0x1000 != 0:
+            return kernel.result("InvalidSize").value, 0
+
+        return 0, self.add_handle(TransferMemory(address, size, perm))
+
+    def map_transfer_memory(self, handle, size, perm):
+        tmem = self.handles.get(handle)
+        if not isinstance(tmem, TransferMemory):
+            return kernel.result("InvalidHandle").value, 0
+
+        if size != tmem.size:
+            return kernel.result("InvalidSize").value, 0
+
+        # Mapping has to agree with what the owner kept
+        if perm != tmem.perm or tmem.mapped:
+            return kernel.result("InvalidState").value, 0
+
+        tmem.mapped = True
+
+        return 0, tmem.address
+
+    def unmap_transfer_memory(self, handle, address, size):
+        tmem = self.handles.get(handle)
+        if not isinstance(tmem, TransferMemory):
+            return kernel.result("InvalidHandle").value
+
+        if address != tmem.address or not tmem.mapped:
+            return kernel.result("InvalidAddress").value
+
+        tmem.mapped = False
+
+        return 0
+
+    def set_thread_core_mask(self, handle, core_id, affinity_mask):
+        thread = self.handles.get(handle)
+        if not isinstance(thread, Thread):
+            return kernel.result("InvalidHandle").value
+
+        # Host threads are left to the host's scheduler
+        thread.core_id = core_id
+        thread.affinity_mask = affinity_mask
+
+        return 0
+
+    def close_handle(self, handle):
+        with self.cond:
+            obj = self.handles.pop(handle, None)
+            if obj is None:
+                return kernel.result("InvalidHandle").value
+
+            self.pointer_buffers.pop(handle, None)
+
+            if isinstance(obj, ClientSession):
+                obj.server.client_closed = True
+                self.cond.notify_all()
+            elif isinstance(obj, ServerSession):
+                obj.closed = True
+
+                requests = list(obj.requests)
+                if obj.current is not None:
+                    requests.append(obj.current)
+
+                obj.requests.clear()
+                obj.current = None
+
+                for req in requests:
+                    self.complete(req, kernel.result("SessionClosed").value)
+
+        return 0
+
+    def get_current_thread_handle(self):
+        return self.current_thread_handle()
+
+    def current_thread_handle(self):
+        thread = getattr(self.local, "thread", None)
+        if thread is None:
+            thread = ThreadHandle(self, self.add_handle(Thread()))
+            self.local.thread = thread
+
+        return thread.handle
+
+    def current_thread(self):
+        return self.handles[self.current_thread_handle()]
+
+def copy_statics(msg, recv_list, recv_static_mode):
+    """
+    Copies the pointer buffers sent with the message in msg into the
+    buffers of the receive list it's received with, and points their
+    descriptors at the copies.
+    """
+
+    if len(recv_list) == 0:
+        return
+
+    msg_info = hipc.ParsedRequest(msg)
+    offset = 0
+
+    for i, desc in enumerate(msg_info.send_statics):
+        if recv_static_mode == 2:
+            # Everything is received one after another into a single buffer
+            entry = recv_list[0]
+            address = entry.address + offset
+            size = max(min(desc.size, entry.size - offset), 0)
+
+            offset += size
+        else:
+            entry = recv_list[min(desc.index, len(recv_list) - 1)]
+            address = entry.address
+            size = min(desc.size, entry.size)
+
+        if size > 0:
+            memmove(address, sender_address(desc), size)
+
+        hipc.pack_static(msg, msg_info.send_statics_offset + hipc.static_size * i, desc.index, address, size)
+
+def sender_address(desc):
+    """
+    The address a pointer buffer was sent from.
+
+    Static descriptors only have room for 42 bits of address, which
+    is enough on the Switch but not in a host process. Where the real
+    kernel would look the sender's address up in its page tables,
+    the bits above that are recovered from this process's mappings.
+    """
+
+    global _maps
+
+    for refresh in (False, True):
+        if _maps is None or refresh:
+            _maps = read_maps()
+
+        for high in range(1 << 6):
+            candidate = desc.address | (high << 42)
+
+            for start, end in _maps:
+                if start <= candidate and candidate + desc.size <= end:
+                    return candidate
+
+    return desc.address
+
+def read_maps():
+    try:
+        with open("/proc/self/maps") as f:
+            return [tuple(int(x, 16) for x in line.split()[0].split("-")) for line in f]
+    except OSError:
+        return []
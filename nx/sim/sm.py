@@ -0,0 +1,143 @@
+import collections
+from ctypes import *
+
+from ..types import Result, ResultException
+from ..sf import server, service
+
+# sm results
+invalid_client       = Result(module=21, description=2)
+already_registered   = Result(module=21, description=4)
+invalid_service_name = Result(module=21, description=6)
+not_registered       = Result(module=21, description=7)
+
+class MitmProcessInfo(LittleEndianStructure):
+    _fields_ = [
+        ("process_id",      c_uint64),
+        ("program_id",      c_uint64),
+        ("override_status", c_uint64)
+    ]
+
+class Mitm:
+    def __init__(self, owner, port, query):
+        # The sm session that installed the mitm, which still gets the real service
+        self.owner = owner
+
+        self.port = port
+        self.query = service.Service(query)
+
+        # Sessions accepted on the port and not acknowledged yet
+        self.pending = collections.deque()
+
+class ServiceManager(server.Object):
+    """
+    The sm: named port, serving the services registered
+    with the simulated kernel, along with Atmosphere's
+    mitm extensions.
+    """
+
+    def __init__(self, kernel):
+        self.kernel = kernel
+        self.initialized = False
+        self.process_id = 0
+
+    def parse_name(self, ctx):
+        if not self.initialized:
+            raise ResultException(invalid_client)
+
+        name = ctx.data[:8].split(b"\0", 1)[0]
+        if len(name) == 0:
+            raise ResultException(invalid_service_name)
+
+        return name.decode()
+
+    @server.command(0)
+    def initialize(self, ctx):
+        self.initialized = True
+
+        if ctx.pid is not None:
+            self.process_id = ctx.pid
+
+    @server.command(1)
+    def get_service_handle(self, ctx):
+        name = self.parse_name(ctx)
+
+        port = self.kernel.services.get(name)
+        if port is None:
+            raise ResultException(not_registered)
+
+        mitm = self.kernel.mitms.get(name)
+        if mitm is not None and mitm.owner is not self:
+            info = MitmProcessInfo(process_id=self.process_id)
+
+            # ShouldMitm
+            if mitm.query.dispatch(65000, info, c_bool).out.value:
+                mitm.pending.append((info, self.kernel.connect(port)))
+                port = mitm.port
+
+        ctx.out_move_handles.append(self.kernel.connect(port))
+
+    @server.command(2)
+    def register_service(self, ctx):
+        name = self.parse_name(ctx)
+        if name in self.kernel.services:
+            raise ResultException(already_registered)
+
+        max_sessions = c_int32.from_buffer_copy(ctx.data, 12).value
+
+        ctx.out_move_handles.append(self.kernel.register_remote_service(name, max_sessions))
+
+    @server.command(3)
+    def unregister_service(self, ctx):
+        name = self.parse_name(ctx)
+        if name not in self.kernel.services:
+            raise ResultException(not_registered)
+
+        self.kernel.unregister_service(name)
+
+    @server.command(65000)
+    def install_mitm(self, ctx):
+        name = self.parse_name(ctx)
+        if name not in self.kernel.services:
+            raise ResultException(not_registered)
+
+        if name in self.kernel.mitms:
+            raise ResultException(already_registered)
+
+        port, port_handle = self.kernel.create_port(0)
+        _, query_server, query_client = self.kernel.create_session()
+
+        self.kernel.mitms[name] = Mitm(self, port, query_client)
+
+        ctx.out_move_handles.append(port_handle)
+        ctx.out_move_handles.append(query_server)
+
+    @server.command(65001)
+    def uninstall_mitm(self, ctx):
+        name = self.parse_name(ctx)
+
+        mitm = self.kernel.mitms.get(name)
+        if mitm is None or mitm.owner is not self:
+            raise ResultException(not_registered)
+
+        del self.kernel.mitms[name]
+
+        mitm.query.close()
+
+    @server.command(65003)
+    def acknowledge_mitm_session(self, ctx):
+        mitm = self.kernel.mitms.get(self.parse_name(ctx))
+        if mitm is None or mitm.owner is not self or len(mitm.pending) == 0:
+            raise ResultException(not_registered)
+
+        info, forward = mitm.pending.popleft()
+        ctx.out_move_handles.append(forward)
+
+        return info
+
+    @server.command(65004)
+    def has_mitm(self, ctx):
+        return c_bool(self.parse_name(ctx) in self.kernel.mitms)
+
+    @server.command(65100)
+    def is_service_registered(self, ctx):
+        return c_bool(self.parse_name(ctx) in self.kernel.services)
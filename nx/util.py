@@ -1,4 +1,4 @@
-from ctypes import sizeof
+from ctypes import *
 
 def align(value, a, up=True):
     if up:
@@ -18,6 +18,10 @@ def bits(value, low, high):
     return (value & ((1 << high) - 1)) >> low
 
 def extend_buf_to_offset(buf, offset):
+    # Fixed-size buffers, like the IPC buffer, are written in place
+    if not isinstance(buf, bytearray):
+        return
+
     buf_len = len(buf)
     if buf_len < offset:
         buf.extend(b"\x00" * (offset - buf_len))
@@ -26,11 +30,20 @@ def buf_insert(buf, offset, obj):
     if obj is None:
         return
 
+    # Copied straight out of obj, without a bytes object in between
+    data = memoryview(obj).cast("B")
+
     extend_buf_to_offset(buf, offset)
 
-    if isinstance(obj, (bytes, bytearray)):
-        size = len(obj)
-    else:
-        size = sizeof(obj)
+    buf[offset : offset + len(data)] = data
+
+def aligned_array(size, alignment):
+    """
+    Allocates a zeroed ctypes byte array whose
+    address is aligned to alignment.
+    """
+
+    raw = (c_ubyte * (size + alignment))()
+    offset = align(addressof(raw), alignment) - addressof(raw)
 
-    buf[offset : offset + size] = bytes(obj)
\ No newline at end of file
+    return (c_ubyte * size).from_buffer(raw, offset)
\ No newline at end of file
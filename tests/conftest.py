@@ -0,0 +1,42 @@
+"""
+The tests run against a host build of _nx and nx.sim:
+
+    python build.py build_ext --inplace
+    python -m pytest tests
+"""
+
+import gc
+
+import pytest
+
+from nx import sf, sim
+from nx.sf import service
+from nx.services import ServiceManager
+
+@pytest.fixture
+def kernel_class():
+    return sim.Kernel
+
+@pytest.fixture
+def kernel(kernel_class):
+    """
+    An installed kernel_class, by default nx.sim.Kernel,
+    with sf.Service.sm connected to it.
+    """
+
+    with kernel_class() as k:
+        sm = sf.Service.sm
+        sf.Service.sm = ServiceManager()
+
+        # Sizes are cached by service name, which tests reuse
+        service._pointer_buffer_sizes.clear()
+
+        try:
+            yield k
+        finally:
+            sf.Service.sm.close()
+            sf.Service.sm = sm
+
+            # Anything left from the test has to be closed while its
+            # handles still belong to this kernel
+            gc.collect()
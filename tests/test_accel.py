@@ -0,0 +1,277 @@
+"""
+Requests encoded and responses decoded by _nx.cmifDispatch have to
+match the Python encoder's, with and without request templates.
+"""
+
+from ctypes import *
+
+import pytest
+
+from nx import arm, sf, sim
+from nx.kernel import Event
+from nx.sf import server
+from nx.types import Result, ResultException
+
+modes = {
+    "accel":     dict(use_accel=True,  use_templates=True),
+    "templates": dict(use_accel=False, use_templates=True),
+    "python":    dict(use_accel=False, use_templates=False),
+}
+
+stale_tls = bytes(i * 7 & 0xff for i in range(arm.ipc_buffer_size))
+
+class RecordingKernel(sim.Kernel):
+    def __init__(self):
+        super().__init__()
+
+        self.requests = []
+
+    def send_sync_request(self, handle, msg):
+        self.requests.append(bytes(msg))
+
+        return super().send_sync_request(handle, msg)
+
+@pytest.fixture
+def kernel_class():
+    return RecordingKernel
+
+class Sub(server.Object):
+    def __init__(self, value):
+        self.value = value
+
+    @server.command(0)
+    def get(self, ctx):
+        return c_uint32(self.value)
+
+    @server.command(1)
+    def sum(self, ctx):
+        return c_uint32(self.value + sum(obj.value for obj in ctx.in_objects))
+
+class Echo(server.Object):
+    @server.command(0)
+    def add(self, ctx):
+        a, b = (c_uint32 * 2).from_buffer_copy(ctx.data)
+        return c_uint32(a + b)
+
+    @server.command(1)
+    def reverse(self, ctx):
+        if ctx.send_buffers and ctx.send_buffers[0].size:
+            src = bytes(ctx.send_buffer(0))
+        else:
+            src = bytes(ctx.static(0))
+
+        if ctx.recv_buffers and ctx.recv_buffers[0].size:
+            dst = ctx.recv_buffer(0)
+        else:
+            dst = ctx.recv_static(0)
+
+        dst[:len(src)] = src[::-1]
+
+    @server.command(2)
+    def open(self, ctx):
+        value = c_uint32.from_buffer_copy(ctx.data).value
+        ctx.out_objects.append(Sub(value))
+
+    @server.command(3)
+    def handles(self, ctx):
+        ctx.out_copy_handles.extend(ctx.copy_handles)
+        return c_uint32(len(ctx.copy_handles))
+
+    @server.command(4)
+    def pid(self, ctx):
+        return c_uint64(ctx.pid or 0)
+
+    @server.command(5)
+    def fail(self, ctx):
+        raise ResultException(Result(module=2, description=3))
+
+    @server.command(6)
+    def with_context(self, ctx):
+        return ctx.data[:8]
+
+class EchoService(sf.Service):
+    name = "echo"
+
+    cmd_add = sf.Command(0, c_uint32 * 2, c_uint32)
+    cmd_reverse = sf.Command(1, buffer_attrs=(sf.BufferAttr.In | sf.BufferAttr.HipcAutoSelect,
+                                              sf.BufferAttr.Out | sf.BufferAttr.HipcAutoSelect))
+    cmd_open = sf.Command(2, c_uint32, out_num_objects=1)
+
+class EchoDomain(EchoService):
+    domain = True
+
+def in_out(attr):
+    src = (c_char * 8)(*b"abcdefgh")
+    dst = (c_char * 8)()
+
+    return dst, [(sf.Buffer(src), sf.BufferAttr.In | attr), (sf.Buffer(dst), sf.BufferAttr.Out | attr)]
+
+def run(kernel, srv, monkeypatch, call):
+    """
+    Makes call(srv) in every mode, returning the
+    raw requests and results of each.
+    """
+
+    results = {}
+
+    for name, mode in modes.items():
+        for attr, value in mode.items():
+            monkeypatch.setattr(sf.Service, attr, value)
+
+        # Bytes past the end of a message are left as they were, and
+        # anything else left from the last message has to be overwritten
+        arm.ipc_buffer()[:] = stale_tls
+        kernel.requests.clear()
+
+        try:
+            result = call(srv)
+        except ResultException as e:
+            result = e.result
+
+        results[name] = (list(kernel.requests), result)
+
+    return results
+
+def assert_same(results):
+    expected = results["python"]
+
+    for name, got in results.items():
+        assert got[0] == expected[0], f"{name} encoded a different request"
+        assert got[1] == expected[1], f"{name} decoded a different result"
+
+    return expected[1]
+
+@pytest.fixture(params=[EchoService, EchoDomain])
+def srv(request, kernel):
+    kernel.register_service("echo", Echo)
+
+    srv = request.param()
+
+    # Otherwise the first mode to send an auto-select buffer queries it
+    srv.load_pointer_buffer_size()
+
+    yield srv
+    srv.close()
+
+def test_data(kernel, srv, monkeypatch):
+    results = run(kernel, srv, monkeypatch,
+                lambda s: s.dispatch(0, (c_uint32 * 2)(2, 3), c_uint32).out.value)
+
+    assert assert_same(results) == 5
+
+def test_out_bytes(kernel, srv, monkeypatch):
+    results = run(kernel, srv, monkeypatch,
+                lambda s: s.dispatch(0, (c_uint32 * 2)(2, 3), 4).out)
+
+    assert assert_same(results) == (5).to_bytes(4, "little")
+
+def test_context(kernel, srv, monkeypatch):
+    results = run(kernel, srv, monkeypatch,
+                lambda s: s.dispatch(6, c_uint64(7), 8, context=0x1234).out)
+
+    assert assert_same(results) == (7).to_bytes(8, "little")
+
+@pytest.mark.parametrize("attr", [sf.BufferAttr.HipcMapAlias, sf.BufferAttr.HipcPointer, sf.BufferAttr.HipcAutoSelect])
+def test_buffers(kernel, srv, monkeypatch, attr):
+    # The same memory is sent in each mode
+    dst, buffers = in_out(attr)
+
+    def call(s):
+        dst[:] = bytes(8)
+        s.dispatch(1, buffers=buffers)
+
+        return dst.raw
+
+    assert assert_same(run(kernel, srv, monkeypatch, call)) == b"hgfedcba"
+
+def test_out_buffer_by_size(kernel, srv, monkeypatch):
+    src = b"abcdefgh"
+
+    def call(s):
+        res = s.dispatch(1, buffers=[(src, sf.BufferAttr.In | sf.BufferAttr.HipcMapAlias),
+                                     (8, sf.BufferAttr.Out | sf.BufferAttr.HipcMapAlias)])
+
+        return bytes(res.buffers[0])
+
+    results = run(kernel, srv, monkeypatch, call)
+
+    # Out buffers of a size come from the transfer pool, at whichever address it hands out
+    assert {result for _, result in results.values()} == {b"hgfedcba"}
+
+def test_handles(kernel, srv, monkeypatch):
+    events = [Event(), Event()]
+
+    def call(s):
+        res = s.dispatch(3, out_type=c_uint32, in_handles=events,
+                    out_handle_attrs=[sf.OutHandleAttr.HipcCopy] * 2)
+
+        return res.out.value, res.handles
+
+    count, handles = assert_same(run(kernel, srv, monkeypatch, call))
+
+    assert count == 2
+    assert handles == [e.handle for e in events]
+
+    for e in events:
+        e.close()
+
+def test_send_pid(kernel, srv, monkeypatch):
+    results = run(kernel, srv, monkeypatch,
+                lambda s: s.dispatch(4, out_type=c_uint64, in_send_pid=True).out.value)
+
+    assert_same(results)
+
+def test_error(kernel, srv, monkeypatch):
+    results = run(kernel, srv, monkeypatch, lambda s: s.dispatch(5))
+
+    assert assert_same(results) == Result(module=2, description=3)
+
+def test_objects(kernel, srv, monkeypatch):
+    def call(s):
+        sub = s.dispatch(2, c_uint32(40), out_num_objects=1).objects[0]
+        value = sub.dispatch(0, out_type=c_uint32).out.value
+
+        sub.close()
+
+        return value
+
+    results = run(kernel, srv, monkeypatch, call)
+
+    # Each mode gets a new object, with an id of its own
+    assert {result for _, result in results.values()} == {40}
+
+def test_in_objects(kernel, monkeypatch):
+    kernel.register_service("echo", Echo)
+    srv = EchoDomain()
+
+    a = srv.dispatch(2, c_uint32(1), out_num_objects=1).objects[0]
+    b = srv.dispatch(2, c_uint32(2), out_num_objects=1).objects[0]
+
+    results = run(kernel, srv, monkeypatch,
+                lambda s: a.dispatch(1, out_type=c_uint32, in_objects=[b]).out.value)
+
+    assert assert_same(results) == 3
+
+    a.close()
+    b.close()
+    srv.close()
+
+def test_commands(kernel, srv, monkeypatch):
+    assert assert_same(run(kernel, srv, monkeypatch,
+                lambda s: s.cmd_add((c_uint32 * 2)(4, 3)).out.value)) == 7
+
+    dst = (c_char * 8)()
+    buffers = [sf.Buffer((c_char * 8)(*b"abcdefgh")), sf.Buffer(dst)]
+
+    assert assert_same(run(kernel, srv, monkeypatch,
+                lambda s: (s.cmd_reverse(buffers=buffers), dst.raw)[1])) == b"hgfedcba"
+
+    def call(s):
+        sub = s.cmd_open(c_uint32(9)).objects[0]
+        value = sub.dispatch(0, out_type=c_uint32).out.value
+
+        sub.close()
+
+        return value
+
+    assert {result for _, result in run(kernel, srv, monkeypatch, call).values()} == {9}
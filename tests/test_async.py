@@ -0,0 +1,108 @@
+import asyncio
+from ctypes import *
+
+import pytest
+
+from nx import sf
+from nx.sf import server, service
+from nx.sim import kernel as sim_kernel
+from nx.types import Result, ResultException
+
+class Adder(server.Object):
+    @server.command(0)
+    def add(self, ctx):
+        a, b = (c_uint32 * 2).from_buffer_copy(ctx.data)
+        return c_uint32(a + b)
+
+    @server.command(1)
+    def fail(self, ctx):
+        raise ResultException(Result(module=2, description=3))
+
+class AdderService(sf.Service):
+    name = "adder"
+
+@pytest.fixture
+def srv(kernel):
+    kernel.register_service("adder", Adder)
+
+    srv = AdderService()
+    yield srv
+    srv.close()
+
+def events(kernel):
+    return sum(isinstance(obj, sim_kernel.Event) for obj in kernel.handles.values())
+
+@pytest.mark.parametrize("accel", [False, True])
+def test_dispatch_async(srv, accel, monkeypatch):
+    monkeypatch.setattr(sf.Service, "use_accel", accel)
+
+    async def main():
+        return await asyncio.gather(*[srv.dispatch_async(0, (c_uint32 * 2)(i, i), c_uint32) for i in range(50)])
+
+    res = asyncio.run(main())
+
+    assert [r.out.value for r in res] == [2 * i for i in range(50)]
+
+def test_result_raised(srv, kernel):
+    async def main():
+        await srv.dispatch_async(1)
+
+    with pytest.raises(ResultException) as e:
+        asyncio.run(main())
+
+    assert e.value.result == Result(module=2, description=3)
+    assert events(kernel) == 0
+
+def test_wait_failure_cleans_up(srv, kernel, monkeypatch):
+    pool = srv.enable_pool(2)
+    failure = ResultException(Result(module=1, description=114))
+
+    def wait(loop, handle):
+        fut = loop.create_future()
+        loop.call_soon(fut.set_exception, failure)
+
+        return fut
+
+    monkeypatch.setattr(service.waiter, "wait", wait)
+    service._async_buffers.clear()
+
+    async def main():
+        await srv.dispatch_async(0, (c_uint32 * 2)(1, 2), c_uint32)
+
+    with pytest.raises(ResultException):
+        asyncio.run(main())
+
+    assert events(kernel) == 0
+    assert len(service._async_buffers) == 1
+    assert pool.idle == [srv.session]
+
+def test_cancel_waits_for_reply(srv, kernel, monkeypatch):
+    pending = []
+
+    def wait(loop, handle):
+        fut = loop.create_future()
+        pending.append(fut)
+
+        return fut
+
+    monkeypatch.setattr(service.waiter, "wait", wait)
+    service._async_buffers.clear()
+
+    async def main():
+        task = asyncio.ensure_future(srv.dispatch_async(0, (c_uint32 * 2)(1, 2), c_uint32))
+        await asyncio.sleep(0)
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        # The message buffer is still the kernel's until the request completes
+        assert len(service._async_buffers) == 0
+
+        pending[0].set_result(None)
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+
+    assert events(kernel) == 0
+    assert len(service._async_buffers) == 1
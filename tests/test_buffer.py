@@ -0,0 +1,162 @@
+import array
+import mmap
+from ctypes import *
+
+import pytest
+
+from nx import sf
+from nx.sf import server
+
+in_map_alias = sf.BufferAttr.In | sf.BufferAttr.HipcMapAlias
+out_map_alias = sf.BufferAttr.Out | sf.BufferAttr.HipcMapAlias
+
+class Pair(LittleEndianStructure):
+    _fields_ = [
+        ("a", c_uint32),
+        ("b", c_uint32),
+    ]
+
+class Filler(server.Object):
+    @server.command(0)
+    def fill(self, ctx):
+        buf = ctx.recv_buffer(0)
+        buf[:] = bytes(i & 0xff for i in range(len(buf)))
+
+    @server.command(1)
+    def sum(self, ctx):
+        return c_uint32(sum(ctx.send_buffer(0)))
+
+class FillerService(sf.Service):
+    name = "filler"
+
+@pytest.fixture(params=[False, True], ids=["python", "accel"])
+def srv(request, kernel, monkeypatch):
+    monkeypatch.setattr(sf.Service, "use_accel", request.param)
+    kernel.register_service("filler", Filler)
+
+    srv = FillerService()
+    yield srv
+    srv.close()
+
+def address(obj):
+    view = memoryview(obj)
+    return addressof((c_char * view.nbytes).from_buffer(view))
+
+@pytest.fixture
+def anonymous_mmap():
+    m = mmap.mmap(-1, 0x1000)
+    yield m
+    m.close()
+
+def writable_objects(m):
+    return {
+        "bytearray":  bytearray(16),
+        "memoryview": memoryview(bytearray(32))[8:24],
+        "array":      array.array("I", range(4)),
+        "mmap":       m,
+        "c_array":    (c_uint8 * 16)(),
+        "structure":  Pair(1, 2),
+    }
+
+@pytest.mark.parametrize("kind", ["bytearray", "memoryview", "array", "mmap", "c_array", "structure"])
+def test_in_place(kind, anonymous_mmap):
+    obj = writable_objects(anonymous_mmap)[kind]
+
+    buf = sf.Buffer(obj)
+
+    assert buf.ptr == address(obj)
+    assert buf.size == memoryview(obj).nbytes
+    assert not buf.readonly
+
+    del buf
+
+def test_bytes_in_place():
+    data = b"abcd"
+    buf = sf.Buffer(data)
+
+    assert buf.ptr == cast(c_char_p(data), c_void_p).value
+    assert buf.size == 4
+    assert buf.readonly
+
+def test_size():
+    buf = sf.Buffer(bytearray(16), 4)
+
+    assert buf.size == 4
+    assert len(buf.contents) == 4
+
+@pytest.mark.parametrize("kind", ["bytearray", "memoryview", "array", "mmap"])
+def test_contents_view(kind, anonymous_mmap):
+    obj = writable_objects(anonymous_mmap)[kind]
+
+    buf = sf.Buffer(obj)
+    contents = buf.contents
+
+    assert isinstance(contents, memoryview)
+    assert contents.nbytes == memoryview(obj).nbytes
+
+    # The same memory, not a copy of it
+    contents[0] = 0x5a
+    assert memoryview(obj).cast("B")[0] == 0x5a
+
+    contents.release()
+    del buf
+
+def test_contents_ctypes():
+    pair = Pair(1, 2)
+    assert sf.Buffer(pair).contents is pair
+
+    values = (c_uint32 * 2)(1, 2)
+    assert sf.Buffer(values).contents is values
+
+def test_contents_bytes():
+    contents = sf.Buffer(b"abcd").contents
+
+    assert isinstance(contents, memoryview)
+    assert contents == b"abcd"
+
+def test_not_contiguous():
+    with pytest.raises(ValueError):
+        sf.Buffer(memoryview(bytearray(16))[::2])
+
+def test_read_only_out(srv):
+    with open(__file__, "rb") as f:
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    for obj in (b"abcd", memoryview(b"abcd"), m):
+        assert sf.Buffer(obj).readonly
+
+        with pytest.raises(TypeError):
+            srv.dispatch(0, buffers=[(obj, out_map_alias)])
+
+        # Still fine to send
+        expected = sum(bytes(obj))
+        assert srv.dispatch(1, c_uint32(0), c_uint32, buffers=[(obj, in_map_alias)]).out.value == expected
+
+    m.close()
+
+@pytest.mark.parametrize("kind", ["bytearray", "memoryview", "array", "mmap", "c_array"])
+def test_received_in_place(srv, kind, anonymous_mmap):
+    obj = writable_objects(anonymous_mmap)[kind]
+    size = memoryview(obj).nbytes
+
+    res = srv.dispatch(0, buffers=[(obj, out_map_alias)])
+
+    assert bytes(memoryview(obj).cast("B")) == bytes(i & 0xff for i in range(size))
+
+    # Returned as a view of the object's own memory
+    out, = res.buffers
+    assert address(out) == address(obj)
+
+    del res, out
+
+def test_sent_in_place(srv, anonymous_mmap):
+    for obj in writable_objects(anonymous_mmap).values():
+        expected = sum(bytes(memoryview(obj).cast("B")))
+
+        (buf, attr), = srv.parse_buffers([(obj, in_map_alias)])
+        assert attr & sf.BufferAttr.In.value
+        assert buf.ptr == address(obj)
+
+        assert srv.dispatch(1, c_uint32(0), c_uint32, buffers=[(obj, in_map_alias)]).out.value == expected
+
+        del buf
@@ -0,0 +1,131 @@
+from ctypes import *
+
+import pytest
+
+from nx import arm
+from nx.sf import Buffer, BufferAttr, cmif
+
+class Object:
+    def __init__(self, object_id):
+        self.object_id = object_id
+
+in_map_alias = BufferAttr.In.value | BufferAttr.HipcMapAlias.value
+out_map_alias = BufferAttr.Out.value | BufferAttr.HipcMapAlias.value
+inout_map_alias = in_map_alias | out_map_alias
+in_pointer = BufferAttr.In.value | BufferAttr.HipcPointer.value
+out_pointer = BufferAttr.Out.value | BufferAttr.HipcPointer.value
+out_fixed_pointer = out_pointer | BufferAttr.FixedSize.value
+in_auto = BufferAttr.In.value | BufferAttr.HipcAutoSelect.value
+out_auto = BufferAttr.Out.value | BufferAttr.HipcAutoSelect.value
+
+shapes = {
+    "empty":     dict(),
+    "data":      dict(data=b"12345678"),
+    "pid":       dict(data=b"abcd", send_pid=True),
+    "handles":   dict(handles=(3, 4)),
+    "context":   dict(context=7, data=b"x"),
+    "map_alias": dict(buffers=[(Buffer(0x1234567890, 5), in_map_alias),
+                               (Buffer(0x2000, 0x20), out_map_alias),
+                               (Buffer(0x3000, 8), inout_map_alias)]),
+    "pointers":  dict(buffers=[(Buffer(0x1234567890, 5), in_pointer),
+                               (Buffer(0x22222220, 0x20), out_pointer),
+                               (Buffer(0x30000, 8), out_fixed_pointer)],
+                      data=b"x" * 12),
+    "auto":      dict(buffers=[(Buffer(0x4000, 0x10), in_auto),
+                               (Buffer(0x5000, 0x800), out_auto),
+                               (Buffer(0x6000, 0x20), out_auto)],
+                      server_pointer_size=0x500),
+    "domain":    dict(object_id=5, objects=(Object(9), Object(10)), handles=(3,),
+                      buffers=[(Buffer(0x7000, 0x10), in_pointer)], data=b"y" * 6),
+}
+
+def junk():
+    return bytearray(i * 7 & 0xff for i in range(arm.ipc_buffer_size))
+
+def encode(use_template, object_id=0, request_id=1, context=0, data=b"", send_pid=False,
+            buffers=(), objects=(), handles=(), server_pointer_size=0):
+    """
+    Encodes a request the way Service.make_request does, into a buffer
+    that already has something else in it.
+    """
+
+    base = memoryview(junk()).cast("B")
+
+    if use_template:
+        tmpl = cmif.request_template(object_id, request_id, context, len(data), send_pid,
+                    tuple(attr for _, attr in buffers), len(objects), len(handles),
+                    server_pointer_size)
+
+        req = tmpl.instantiate(base)
+    else:
+        fmt = cmif.RequestFormat(
+            object_id = object_id,
+            request_id = request_id,
+            context = context,
+            data_size = len(data),
+            server_pointer_size = server_pointer_size,
+            num_objects = len(objects),
+            num_handles = len(handles),
+            send_pid = send_pid,
+        )
+
+        for _, attr in buffers:
+            fmt.process_buffer(attr)
+
+        req = cmif.Request(base, fmt)
+
+    if object_id != 0:
+        for obj in objects:
+            req.add_object(obj)
+
+    for h in handles:
+        req.add_handle(h)
+
+    for buf, attr in buffers:
+        req.process_buffer(buf, attr)
+
+    req.insert(req.data, data)
+
+    return bytes(base)
+
+@pytest.mark.parametrize("shape", shapes)
+def test_template_matches_request(shape):
+    kwargs = shapes[shape]
+
+    expected = encode(False, **kwargs)
+
+    # Instantiated twice, to see nothing from the first sticks to the template
+    assert encode(True, **kwargs) == expected
+    assert encode(True, **kwargs) == expected
+
+def test_template_cache():
+    key = (0, 1, 0, 8, False, (in_auto,), 0, 0)
+
+    tmpl = cmif.request_template(*key, 0x500)
+
+    assert cmif.request_template(*key, 0x500) is tmpl
+
+    # The pointer buffer size decides how auto-select buffers are sent
+    assert cmif.request_template(*key, 0) is not tmpl
+    assert cmif.request_template(0, 2, *key[2:], 0x500) is not tmpl
+
+def test_template_instances_are_independent():
+    tmpl = cmif.request_template(0, 1, 0, 4, False, (in_map_alias,), 0, 1, 0)
+
+    a = memoryview(junk()).cast("B")
+    b = memoryview(junk()).cast("B")
+
+    req_a = tmpl.instantiate(a)
+    req_b = tmpl.instantiate(b)
+
+    req_a.add_handle(1)
+    req_a.process_buffer(Buffer(0x1000, 4), in_map_alias)
+    req_a.insert(req_a.data, c_uint32(0xaaaa))
+
+    req_b.add_handle(2)
+    req_b.process_buffer(Buffer(0x2000, 4), in_map_alias)
+    req_b.insert(req_b.data, c_uint32(0xbbbb))
+
+    assert bytes(a) != bytes(b)
+    assert c_uint32.from_buffer_copy(a, req_a.data).value == 0xaaaa
+    assert c_uint32.from_buffer_copy(b, req_b.data).value == 0xbbbb
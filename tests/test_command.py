@@ -0,0 +1,119 @@
+from ctypes import *
+
+import pytest
+
+from nx import sf
+from nx.sf import command, server
+from nx.types import HosVersion, ResultException
+
+class Pair(LittleEndianStructure):
+    _fields_ = [
+        ("a", c_uint32),
+        ("b", c_uint32),
+    ]
+
+class Echo(server.Object):
+    @server.command(0)
+    def swap(self, ctx):
+        pair = Pair.from_buffer_copy(ctx.data)
+        return Pair(pair.b, pair.a)
+
+    @server.command(1)
+    def value(self, ctx):
+        return c_uint32(7)
+
+    @server.command(2)
+    def reverse(self, ctx):
+        ctx.recv_buffer(0)[:] = bytes(ctx.send_buffer(0))[::-1]
+
+    @server.command(3)
+    def handles(self, ctx):
+        ctx.out_copy_handles.extend(ctx.copy_handles)
+
+class EchoService(sf.Service):
+    name = "echo"
+
+    cmd_swap = sf.Command(0, Pair, Pair)
+    cmd_swap_raw = sf.Command(0, 8, 8)
+    cmd_value = sf.Command(1, out_type=c_uint32)
+    cmd_reverse = sf.Command(2, buffer_attrs=(
+        sf.BufferAttr.In | sf.BufferAttr.HipcMapAlias,
+        sf.BufferAttr.Out | sf.BufferAttr.HipcMapAlias,
+    ))
+    cmd_handles = sf.Command(3, out_handle_attrs=(sf.OutHandleAttr.HipcCopy,) * 2)
+
+    cmd_new = sf.Command(1, out_type=c_uint32, version=((5, 0, 0), (10, 0, 0)))
+    cmd_old = sf.Command(1, out_type=c_uint32, version=((1, 0, 0), (4, 1, 0)))
+
+@pytest.fixture(params=[False, True], ids=["python", "accel"])
+def srv(request, kernel, monkeypatch):
+    monkeypatch.setattr(sf.Service, "use_accel", request.param)
+    kernel.register_service("echo", Echo)
+
+    srv = EchoService()
+    yield srv
+    srv.close()
+
+def test_specialized():
+    func = EchoService.cmd_swap
+
+    assert func.__name__ == "cmd_swap"
+    assert func.__qualname__ == "EchoService.cmd_swap"
+    assert func.command.request_id == 0
+    assert func.command.in_type is Pair
+
+def test_in_out_types(srv):
+    out = srv.cmd_swap(Pair(1, 2)).out
+    assert (out.a, out.b) == (2, 1)
+
+    # Sizes instead of types take and return bytes
+    assert srv.cmd_swap_raw(bytes(Pair(3, 4))).out == bytes(Pair(4, 3))
+
+    assert srv.cmd_value().out.value == 7
+
+def test_in_data_checked(srv):
+    # Anything of the right size is sent as it is
+    out = srv.cmd_swap((c_uint32 * 2)(5, 6)).out
+    assert (out.a, out.b) == (6, 5)
+
+    with pytest.raises(TypeError):
+        srv.cmd_swap(c_uint32(1))
+
+    with pytest.raises(TypeError):
+        srv.cmd_swap()
+
+    with pytest.raises(TypeError):
+        srv.cmd_swap_raw(b"x" * 4)
+
+    with pytest.raises(TypeError):
+        srv.cmd_value(c_uint32(1))
+
+def test_buffers(srv):
+    dst = bytearray(4)
+    srv.cmd_reverse(buffers=(b"abcd", dst))
+
+    assert dst == b"dcba"
+
+def test_handles(srv):
+    res = srv.cmd_handles(handles=(0x1234, 0x5678))
+
+    assert res.handles == [0x1234, 0x5678]
+
+def test_version(srv, monkeypatch):
+    monkeypatch.setattr(EchoService, "version", HosVersion(5, 0, 0))
+    assert srv.cmd_new().out.value == 7
+
+    with pytest.raises(ResultException) as ex:
+        srv.cmd_old()
+
+    assert ex.value.result == command.incompatible_version
+
+    monkeypatch.setattr(EchoService, "version", HosVersion(4, 1, 0))
+    assert srv.cmd_old().out.value == 7
+
+    with pytest.raises(ResultException):
+        srv.cmd_new()
+
+    # Upper bounds are inclusive too
+    monkeypatch.setattr(EchoService, "version", HosVersion(10, 0, 0))
+    assert srv.cmd_new().out.value == 7
@@ -0,0 +1,130 @@
+import gc
+import threading
+from ctypes import *
+
+import pytest
+
+from nx import sf
+from nx.sf import server
+
+class Sub(server.Object):
+    closed = 0
+
+    def __init__(self, value):
+        self.value = value
+
+    @server.command(0)
+    def get(self, ctx):
+        return c_uint32(self.value)
+
+    def close(self):
+        Sub.closed += 1
+
+class Echo(server.Object):
+    @server.command(0)
+    def open(self, ctx):
+        ctx.out_objects.append(Sub(c_uint32.from_buffer_copy(ctx.data).value))
+
+class EchoService(sf.Service):
+    name = "echo"
+
+class EchoDomain(EchoService):
+    domain = True
+
+@pytest.fixture
+def controls(kernel, monkeypatch):
+    kernel.register_service("echo", Echo)
+
+    requests = []
+    control = server.Session.control
+
+    def record(self, request_id, data):
+        requests.append(request_id)
+        return control(self, request_id, data)
+
+    monkeypatch.setattr(server.Session, "control", record)
+    Sub.closed = 0
+
+    return requests
+
+def open_sub(srv, value):
+    return srv.dispatch(0, c_uint32(value), out_num_objects=1).objects[0]
+
+def test_convert(controls):
+    srv = EchoDomain()
+
+    assert srv.is_domain
+    assert controls == [0]
+
+    sub = open_sub(srv, 5)
+    assert sub.is_domain_subservice
+    assert sub.session == srv.session
+    assert sub.dispatch(0, out_type=c_uint32).out.value == 5
+
+    srv.close()
+
+def test_convert_shared_session(controls):
+    srv = EchoService()
+    EchoService.sm.overrides["echo"] = srv.session
+
+    try:
+        domain = EchoDomain()
+    finally:
+        del EchoService.sm.overrides["echo"]
+
+    # A plain clone, rather than CloneCurrentObjectEx
+    assert controls == [2, 0]
+    assert domain.own_handle and domain.session != srv.session
+
+    assert open_sub(domain, 1).dispatch(0, out_type=c_uint32).out.value == 1
+
+    domain.close()
+    srv.close()
+
+def test_release_queued(controls):
+    srv = EchoDomain()
+
+    sub = open_sub(srv, 1)
+    object_id = sub.object_id
+
+    del sub
+    gc.collect()
+
+    assert list(srv.pending_closes) == [object_id]
+    assert Sub.closed == 0
+
+    # Sent along with the next request
+    other = open_sub(srv, 2)
+    assert not srv.pending_closes
+    assert Sub.closed == 1
+
+    srv.close()
+
+def test_release_with_lock_held(controls):
+    srv = EchoDomain()
+    sub = open_sub(srv, 1)
+
+    def collect():
+        nonlocal sub
+
+        # As if sub were collected during a request holding the lock
+        with srv.lock:
+            del sub
+
+    thread = threading.Thread(target=collect, daemon=True)
+    thread.start()
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert len(srv.pending_closes) == 1
+
+    srv.close()
+
+def test_close_domain(controls):
+    srv = EchoDomain()
+    subs = [open_sub(srv, i) for i in range(3)]
+
+    srv.close()
+
+    assert all(sub.closed for sub in subs)
+    assert not srv.pending_closes
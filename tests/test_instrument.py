@@ -0,0 +1,104 @@
+import asyncio
+from ctypes import *
+
+import pytest
+
+from nx import sf
+from nx.sf import instrument, server, transfer
+from nx.types import Result, ResultException
+
+class Echo(server.Object):
+    @server.command(0)
+    def echo(self, ctx):
+        return ctx.data
+
+    @server.command(1)
+    def fail(self, ctx):
+        raise ResultException(Result(module=2, description=3))
+
+    @server.command(2)
+    def buffers(self, ctx):
+        pass
+
+class EchoService(sf.Service):
+    name = "echo"
+
+@pytest.fixture
+def srv(kernel):
+    kernel.register_service("echo", Echo)
+
+    srv = EchoService()
+    srv.load_pointer_buffer_size()
+
+    instrument.reset()
+    instrument.enable()
+
+    yield srv
+
+    instrument.disable()
+    instrument.reset()
+
+    srv.close()
+
+def buffers():
+    return [
+        (b"x" * 0x10,  sf.BufferAttr.In | sf.BufferAttr.HipcAutoSelect),
+        (b"y" * 0x600, sf.BufferAttr.In | sf.BufferAttr.HipcAutoSelect),
+        (b"z" * 0x20,  sf.BufferAttr.In | sf.BufferAttr.HipcPointer),
+        (0x40,         sf.BufferAttr.Out | sf.BufferAttr.HipcMapAlias),
+    ]
+
+def send(srv, request_id, use_async, **kwargs):
+    if use_async:
+        return asyncio.run(srv.dispatch_async(request_id, **kwargs))
+
+    return srv.dispatch(request_id, **kwargs)
+
+def test_disabled():
+    instrument.disable()
+
+    assert not instrument.enabled()
+    assert sf.Service.send_request is instrument._send_request
+    assert sf.Service.send_request_async is instrument._send_request_async
+
+@pytest.mark.parametrize("use_async", [False, True])
+@pytest.mark.parametrize("accel", [False, True])
+def test_counts(srv, use_async, accel, monkeypatch):
+    monkeypatch.setattr(sf.Service, "use_accel", accel)
+
+    assert send(srv, 0, use_async, in_data=c_uint32(1), out_type=c_uint32).out.value == 1
+    send(srv, 2, use_async, buffers=buffers())
+    send(srv, 2, use_async, buffers=buffers())
+
+    with pytest.raises(ResultException):
+        send(srv, 1, use_async)
+
+    stats = sf.stats()
+
+    echo = stats[("echo", 0)]
+    assert echo["calls"] == 1
+    assert echo["sent"]["data"] == echo["received"]["data"] == 4
+
+    bufs = stats[("echo", 2)]
+    assert bufs["calls"] == 2
+    assert bufs["sent"] == {"data": 0, "pointer": 2 * 0x30, "map_alias": 2 * 0x600}
+    assert bufs["received"] == {"data": 0, "pointer": 0, "map_alias": 2 * 0x40}
+    assert bufs["auto_select"] == {"pointer": 2, "map_alias": 2}
+
+    fail = stats[("echo", 1)]
+    assert fail["calls"] == 1
+    assert fail["failures"] == {f"{Result(module=2, description=3).value:#x}": 1}
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_transfer_pool(srv, use_async, monkeypatch):
+    pool = transfer.BufferPool()
+    monkeypatch.setattr(EchoService, "transfer_pool", pool)
+
+    for i in range(4):
+        send(srv, 2, use_async, buffers=[(0x40, sf.BufferAttr.Out | sf.BufferAttr.HipcMapAlias)])
+
+    # One buffer per request, not another for instrumentation
+    assert pool.hits + pool.misses == 4
+    assert pool.misses == 1
+
+    assert sf.stats()[("echo", 2)]["received"]["map_alias"] == 4 * 0x40
@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+from nx.kernel import Event, cancel, current_thread, result, wait
+from nx.kernel.waiter import max_wait_handles
+from nx.types import ResultException
+
+def signal_later(event, delay=0.05):
+    def signal():
+        time.sleep(delay)
+        event.signal()
+
+    thread = threading.Thread(target=signal)
+    thread.start()
+
+    return thread
+
+def test_event(kernel):
+    with Event() as e:
+        assert not e.wait(0.01)
+
+        e.signal()
+        assert e.wait(0)
+        assert e.wait(0)
+
+        e.clear()
+        assert not e.wait(0)
+
+    assert e.closed
+
+    # Closing again does nothing
+    e.close()
+
+def test_autoclear_event(kernel):
+    with Event(autoclear=True) as e:
+        e.signal()
+
+        assert e.wait(0)
+        assert not e.wait(0)
+
+def test_autoclear_wakes_one_waiter(kernel):
+    with Event(autoclear=True) as e:
+        woken = []
+
+        threads = [threading.Thread(target=lambda: woken.append(e.wait(0.3))) for i in range(3)]
+        for thread in threads:
+            thread.start()
+
+        time.sleep(0.05)
+        e.signal()
+
+        for thread in threads:
+            thread.join()
+
+        assert sorted(woken) == [False, False, True]
+
+def test_wait_many(kernel):
+    events = [Event() for i in range(3)]
+
+    # Events and raw handles can be mixed
+    objects = [events[0], events[1].handle, events[2]]
+
+    assert wait(objects, 0) is None
+
+    thread = signal_later(events[2])
+    assert wait(objects, 2) == 2
+    thread.join()
+
+    events[1].signal()
+    assert wait(objects) == 1
+
+    for e in events:
+        e.close()
+
+def test_wait_too_many(kernel):
+    with pytest.raises(ValueError):
+        wait(list(range(1, max_wait_handles + 2)))
+
+def test_cancel(kernel):
+    threads = []
+    results = []
+
+    def waiter():
+        threads.append(current_thread())
+
+        with Event() as e:
+            try:
+                wait([e])
+            except ResultException as ex:
+                results.append(ex.result)
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+
+    while not threads:
+        time.sleep(0.01)
+
+    time.sleep(0.05)
+    cancel(threads[0])
+
+    thread.join(2)
+    assert not thread.is_alive()
+
+    assert results == [result("Cancelled")]
+
+def test_cancel_before_wait(kernel):
+    cancel(current_thread())
+
+    with Event() as e, pytest.raises(ResultException) as ex:
+        e.wait(1)
+
+    assert ex.value.result == result("Cancelled")
+
+    # Only the next wait is cancelled
+    with Event() as e:
+        assert not e.wait(0)
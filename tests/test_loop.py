@@ -0,0 +1,153 @@
+import asyncio
+import socket
+import threading
+import time
+from ctypes import *
+
+import pytest
+
+from nx import sf
+from nx.kernel import Event
+from nx.loop import HorizonEventLoop, HorizonEventLoopPolicy
+from nx.sf import server
+
+class Echo(server.Object):
+    @server.command(0)
+    def add(self, ctx):
+        return c_uint32(c_uint32.from_buffer_copy(ctx.data).value + 1)
+
+class EchoService(sf.Service):
+    name = "echo"
+
+@pytest.fixture
+def loop(kernel):
+    loop = HorizonEventLoop()
+    yield loop
+    loop.close()
+
+def later(delay, func, *args):
+    timer = threading.Timer(delay, func, args)
+    timer.start()
+
+    return timer
+
+def test_timers(loop):
+    async def main():
+        start = loop.time()
+        await asyncio.sleep(0.02)
+
+        return loop.time() - start
+
+    assert loop.run_until_complete(main()) >= 0.019
+
+def test_call_soon_threadsafe(loop):
+    async def main():
+        fut = loop.create_future()
+        later(0.02, loop.call_soon_threadsafe, fut.set_result, 5)
+
+        return await asyncio.wait_for(fut, 1)
+
+    assert loop.run_until_complete(main()) == 5
+
+def test_wait_handle(loop):
+    with Event() as e:
+        async def main():
+            later(0.02, e.signal)
+
+            return await asyncio.wait_for(loop.wait_handle(e.handle), 1)
+
+        assert loop.run_until_complete(main()) == e.handle
+
+def test_wait_handle_cancelled(loop):
+    with Event() as e:
+        async def main():
+            fut = loop.wait_handle(e.handle)
+            fut.cancel()
+
+            await asyncio.sleep(0)
+
+        loop.run_until_complete(main())
+
+        assert e.handle not in loop._selector.handles
+
+def test_sockets_and_handles(loop):
+    a, b = socket.socketpair()
+    a.setblocking(False)
+    b.setblocking(False)
+
+    async def main():
+        later(0.03, b.send, b"hi")
+        assert await asyncio.wait_for(loop.sock_recv(a, 10), 1) == b"hi"
+
+        # Handles are still waited on while a socket is
+        loop.add_reader(a.fileno(), lambda: None)
+
+        with Event() as e:
+            later(0.02, e.signal)
+
+            start = time.perf_counter()
+            await asyncio.wait_for(loop.wait_handle(e.handle), 1)
+
+            assert time.perf_counter() - start < 0.5
+
+        loop.remove_reader(a.fileno())
+
+    try:
+        loop.run_until_complete(main())
+    finally:
+        a.close()
+        b.close()
+
+def test_dispatch_async(loop, kernel):
+    kernel.register_service("echo", Echo)
+    srv = EchoService()
+
+    async def main():
+        return await asyncio.gather(*[srv.dispatch_async(0, c_uint32(i), c_uint32) for i in range(10)])
+
+    results = loop.run_until_complete(main())
+    assert [res.out.value for res in results] == list(range(1, 11))
+
+    srv.close()
+
+def test_server(loop):
+    manager = server.ServerManager()
+    manager.register_service(sf.Service.sm, "echo", Echo)
+
+    loop_server = loop.add_server(manager)
+
+    results = []
+
+    def client():
+        srv = EchoService()
+
+        for i in range(5):
+            results.append(srv.dispatch(0, c_uint32(i), c_uint32).out.value)
+
+        srv.close()
+
+    async def main():
+        thread = threading.Thread(target=client)
+        thread.start()
+
+        while thread.is_alive():
+            await asyncio.sleep(0.01)
+
+    loop.run_until_complete(main())
+
+    assert results == [1, 2, 3, 4, 5]
+
+    loop_server.close()
+    manager.close()
+
+def test_policy(kernel):
+    async def main():
+        return asyncio.get_running_loop()
+
+    policy = asyncio.get_event_loop_policy()
+    asyncio.set_event_loop_policy(HorizonEventLoopPolicy())
+
+    try:
+        assert isinstance(asyncio.run(main()), HorizonEventLoop)
+    finally:
+        asyncio.set_event_loop_policy(policy)
@@ -0,0 +1,162 @@
+import pickle
+from ctypes import *
+
+import pytest
+
+from nx import sf
+from nx.kernel import Permission, SharedMemory, TransferMemory, result
+from nx.sf import server
+from nx.types import ResultException
+
+class Stream(server.Object):
+    def __init__(self):
+        self.shm = None
+
+    @server.command(0)
+    def set_shared_memory(self, ctx):
+        size = c_uint64.from_buffer_copy(ctx.data).value
+
+        self.shm = SharedMemory(ctx.copy_handles[0], size, Permission.R)
+        self.shm.own_handle = False
+        self.shm.map()
+
+    @server.command(1)
+    def checksum(self, ctx):
+        count = c_uint32.from_buffer_copy(ctx.data).value
+        return c_uint32(sum(self.shm.view[:count]))
+
+    @server.command(2)
+    def fill_transfer_memory(self, ctx):
+        size = c_uint64.from_buffer_copy(ctx.data).value
+
+        tmem = TransferMemory(ctx.copy_handles[0], size)
+        tmem.own_handle = False
+        tmem.map()
+
+        tmem[:4] = b"abcd"
+
+        tmem.close()
+
+class StreamService(sf.Service):
+    name = "stream"
+
+@pytest.fixture(params=[False, True], ids=["python", "accel"])
+def srv(request, kernel, monkeypatch):
+    monkeypatch.setattr(sf.Service, "use_accel", request.param)
+    kernel.register_service("stream", Stream)
+
+    srv = StreamService()
+    yield srv
+    srv.close()
+
+def test_shared_memory(srv):
+    shm = SharedMemory.create(5000)
+
+    assert len(shm) == 0x2000
+    assert shm.mapped
+
+    srv.dispatch(0, c_uint64(len(shm)), in_handles=[shm])
+
+    # The same mapping is reused for each request
+    for i in range(3):
+        shm[:4] = bytes([i, 1, 2, 3])
+        assert srv.dispatch(1, c_uint32(4), c_uint32).out.value == i + 6
+
+    shm.close()
+
+    assert shm.closed
+    assert not shm.mapped
+
+def test_shared_memory_view_as_buffer(kernel):
+    with SharedMemory.create(0x1000) as shm:
+        buf = sf.Buffer(shm.view)
+
+        assert buf.ptr == shm.address
+        assert buf.size == 0x1000
+
+def test_shared_memory_read_only(kernel):
+    with SharedMemory.create(0x1000) as shm:
+        shm[0] = 2
+
+        ro = SharedMemory(shm.handle, len(shm), Permission.R)
+        ro.own_handle = False
+        ro.map()
+
+        assert ro.view.readonly
+        assert ro[0] == 2
+
+        with pytest.raises(TypeError):
+            ro[0] = 1
+
+        ro.close()
+
+def test_transfer_memory(srv):
+    tmem = TransferMemory.create(0x1000)
+
+    # Lent without any permission left to this process
+    assert tmem.view is None
+
+    srv.dispatch(2, c_uint64(0x1000), in_handles=[tmem])
+    tmem.close()
+
+    assert bytes(tmem.memory[:4]) == b"abcd"
+
+def test_transfer_memory_read_only(kernel):
+    with TransferMemory.create(0x1000, Permission.R) as tmem:
+        assert tmem.view.readonly
+
+        # Has to be mapped with the permission it was lent with
+        other = TransferMemory(tmem.handle, 0x1000)
+        other.own_handle = False
+
+        with pytest.raises(ResultException) as e:
+            other.map()
+
+        assert e.value.result == result("InvalidState")
+
+def test_invalid_handle(kernel):
+    with pytest.raises(ResultException) as e:
+        TransferMemory(12345, 0x1000).map()
+
+    assert e.value.result == result("InvalidHandle")
+
+def test_unmap_with_view_in_use(kernel):
+    shm = SharedMemory.create(0x1000)
+    mapping = kernel.handles[shm.handle]
+
+    # Something holding on to a buffer exported from the view
+    held = pickle.PickleBuffer(shm.view)
+
+    shm.close()
+
+    assert shm.closed
+    assert not shm.mapped
+    assert mapping.mappings == 0
+
+    del held
+
+def test_unmap_transfer_memory_with_view_in_use(kernel):
+    with TransferMemory.create(0x1000, Permission.R) as tmem:
+        other = TransferMemory(tmem.handle, 0x1000, Permission.R)
+        other.own_handle = False
+        other.map()
+
+        lent = kernel.handles[tmem.handle]
+        held = pickle.PickleBuffer(other.view)
+
+        other.unmap()
+
+        assert not other.mapped
+        assert not lent.mapped
+
+        del held
+
+def test_view_released_on_unmap(kernel):
+    shm = SharedMemory.create(0x1000)
+    view = shm.view
+
+    shm.close()
+
+    # Rather than reading memory that's gone
+    with pytest.raises(ValueError):
+        view[0]
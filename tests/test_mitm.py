@@ -0,0 +1,132 @@
+import threading
+from ctypes import *
+
+import pytest
+
+from nx import sf
+from nx.sf import mitm, server
+from nx.services import ServiceManager
+from nx.types import ResultException
+
+class Sub(server.Object):
+    @server.command(0)
+    def get(self, ctx):
+        return c_uint32(42)
+
+class Echo(server.Object):
+    @server.command(0)
+    def add(self, ctx):
+        return c_uint32(c_uint32.from_buffer_copy(ctx.data).value + 1)
+
+    @server.command(1)
+    def copy(self, ctx):
+        ctx.recv_buffer(0)[:] = ctx.send_buffer(0)
+
+    @server.command(2)
+    def open(self, ctx):
+        ctx.out_objects.append(Sub())
+
+    @server.command(3)
+    def reverse_pointer(self, ctx):
+        data = bytes(ctx.static(0))
+        ctx.recv_static(0)[:len(data)] = data[::-1]
+
+class Mitm(mitm.MitmObject):
+    @server.command(0)
+    def add(self, ctx):
+        value = c_uint32.from_buffer_copy(ctx.data).value
+        return c_uint32(self.service.dispatch(0, c_uint32(value), c_uint32).out.value + 100)
+
+    @server.command(5)
+    def open_own(self, ctx):
+        ctx.out_objects.append(Sub())
+
+class EchoService(sf.Service):
+    name = "echo"
+
+class EchoDomain(EchoService):
+    domain = True
+
+def serve(manager):
+    thread = threading.Thread(target=manager.serve, daemon=True)
+    thread.start()
+
+    return thread
+
+@pytest.fixture
+def servers(kernel):
+    real_sm = ServiceManager()
+    real = server.ServerManager()
+    real.register_service(real_sm, "echo", Echo)
+
+    mitm_sm = ServiceManager()
+    mitm_manager = server.ThreadedServerManager(2)
+    mitm.install(mitm_manager, mitm_sm, "echo", Mitm)
+
+    threads = [serve(real), serve(mitm_manager)]
+
+    yield
+
+    for manager in (mitm_manager, real):
+        manager.stop()
+
+    for thread in threads:
+        thread.join()
+
+    for manager in (mitm_manager, real):
+        manager.close()
+
+    mitm_sm.close()
+    real_sm.close()
+
+@pytest.mark.parametrize("cls", [EchoService, EchoDomain])
+@pytest.mark.parametrize("accel", [False, True])
+def test_forwarding(servers, cls, accel, monkeypatch):
+    monkeypatch.setattr(sf.Service, "use_accel", accel)
+
+    srv = cls()
+
+    try:
+        # Intercepted
+        assert srv.dispatch(0, c_uint32(5), c_uint32).out.value == 106
+
+        # Forwarded as they are
+        src = (c_char * 16)(*b"hello world12345")
+        dst = (c_char * 16)()
+
+        srv.dispatch(1, buffers=[(sf.Buffer(src), sf.BufferAttr.In | sf.BufferAttr.HipcMapAlias),
+                                 (sf.Buffer(dst), sf.BufferAttr.Out | sf.BufferAttr.HipcMapAlias)])
+        assert dst.raw == src.raw
+
+        sub = srv.dispatch(2, out_num_objects=1).objects[0]
+        assert sub.dispatch(0, out_type=c_uint32).out.value == 42
+        sub.close()
+
+        dst = (c_char * 8)()
+        srv.dispatch(3, buffers=[(b"abcdefgh", sf.BufferAttr.In | sf.BufferAttr.HipcPointer),
+                                 (sf.Buffer(dst), sf.BufferAttr.Out | sf.BufferAttr.HipcPointer)])
+        assert dst.raw == b"hgfedcba"
+    finally:
+        srv.close()
+
+def test_intercepted_object(servers):
+    srv = EchoService()
+
+    sub = srv.dispatch(5, out_num_objects=1).objects[0]
+    assert sub.dispatch(0, out_type=c_uint32).out.value == 42
+
+    sub.close()
+    srv.close()
+
+def test_intercepted_object_in_domain(servers):
+    srv = EchoDomain()
+
+    with pytest.raises(ResultException) as e:
+        srv.dispatch(5, out_num_objects=1)
+
+    assert e.value.result == server.not_supported
+
+    # Only that request failed
+    assert srv.dispatch(0, c_uint32(1), c_uint32).out.value == 102
+
+    srv.close()
@@ -0,0 +1,165 @@
+from ctypes import *
+
+import pytest
+
+from nx import sf
+from nx.sf import server, service
+from nx.types import ResultException
+
+in_auto = sf.BufferAttr.In | sf.BufferAttr.HipcAutoSelect
+in_map_alias = sf.BufferAttr.In | sf.BufferAttr.HipcMapAlias
+
+class Echo(server.Object):
+    @server.command(0)
+    def echo(self, ctx):
+        return ctx.data
+
+    @server.command(1)
+    def open(self, ctx):
+        ctx.out_objects.append(Echo())
+
+class EchoService(sf.Service):
+    name = "echo"
+
+class EchoDomain(EchoService):
+    domain = True
+
+@pytest.fixture
+def queries(kernel, monkeypatch):
+    kernel.register_service("echo", Echo, pointer_buffer_size=0x300)
+
+    queries = []
+    control = server.Session.control
+
+    def record(self, request_id, data):
+        if request_id == 3:
+            queries.append(self)
+
+        return control(self, request_id, data)
+
+    monkeypatch.setattr(server.Session, "control", record)
+
+    return queries
+
+def send(srv, buffers):
+    return srv.dispatch(0, c_uint32(1), c_uint32, buffers=buffers).out.value
+
+def test_lazy(queries):
+    srv = EchoService()
+
+    assert srv.pointer_buffer_size is None
+
+    # Nothing to decide without auto-select buffers
+    assert send(srv, []) == 1
+    assert send(srv, [(b"x" * 0x10, in_map_alias)]) == 1
+    assert queries == []
+
+    assert send(srv, [(b"x" * 0x10, in_auto)]) == 1
+    assert len(queries) == 1
+    assert srv.pointer_buffer_size == 0x300
+
+    send(srv, [(b"x" * 0x10, in_auto)])
+    assert len(queries) == 1
+
+    srv.close()
+
+def test_not_lazy(queries, monkeypatch):
+    monkeypatch.setattr(EchoService, "lazy_pointer_buffer_size", False)
+
+    srv = EchoService()
+
+    assert len(queries) == 1
+    assert srv.pointer_buffer_size == 0x300
+
+    srv.close()
+
+def test_cached_per_name(queries):
+    first = EchoService()
+    first.load_pointer_buffer_size()
+
+    assert service._pointer_buffer_sizes == {"echo": 0x300}
+
+    second = EchoService()
+    assert second.pointer_buffer_size == 0x300
+
+    send(second, [(b"x" * 0x10, in_auto)])
+    assert len(queries) == 1
+
+    first.close()
+    second.close()
+
+def test_failure_not_cached(queries, monkeypatch):
+    control = server.Session.control
+    failures = [ResultException(server.not_supported)]
+
+    def fail_once(self, request_id, data):
+        if request_id == 3 and failures:
+            raise failures.pop()
+
+        return control(self, request_id, data)
+
+    monkeypatch.setattr(server.Session, "control", fail_once)
+
+    srv = EchoService()
+
+    # Sent as if there were no pointer buffer, and asked again next time
+    assert srv.load_pointer_buffer_size() == 0
+    assert srv.pointer_buffer_size is None
+    assert "echo" not in service._pointer_buffer_sizes
+
+    assert send(srv, [(b"x" * 0x10, in_auto)]) == 1
+    assert srv.pointer_buffer_size == 0x300
+    assert service._pointer_buffer_sizes == {"echo": 0x300}
+
+    srv.close()
+
+@pytest.mark.parametrize("cls", [EchoService, EchoDomain])
+def test_inherited_by_sub_services(queries, cls):
+    srv = cls()
+    srv.load_pointer_buffer_size()
+
+    sub = srv.dispatch(1, out_num_objects=1).objects[0]
+    assert sub.pointer_buffer_size == 0x300
+
+    send(sub, [(b"x" * 0x10, in_auto)])
+    assert len(queries) == 1
+
+    sub.close()
+    srv.close()
+
+def test_inherited_by_domain_clone(queries):
+    srv = EchoService()
+    srv.load_pointer_buffer_size()
+
+    sf.Service.sm.overrides["echo"] = srv.session
+
+    try:
+        # Converts a clone of the overriding session
+        domain = EchoDomain()
+    finally:
+        del sf.Service.sm.overrides["echo"]
+
+    assert domain.session != srv.session
+    assert domain.pointer_buffer_size == 0x300
+
+    send(domain, [(b"x" * 0x10, in_auto)])
+    assert len(queries) == 1
+
+    domain.close()
+    srv.close()
+
+def test_inherited_by_pooled_clones(queries):
+    srv = EchoService()
+    srv.load_pointer_buffer_size()
+
+    pool = srv.enable_pool(2)
+
+    # Keeps the original busy, so the request goes over a clone
+    original = pool.acquire()
+
+    send(srv, [(b"x" * 0x10, in_auto)])
+    assert pool.size == 2
+    assert len(queries) == 1
+
+    pool.release(original)
+    srv.close()
@@ -0,0 +1,108 @@
+import asyncio
+import threading
+from ctypes import *
+
+import pytest
+
+from nx import sf
+from nx.sf import server
+
+class Adder(server.Object):
+    def __init__(self):
+        self.on_add = None
+
+    @server.command(0)
+    def add(self, ctx):
+        if self.on_add is not None:
+            self.on_add()
+
+        a, b = (c_uint32 * 2).from_buffer_copy(ctx.data)
+        return c_uint32(a + b)
+
+class AdderService(sf.Service):
+    name = "adder"
+
+@pytest.fixture
+def adder(kernel):
+    adder = Adder()
+    kernel.register_service("adder", lambda: adder)
+
+    return adder
+
+def add(srv, a, b):
+    return srv.dispatch(0, (c_uint32 * 2)(a, b), c_uint32).out.value
+
+def test_parallel(adder):
+    srv = AdderService()
+    pool = srv.enable_pool(4)
+
+    bad = []
+    def worker():
+        for i in range(200):
+            if add(srv, i, 1) != i + 1:
+                bad.append(i)
+
+    threads = [threading.Thread(target=worker) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not bad
+    assert 1 <= pool.size <= 4
+
+    srv.close()
+
+def test_max_idle(adder, kernel):
+    srv = AdderService()
+    pool = srv.enable_pool(3, max_idle=1)
+
+    sessions = [pool.acquire() for i in range(3)]
+    assert pool.size == 3
+    assert pool.acquire(blocking=False) is None
+
+    for session in sessions:
+        pool.release(session)
+
+    assert pool.size == 1
+    assert pool.idle == [srv.session]
+
+    srv.close()
+
+def sessions(kernel):
+    return {h for h, obj in kernel.handles.items() if isinstance(obj, server.Session)}
+
+def test_close_during_request(adder, kernel):
+    srv = AdderService()
+    pool = srv.enable_pool(2)
+
+    # Keeps the original busy, so the request goes over a clone
+    original = pool.acquire()
+    before = sessions(kernel)
+
+    def close():
+        thread = threading.Thread(target=srv.close)
+        thread.start()
+        thread.join()
+
+    adder.on_add = close
+
+    assert add(srv, 1, 2) == 3
+    assert srv.closed and srv.pool is None
+
+    # The clone was closed rather than returned to the closed pool
+    assert pool.size == 1
+    assert pool.idle == []
+    assert sessions(kernel) == before - {original}
+
+def test_async_uses_pool(adder):
+    srv = AdderService()
+    pool = srv.enable_pool(4)
+
+    async def main():
+        return await asyncio.gather(*[srv.dispatch_async(0, (c_uint32 * 2)(i, 1), c_uint32) for i in range(20)])
+
+    assert [r.out.value for r in asyncio.run(main())] == [i + 1 for i in range(20)]
+    assert len(pool.idle) == pool.size
+
+    srv.close()
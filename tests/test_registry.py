@@ -0,0 +1,145 @@
+from ctypes import *
+
+import pytest
+
+from nx import sf
+from nx.sf import server
+from nx.services import ServiceManager
+
+class Echo(server.Object):
+    @server.command(0)
+    def echo(self, ctx):
+        return ctx.data
+
+class SharedEcho(sf.Service):
+    name = "echo"
+    shared = True
+
+@pytest.fixture
+def sm(kernel):
+    kernel.register_service("echo", Echo)
+    kernel.register_service("other", Echo)
+
+    return sf.Service.sm
+
+def echo(srv, value):
+    return srv.dispatch(0, c_uint32(value), c_uint32).out.value
+
+def test_acquire_release(sm, kernel):
+    a = SharedEcho()
+    b = SharedEcho()
+
+    assert a.session == b.session
+    assert not a.own_handle and a.shared_name == "echo"
+    assert sm.registry.sessions["echo"].refs == 2
+
+    assert echo(a, 1) == 1
+    assert echo(b, 2) == 2
+
+    a.close()
+    assert sm.registry.sessions["echo"].refs == 1
+
+    # Released, but left open for the next instance
+    b.close()
+    assert sm.registry.sessions["echo"].refs == 0
+    assert b.session == 0 and a.session == 0
+
+    session = sm.registry.sessions["echo"].handle
+    assert session in kernel.handles
+
+    c = SharedEcho()
+    assert c.session == session
+    c.close()
+
+def test_release_twice(sm):
+    srv = SharedEcho()
+
+    srv.close()
+    srv.close()
+
+    assert sm.registry.sessions["echo"].refs == 0
+
+def test_prewarm(kernel):
+    kernel.register_service("echo", Echo)
+
+    sm = ServiceManager(prewarm=("echo",))
+    entry = sm.registry.sessions["echo"]
+
+    assert entry.refs == 0
+    assert entry.handle in kernel.handles
+
+    assert sm.registry.acquire("echo") == entry.handle
+    assert entry.refs == 1
+
+    sm.registry.release("echo")
+    sm.close()
+
+    assert entry.handle not in kernel.handles
+
+def test_collect(sm, kernel):
+    srv = SharedEcho()
+    other = sm.registry.acquire("other")
+    sm.registry.release("other")
+
+    # Never closed without a timeout
+    assert sm.registry.collect() == 0
+
+    # Only sessions without references are closed
+    assert sm.registry.collect(0) == 1
+    assert "other" not in sm.registry.sessions
+    assert other not in kernel.handles
+
+    assert srv.session in kernel.handles
+    assert echo(srv, 3) == 3
+
+    srv.close()
+
+def test_collect_on_acquire(sm, kernel):
+    sm.registry.idle_timeout = 0
+
+    other = sm.registry.acquire("other")
+    sm.registry.release("other")
+
+    srv = SharedEcho()
+
+    assert other not in kernel.handles
+    assert list(sm.registry.sessions) == ["echo"]
+
+    srv.close()
+
+def test_override(sm, kernel):
+    handle, _ = sm.get_service("echo")
+    sm.overrides["echo"] = handle
+
+    try:
+        srv = SharedEcho()
+    finally:
+        del sm.overrides["echo"]
+
+    assert srv.session == handle
+    assert srv.shared_name is None
+    assert "echo" not in sm.registry.sessions
+
+    # The override belongs to whoever set it
+    srv.close()
+    assert handle in kernel.handles
+
+    sf.service.close_session(handle)
+
+def test_convert_to_domain(sm, kernel):
+    srv = SharedEcho()
+    shared = srv.session
+
+    srv.convert_to_domain()
+
+    assert srv.is_domain
+    assert srv.session != shared
+    assert srv.shared_name is None
+    assert sm.registry.sessions["echo"].refs == 0
+    assert echo(srv, 4) == 4
+
+    srv.close()
+
+    # The clone is closed, the shared session is still there for others
+    assert shared in kernel.handles
+    assert sm.registry.sessions["echo"].refs == 0
@@ -0,0 +1,134 @@
+from ctypes import *
+
+import pytest
+
+# Served by the simulated kernel
+pytest.importorskip("nx.sim")
+
+from nx import sf
+from nx.sf import server
+
+class Pair(LittleEndianStructure):
+    _fields_ = [
+        ("a", c_uint32),
+        ("b", c_uint32),
+    ]
+
+class Sub(server.Object):
+    def __init__(self, value):
+        self.value = value
+
+    @server.command(0)
+    def get(self, ctx):
+        return c_uint32(self.value)
+
+class Echo(server.Object):
+    @server.command(0)
+    def swap(self, ctx):
+        pair = Pair.from_buffer_copy(ctx.data)
+        return Pair(pair.b, pair.a)
+
+    @server.command(1)
+    def open(self, ctx):
+        ctx.out_objects.append(Sub(c_uint32.from_buffer_copy(ctx.data).value))
+
+    @server.command(2)
+    def handles(self, ctx):
+        ctx.out_copy_handles.extend(ctx.copy_handles)
+
+    @server.command(3)
+    def fill(self, ctx):
+        buf = ctx.recv_buffer(0)
+        buf[:] = b"B" * len(buf)
+
+class EchoService(sf.Service):
+    name = "echo"
+
+class EchoDomain(EchoService):
+    domain = True
+
+@pytest.fixture(params=[EchoService, EchoDomain])
+def srv(request, kernel):
+    kernel.register_service("echo", Echo)
+
+    srv = request.param()
+    yield srv
+    srv.close()
+
+def test_slots(srv):
+    res = srv.dispatch(0, Pair(1, 2), Pair)
+
+    with pytest.raises(AttributeError):
+        res.extra = 1
+
+def test_out_types(srv):
+    assert srv.dispatch(0, Pair(1, 2), 8).out == bytes(Pair(2, 1))
+
+    out = srv.dispatch(0, Pair(1, 2), Pair).out
+    assert (out.a, out.b) == (2, 1)
+
+    # Decoded straight into an instance given as out_type
+    pair = Pair()
+    assert srv.dispatch(0, Pair(3, 4), pair).out is pair
+    assert (pair.a, pair.b) == (4, 3)
+
+    pair = srv.dispatch(0, Pair(5, 6), 8).out_into(Pair())
+    assert (pair.a, pair.b) == (6, 5)
+
+def test_out_cached(srv):
+    res = srv.dispatch(0, Pair(1, 2), Pair)
+    out = res.out
+
+    srv.dispatch(0, Pair(7, 8), Pair)
+
+    assert res.out is out
+    assert (out.a, out.b) == (2, 1)
+
+def test_detach(srv):
+    res = srv.dispatch(0, Pair(1, 2), Pair).detach()
+
+    # Overwrites the IPC buffer the response was received in
+    srv.dispatch(0, Pair(7, 8), Pair)
+
+    assert (res.out.a, res.out.b) == (2, 1)
+
+def test_objects_decoded_on_access(srv):
+    if srv.is_domain:
+        before = set(srv.domain_objects)
+
+    res = srv.dispatch(1, c_uint32(42), out_num_objects=1)
+
+    if srv.is_domain:
+        # Not made into a service until asked for
+        assert set(srv.domain_objects) == before
+
+    objects = res.objects
+    assert res.objects is objects
+
+    sub = objects[0]
+    assert sub.dispatch(0, out_type=c_uint32).out.value == 42
+
+    if srv.is_domain:
+        assert set(srv.domain_objects) == before | {sub.object_id}
+
+    sub.close()
+
+def test_handles(srv):
+    # Copied as they are, with the client and server in one process
+    handles = [0x1234, 0x5678]
+
+    res = srv.dispatch(2, in_handles=handles, out_handle_attrs=[sf.OutHandleAttr.HipcCopy] * 2)
+
+    assert res.handles == handles
+    assert res.handles is res.handles
+
+def test_buffers(srv):
+    dst = (c_char * 4)()
+
+    res = srv.dispatch(3, buffers=[(8, sf.BufferAttr.HipcMapAlias)])
+    assert [bytes(buf) for buf in res.buffers] == [b"B" * 8]
+
+    # Only buffers that were allocated for the request are returned
+    res = srv.dispatch(3, buffers=[(sf.Buffer(dst, sizeof(dst)), sf.BufferAttr.Out | sf.BufferAttr.HipcMapAlias)])
+    assert res.buffers == []
+    assert dst.raw == b"B" * 4
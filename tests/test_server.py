@@ -0,0 +1,199 @@
+import logging
+import threading
+from ctypes import *
+
+import pytest
+
+from nx import sf
+from nx.sf import server
+from nx.services import ServiceManager
+from nx.types import Result, ResultException
+
+class Sub(server.Object):
+    @server.command(0)
+    def get(self, ctx):
+        return c_uint32(42)
+
+class Echo(server.Object):
+    @server.command(0)
+    def add(self, ctx):
+        return c_uint32(c_uint32.from_buffer_copy(ctx.data).value + 1)
+
+    @server.command(1)
+    def fail(self, ctx):
+        raise ResultException(Result(module=2, description=3))
+
+    @server.command(2)
+    def crash(self, ctx):
+        raise TypeError("bad handler")
+
+    @server.command(3)
+    def bad_out(self, ctx):
+        return "not bytes"
+
+    @server.command(4)
+    def open(self, ctx):
+        ctx.out_objects.append(Sub())
+
+    @server.command(5)
+    def copy(self, ctx):
+        ctx.recv_buffer(0)[:] = ctx.send_buffer(0)
+
+    @server.command(6)
+    def reverse(self, ctx):
+        data = ctx.static(0)
+        reversed_data = bytes(data)[::-1]
+
+        # Only the server's copy is scribbled over
+        data[:] = bytes(len(data))
+
+        ctx.recv_static(0)[:len(reversed_data)] = reversed_data
+
+class BrokenSession(server.Session):
+    def process(self, base, pointer_buffer=None):
+        raise RuntimeError("broken session")
+
+class EchoService(sf.Service):
+    name = "echo"
+
+class BrokenService(sf.Service):
+    name = "broken"
+
+class EchoDomain(EchoService):
+    domain = True
+
+def add(srv, value):
+    return srv.dispatch(0, c_uint32(value), c_uint32).out.value
+
+@pytest.fixture(params=["local", "manager", "threaded"])
+def served(request, kernel):
+    """
+    Echo served on the requesting thread by the simulated kernel,
+    or from another thread by a ServerManager or ThreadedServerManager.
+    """
+
+    if request.param == "local":
+        kernel.register_service("echo", Echo)
+        yield
+        return
+
+    if request.param == "manager":
+        manager = server.ServerManager()
+    else:
+        manager = server.ThreadedServerManager(2)
+
+    sm = ServiceManager()
+    manager.register_service(sm, "echo", Echo)
+    manager.register_service(sm, "broken", lambda: BrokenSession(manager, Echo()))
+
+    thread = threading.Thread(target=manager.serve, daemon=True)
+    thread.start()
+
+    yield manager
+
+    manager.stop()
+    thread.join()
+
+    manager.close()
+    sm.close()
+
+@pytest.mark.parametrize("cls", [EchoService, EchoDomain])
+def test_requests(served, cls):
+    srv = cls()
+
+    assert add(srv, 1) == 2
+
+    with pytest.raises(ResultException) as e:
+        srv.dispatch(1)
+    assert e.value.result == Result(module=2, description=3)
+
+    with pytest.raises(ResultException) as e:
+        srv.dispatch(100)
+    assert e.value.result == server.unknown_command_id
+
+    sub = srv.dispatch(4, out_num_objects=1).objects[0]
+    assert sub.dispatch(0, out_type=c_uint32).out.value == 42
+    sub.close()
+
+    dst = (c_char * 5)()
+    srv.dispatch(5, buffers=[(b"hello", sf.BufferAttr.In | sf.BufferAttr.HipcMapAlias),
+                             (sf.Buffer(dst), sf.BufferAttr.Out | sf.BufferAttr.HipcMapAlias)])
+    assert dst.raw == b"hello"
+
+    srv.close()
+
+@pytest.mark.parametrize("request_id", [2, 3])
+@pytest.mark.parametrize("cls", [EchoService, EchoDomain])
+def test_handler_exception(served, cls, request_id, caplog):
+    srv = cls()
+
+    with caplog.at_level(logging.ERROR, logger="nx.sf.server"):
+        for i in range(3):
+            with pytest.raises(ResultException) as e:
+                srv.dispatch(request_id)
+
+            assert e.value.result == server.not_supported
+
+            # The session and the server are still up
+            assert add(srv, i) == i + 1
+
+    assert len(caplog.records) == 3
+
+    srv.close()
+
+def test_handler_exceptions_on_every_worker(served):
+    if not isinstance(served, server.ThreadedServerManager):
+        pytest.skip("Only the threaded server has workers")
+
+    services = [EchoService() for i in range(2 * served.num_threads)]
+
+    for srv in services:
+        with pytest.raises(ResultException):
+            srv.dispatch(2)
+
+    for srv in services:
+        assert add(srv, 1) == 2
+        srv.close()
+
+def test_broken_session(served, caplog):
+    if served is None:
+        pytest.skip("Only served by a manager")
+
+    echo = EchoService()
+
+    with caplog.at_level(logging.ERROR, logger="nx.sf.server"):
+        for i in range(2 * getattr(served, "num_threads", 1)):
+            broken = BrokenService()
+
+            with pytest.raises(ResultException) as e:
+                broken.dispatch(0, c_uint32(1), c_uint32)
+
+            assert e.value.result == server.not_supported
+
+            broken.close()
+
+    assert len(caplog.records) >= 1
+
+    # Every worker is still serving
+    for i in range(8):
+        assert add(echo, i) == i + 1
+
+    echo.close()
+
+@pytest.mark.parametrize("cls", [EchoService, EchoDomain])
+def test_pointer_buffers(served, cls):
+    srv = cls()
+
+    for data in (b"abcdefgh", b"0123456789" * 20):
+        src = (c_char * len(data))(*data)
+        dst = (c_char * len(data))()
+
+        srv.dispatch(6, buffers=[(sf.Buffer(src), sf.BufferAttr.In | sf.BufferAttr.HipcPointer),
+                                 (sf.Buffer(dst), sf.BufferAttr.Out | sf.BufferAttr.HipcPointer)])
+
+        assert dst.raw == data[::-1]
+
+        # The server was handed a copy in its pointer buffer
+        assert src.raw == data
+
+    srv.close()
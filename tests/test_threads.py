@@ -0,0 +1,103 @@
+import threading
+from ctypes import *
+
+import pytest
+
+from nx import arm, sf
+from nx.sf import server
+from nx.services import ServiceManager
+
+num_threads = 4
+
+class Echo(server.Object):
+    def __init__(self, barrier):
+        self.barrier = barrier
+
+    @server.command(0)
+    def double(self, ctx):
+        value = c_uint32.from_buffer_copy(ctx.data).value
+
+        # Only answers once every thread has a request in flight
+        self.barrier.wait(5)
+
+        return c_uint32(value * 2)
+
+class EchoService(sf.Service):
+    name = "echo"
+
+def run_threads(target):
+    results = [None] * num_threads
+    errors = []
+
+    def run(i):
+        try:
+            results[i] = target(i)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert not any(thread.is_alive() for thread in threads)
+    assert not errors
+
+    return results
+
+def test_ipc_buffer_per_thread(kernel):
+    # Buffers are only compared while every thread is alive to have one
+    barrier = threading.Barrier(num_threads)
+
+    def buffers(i):
+        view = arm.ipc_buffer()
+
+        # Cached for the thread
+        assert arm.ipc_buffer() is view
+
+        view[:4] = bytes([i]) * 4
+        barrier.wait(5)
+
+        # Nothing another thread wrote shows up in this one's
+        contents = bytes(view[:4])
+        address = addressof(c_char.from_buffer(view))
+        barrier.wait(5)
+
+        return address, contents
+
+    results = run_threads(buffers)
+
+    assert len({address for address, _ in results}) == num_threads
+    assert [contents for _, contents in results] == [bytes([i]) * 4 for i in range(num_threads)]
+
+@pytest.mark.parametrize("accel", [False, True], ids=["python", "accel"])
+def test_concurrent_requests(kernel, accel, monkeypatch):
+    monkeypatch.setattr(sf.Service, "use_accel", accel)
+
+    barrier = threading.Barrier(num_threads)
+
+    manager = server.ThreadedServerManager(num_threads)
+    sm = ServiceManager()
+    manager.register_service(sm, "echo", lambda: Echo(barrier))
+
+    thread = threading.Thread(target=manager.serve, daemon=True)
+    thread.start()
+
+    def request(i):
+        srv = EchoService()
+
+        try:
+            # Each reply is read back from the thread's own message buffer
+            return srv.dispatch(0, c_uint32(i + 1), c_uint32).out.value
+        finally:
+            srv.close()
+
+    try:
+        assert run_threads(request) == [2 * (i + 1) for i in range(num_threads)]
+    finally:
+        manager.stop()
+        thread.join()
+
+        manager.close()
+        sm.close()
@@ -0,0 +1,39 @@
+import time
+
+from nx.kernel import ns_to_ticks, svc, tick, ticks, ticks_to_ns
+
+def test_ticks_increase():
+    first = ticks()
+    second = ticks()
+
+    assert second >= first
+
+    time.sleep(0.01)
+
+    assert ticks_to_ns(ticks() - first) >= 10000000
+
+def test_svc_tick_matches():
+    before = ticks()
+    system_tick = svc.get_system_tick()
+    after = ticks()
+
+    assert before <= system_tick <= after
+
+def test_conversions():
+    assert ticks_to_ns(tick.frequency) == 1000000000
+    assert ns_to_ticks(1000000000) == tick.frequency
+
+    for ns in (0, 1000, 123456789):
+        # Rounded down by at most a tick
+        assert 0 <= ns - ticks_to_ns(ns_to_ticks(ns)) <= 1000000000 // tick.frequency + 1
+
+def test_matches_monotonic():
+    start_ticks = ticks()
+    start = time.monotonic()
+
+    time.sleep(0.05)
+
+    elapsed_ticks = ticks_to_ns(ticks() - start_ticks) / 1e9
+    elapsed = time.monotonic() - start
+
+    assert abs(elapsed_ticks - elapsed) < 0.01
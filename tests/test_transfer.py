@@ -0,0 +1,189 @@
+from ctypes import *
+
+import pytest
+
+from nx import sf
+from nx.sf import server, transfer
+
+out_map_alias = sf.BufferAttr.Out | sf.BufferAttr.HipcMapAlias
+
+class Reader(server.Object):
+    @server.command(0)
+    def read(self, ctx):
+        # Fills as much of the buffer as asked for
+        count = c_uint32.from_buffer_copy(ctx.data).value
+
+        buf = ctx.recv_buffer(0)
+        buf[:count] = b"A" * count
+
+class ReaderService(sf.Service):
+    name = "reader"
+
+@pytest.fixture
+def srv(kernel, monkeypatch):
+    kernel.register_service("reader", Reader)
+    monkeypatch.setattr(ReaderService, "transfer_pool", transfer.BufferPool())
+
+    srv = ReaderService()
+
+    yield srv
+
+    srv.close()
+
+def test_acquire_aligned():
+    pool = transfer.BufferPool()
+
+    for size in (1, 0x1000, 0x1001, 0x200000):
+        buf = pool.acquire(size)
+
+        assert len(buf) >= size
+        assert addressof(buf) % transfer.page_size == 0
+
+def test_size_class():
+    pool = transfer.BufferPool()
+
+    assert pool.size_class(1) == 0x1000
+    assert pool.size_class(0x1001) == 0x2000
+    assert pool.size_class(0x100001) == 0x101000
+
+def test_reuse():
+    pool = transfer.BufferPool()
+
+    buf = pool.acquire(100)
+    address = addressof(buf)
+    del buf
+
+    assert pool.bytes_in_use == 0
+    assert pool.bytes_held == 0x1000
+
+    buf = pool.acquire(200)
+
+    assert addressof(buf) == address
+    assert pool.hits == 1 and pool.misses == 1
+
+def test_reuse_zeroed():
+    pool = transfer.BufferPool()
+
+    buf = pool.acquire(64)
+    buf[:64] = b"A" * 64
+    del buf
+
+    assert pool.acquire(64)[:64] == bytes(64)
+
+def test_max_held():
+    pool = transfer.BufferPool(max_held=0x1000)
+
+    a = pool.acquire(10)
+    b = pool.acquire(10)
+    del a, b
+
+    assert pool.bytes_held == 0x1000
+    assert pool.bytes_in_use == 0
+
+    pool.trim()
+    assert pool.bytes_held == 0
+
+def test_oversized_not_pooled():
+    pool = transfer.BufferPool()
+
+    buf = pool.acquire(0x200000)
+    del buf
+
+    assert pool.bytes_held == 0
+
+@pytest.mark.parametrize("accel", [False, True])
+def test_short_read_after_long(srv, accel, monkeypatch):
+    monkeypatch.setattr(sf.Service, "use_accel", accel)
+
+    first = srv.dispatch(0, c_uint32(64), buffers=[(64, out_map_alias)]).buffers[0]
+    assert bytes(first) == b"A" * 64
+    del first
+
+    # The same block again, of which the server only writes the start
+    second = srv.dispatch(0, c_uint32(4), buffers=[(64, out_map_alias)]).buffers[0]
+    assert bytes(second) == b"A" * 4 + bytes(60)
+    assert srv.transfer_pool.hits == 1
+
+    third = srv.dispatch(0, c_uint32(0), buffers=[(4, out_map_alias)]).buffers[0]
+    assert bytes(third) == bytes(4)
+
+def test_buffers_outlive_pool_reuse(srv):
+    keep = srv.dispatch(0, c_uint32(0x10), buffers=[(0x10000, out_map_alias)]).buffers[0]
+    other = srv.dispatch(0, c_uint32(0x10), buffers=[(0x10000, out_map_alias)]).buffers[0]
+
+    other[:] = b"y" * len(other)
+
+    assert bytes(keep) == b"A" * 0x10 + bytes(0x10000 - 0x10)
+
+def test_pool_opt_in(kernel):
+    kernel.register_service("reader", Reader)
+
+    srv = ReaderService()
+    assert srv.transfer_pool is None
+
+    used = transfer.default_pool.hits + transfer.default_pool.misses
+    srv.dispatch(0, c_uint32(4), buffers=[(0x10, out_map_alias)])
+    assert transfer.default_pool.hits + transfer.default_pool.misses == used
+
+    # Set on the instance alone
+    srv.transfer_pool = transfer.BufferPool()
+    srv.dispatch(0, c_uint32(4), buffers=[(0x10, out_map_alias)])
+
+    assert srv.transfer_pool.misses == 1
+    assert ReaderService.transfer_pool is None
+
+    srv.close()
+
+def test_pool_disabled_on_instance(srv):
+    srv.transfer_pool = None
+    srv.dispatch(0, c_uint32(4), buffers=[(0x10, out_map_alias)])
+
+    assert ReaderService.transfer_pool.hits + ReaderService.transfer_pool.misses == 0
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+def calibrate(srv, monkeypatch, pointer_cost, map_alias_cost, **kwargs):
+    """
+    Calibrates srv's policy with calls costing pointer_cost(size)
+    or map_alias_cost(size) ns, depending on how they're sent.
+    """
+
+    clock = FakeClock()
+    monkeypatch.setattr(transfer.time, "perf_counter_ns", clock)
+
+    policy = transfer.TransferPolicy()
+    srv.transfer_policy = policy
+
+    def call(size):
+        if size <= srv.server_pointer_size([], 0):
+            clock.now += pointer_cost(size)
+        else:
+            clock.now += map_alias_cost(size)
+
+    return policy, policy.calibrate(srv, 0, call, number=1, **kwargs)
+
+def test_calibrate_crossover(srv, monkeypatch):
+    policy, limit = calibrate(srv, monkeypatch, lambda size: 2 * size, lambda size: 1000 + size)
+
+    # Where 2 * size == 1000 + size, between the sizes measured
+    assert limit == 1000
+    assert policy.pointer_size(0, srv.pointer_buffer_size) == 1000
+
+def test_calibrate_whole_pointer_buffer(srv, monkeypatch):
+    srv.load_pointer_buffer_size()
+
+    _, limit = calibrate(srv, monkeypatch, lambda size: size, lambda size: 1000 + size)
+    assert limit == srv.pointer_buffer_size
+
+    _, limit = calibrate(srv, monkeypatch, lambda size: size, lambda size: 1000 + size,
+                        sizes=[0x10, 4 * srv.pointer_buffer_size])
+    assert limit == srv.pointer_buffer_size
+
+def test_calibrate_map_alias_faster(srv, monkeypatch):
+    _, limit = calibrate(srv, monkeypatch, lambda size: 1000 + size, lambda size: size)
+    assert limit == 0
@@ -0,0 +1,28 @@
+from ctypes import *
+
+from nx import util
+
+class Header(LittleEndianStructure):
+    _pack_ = 1
+    _fields_ = [
+        ("magic", c_char * 4),
+        ("value", c_uint16),
+    ]
+
+def test_buf_insert_in_place():
+    buf = memoryview(bytearray(0x10)).cast("B")
+
+    util.buf_insert(buf, 2, Header(b"SFCI", 0x1234))
+    util.buf_insert(buf, 8, (c_uint32 * 2)(1, 2))
+    util.buf_insert(buf, 0, b"ab")
+    util.buf_insert(buf, 0, None)
+
+    assert bytes(buf) == b"abSFCI\x34\x12" + bytes(c_uint32(1)) + bytes(c_uint32(2))
+
+def test_buf_insert_extends():
+    buf = bytearray(b"xy")
+
+    util.buf_insert(buf, 4, c_uint16(0x100))
+    util.buf_insert(buf, 6, bytearray(b"z"))
+
+    assert buf == b"xy\0\0\x00\x01z"